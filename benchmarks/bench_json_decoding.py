@@ -0,0 +1,120 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Compare JSON decoding of large Lando API payloads.
+
+The payloads are shaped like `GET stacks/D{id}` and `GET transplants`
+responses for a large stack with a long landing history. Run with:
+
+    python -m benchmarks.bench_json_decoding
+"""
+import json
+import timeit
+import tracemalloc
+
+from landoui.landoapi import ResponseDecoder, orjson
+
+
+def stack_payload(revisions: int) -> dict:
+    phids = [f"PHID-DREV-{i:020d}" for i in range(revisions)]
+    return {
+        "repositories": [
+            {
+                "phid": "PHID-REPO-0",
+                "landing_supported": True,
+                "url": "https://hg.mozilla.org/integration/autoland",
+                "short_name": "autoland",
+                "commit_flags": [["DONTBUILD", "Should be used only for trivial"]],
+            }
+        ],
+        "edges": [[phids[i], phids[i - 1]] for i in range(1, revisions)],
+        "landable_paths": [phids],
+        "revisions": [
+            {
+                "phid": phid,
+                "id": f"D{i}",
+                "bug_id": 1000000 + i,
+                "title": f"Bug {1000000 + i} - Revision title number {i}",
+                "url": f"https://phabricator.services.mozilla.com/D{i}",
+                "date_created": "2023-06-04T00:40:44+00:00",
+                "date_modified": "2023-06-13T15:04:33+00:00",
+                "summary": "A summary with some unicode ✓ " * 10,
+                "status": {"display": "Accepted", "value": "accepted"},
+                "repo_phid": "PHID-REPO-0",
+                "diff": {"id": i, "phid": f"PHID-DIFF-{i}"},
+                "commit_message": f"Bug {1000000 + i} - Title r=reviewer\n\n" * 5,
+                "reviewers": [
+                    {
+                        "phid": f"PHID-USER-{j}",
+                        "status": "accepted",
+                        "for_other_diff": False,
+                        "identifier": f"reviewer{j}",
+                    }
+                    for j in range(3)
+                ],
+                "is_secure": False,
+                "blocked_reason": "",
+            }
+            for i, phid in enumerate(phids)
+        ],
+    }
+
+
+def transplants_payload(transplants: int) -> list:
+    reject = "".join(f"@@ -{i},7 +{i},7 @@\n-old line\n+new line\n" for i in range(200))
+    return [
+        {
+            "id": i,
+            "status": "failed",
+            "details": {"failed_paths": [{"path": "a/b.cpp", "reject": reject}]},
+            "created_at": "2023-06-04T00:40:44.123456+00:00",
+            "updated_at": "2023-06-04T00:45:44.123456+00:00",
+            "requester_email": "user@mozilla.com",
+            "landing_path": [{"revision_id": f"D{i}", "diff_id": i}],
+        }
+        for i in range(transplants)
+    ]
+
+
+def response_json(content: bytes):
+    """Approximate `requests.Response.json()`, which decodes to `str` first."""
+    return json.loads(content.decode("utf-8"))
+
+
+def measure(decode, content: bytes, number: int) -> tuple[float, int]:
+    seconds = timeit.timeit(lambda: decode(content), number=number) / number
+
+    tracemalloc.start()
+    decode(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return seconds, peak
+
+
+def main():
+    decoders = {"Response.json()": response_json}
+    for backend in ("json", "orjson"):
+        if backend == "orjson" and orjson is None:
+            continue
+        decoders[backend] = ResponseDecoder(backend=backend).decode
+
+    payloads = {
+        "stack (500 revisions)": stack_payload(500),
+        "transplants (200 landings)": transplants_payload(200),
+    }
+
+    for payload_name, payload in payloads.items():
+        content = json.dumps(payload).encode("utf-8")
+        print(f"{payload_name}: {len(content) / 1024:.0f} KiB")
+        for decoder_name, decode in decoders.items():
+            seconds, peak = measure(decode, content, number=20)
+            print(
+                f"  {decoder_name:<16} {seconds * 1000:8.2f} ms"
+                f"  peak {peak / 1024:8.0f} KiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Compare the single pass `Linkifier` with the previous chain of `linkify_*`
+filters on long landing warnings, blockers and transplant details.
+
+Run with:
+
+    python -m benchmarks.bench_linkify
+"""
+import random
+import re
+import timeit
+
+from landoui.template_helpers import (
+    FAQ_URL,
+    Linkifier,
+    SEC_BUG_DOCS,
+)
+
+BUGZILLA_URL = "https://bugzilla.mozilla.org"
+PHABRICATOR_URL = "https://phabricator.services.mozilla.com"
+
+
+def chained_filters(text: str) -> str:
+    """The previous `linkify_*` filters, applied one after another."""
+    text = re.sub(
+        r"(?=\b)(Bug (\d+))(?=\b)",
+        r'<a href="{bmo_url}/show_bug.cgi?id=\g<2>">\g<1></a>'.format(
+            bmo_url=BUGZILLA_URL
+        ),
+        str(text),
+        flags=re.IGNORECASE,
+    )
+    text = re.sub(
+        r"(?=\b)(" + re.escape(PHABRICATOR_URL) + r"/D\d+)(?=\b)",
+        r'<a href="\g<1>">\g<1></a>',
+        str(text),
+        flags=re.IGNORECASE,
+    )
+    text = re.sub(
+        r"\b(FAQ)\b",
+        r'<a href="{faq_url}">\g<1></a>'.format(faq_url=FAQ_URL),
+        str(text),
+        flags=re.IGNORECASE,
+    )
+    return re.sub(
+        r"\b(Security Bug Approval Process)\b",
+        r'<a href="{docs_url}">\g<1></a>'.format(docs_url=SEC_BUG_DOCS),
+        str(text),
+        flags=re.IGNORECASE,
+    )
+
+
+def synthetic_text(rng: random.Random, words: int) -> str:
+    """Text resembling landing warnings and blockers, with some references."""
+    vocabulary = (
+        "the revision has open parents which must land first "
+        "this is blocked until it is accepted by a reviewer "
+        "please see the FAQ for details about landing "
+        "has a security bug and must follow the Security Bug Approval Process "
+    ).split()
+    parts = []
+    for _ in range(words):
+        roll = rng.random()
+        if roll < 0.02:
+            parts.append(f"Bug {rng.randint(1, 2000000)}")
+        elif roll < 0.04:
+            parts.append(f"{PHABRICATOR_URL}/D{rng.randint(1, 200000)}")
+        else:
+            parts.append(rng.choice(vocabulary))
+    return " ".join(parts)
+
+
+def main():
+    linkifier = Linkifier(bugzilla_url=BUGZILLA_URL, phabricator_url=PHABRICATOR_URL)
+    rng = random.Random(42)
+
+    for words in (10, 100, 1000, 10000):
+        texts = [synthetic_text(rng, words) for _ in range(20)]
+        for text in texts:
+            assert linkifier.linkify(text) == chained_filters(text)
+
+        number = max(1, 10000 // words)
+        chained = timeit.timeit(
+            lambda: [chained_filters(text) for text in texts], number=number
+        )
+        single = timeit.timeit(
+            lambda: [linkifier.linkify(text) for text in texts], number=number
+        )
+        per_text = len(texts) * number
+        print(
+            f"{words:>6} words: chained {chained / per_text * 1e6:9.1f} us"
+            f"  single pass {single / per_text * 1e6:9.1f} us"
+            f"  ({chained / single:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
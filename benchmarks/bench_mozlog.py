@@ -0,0 +1,103 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Compare the records per second formatted by `MozLogFormatter` in each of
+its modes with the previous implementation, for records shaped like the
+`request.summary` line logged for every request.
+
+Run with:
+
+    python -m benchmarks.bench_mozlog
+"""
+import json
+import logging
+import socket
+import timeit
+
+from landoui.logging import MozLogFormatter, orjson
+
+
+class PreviousMozLogFormatter(logging.Formatter):
+    """The previous `MozLogFormatter.format`, for comparison."""
+
+    BUILTIN_LOGRECORD_ATTRIBUTES = set(MozLogFormatter.BUILTIN_LOGRECORD_ATTRIBUTES)
+
+    def __init__(self, *args, mozlog_logger=None, **kwargs):
+        self.mozlog_logger = mozlog_logger or "Dockerflow"
+        self.hostname = socket.gethostname()
+        super().__init__(*args, **kwargs)
+
+    def format(self, record):
+        mozlog_record = {
+            "EnvVersion": MozLogFormatter.MOZLOG_ENVVERSION,
+            "Hostname": self.hostname,
+            "Logger": self.mozlog_logger,
+            "Type": record.name,
+            "Timestamp": int(record.created * 1e9),
+            "Severity": MozLogFormatter.PRIORITY.get(
+                record.levelname, MozLogFormatter.SL_WARNING
+            ),
+            "Pid": record.process,
+            "Fields": {
+                k: v
+                for k, v in record.__dict__.items()
+                if k not in self.BUILTIN_LOGRECORD_ATTRIBUTES
+            },
+        }
+
+        msg = record.getMessage()
+        if msg and "msg" not in mozlog_record["Fields"]:
+            mozlog_record["Fields"]["msg"] = msg
+
+        return json.dumps(mozlog_record, sort_keys=True)
+
+
+def request_summary_record() -> logging.LogRecord:
+    """A record like those logged by `request_logging_after`."""
+    return logging.getLogger("request.summary").makeRecord(
+        "request.summary",
+        logging.INFO,
+        __file__,
+        1,
+        "request summary",
+        None,
+        None,
+        extra={
+            "errno": 0,
+            "agent": "Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Firefox/115.0",
+            "lang": "en-CA,en-US;q=0.7,en;q=0.3",
+            "method": "GET",
+            "path": "/D12345/",
+            "code": 200,
+            "t": 143,
+            "uid": "ad|Mozilla-LDAP|sheriff",
+        },
+    )
+
+
+def main(number: int = 50000):
+    formatters = {"previous": PreviousMozLogFormatter(mozlog_logger="lando-ui")}
+    for encoder in ("json", "orjson"):
+        if encoder == "orjson" and orjson is None:
+            continue
+        for sort_keys in (True, False):
+            name = f"{encoder}{', sorted' if sort_keys else ''}"
+            formatters[name] = MozLogFormatter(
+                mozlog_logger="lando-ui", sort_keys=sort_keys, encoder=encoder
+            )
+
+    record = request_summary_record()
+    expected = json.loads(formatters["previous"].format(record))
+    baseline = None
+    for name, formatter in formatters.items():
+        assert json.loads(formatter.format(record)) == expected
+
+        seconds = timeit.timeit(lambda: formatter.format(record), number=number)
+        rate = number / seconds
+        baseline = baseline or rate
+        print(f"{name:<16} {rate:>12,.0f} records/s  ({rate / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Time the stack graph construction, sort and layout on synthetic stacks, and
+measure the peak memory used by each.
+
+Run with:
+
+    python -m benchmarks.bench_stack_layout
+"""
+import timeit
+import tracemalloc
+
+from landoui.stacks import (
+    graph,
+    layout_stack_graph,
+    sort_stack_topological,
+)
+
+
+def linear(size: int) -> tuple[list, list]:
+    """A single chain of revisions."""
+    return list(range(size)), [[i, i - 1] for i in range(1, size)]
+
+
+def fan_out(size: int, width: int = 8) -> tuple[list, list]:
+    """A chain where each revision fans out to `width` children which rejoin."""
+    edges = []
+    spine = 0
+    node = 1
+    while node < size:
+        branch = list(range(node, min(size, node + width)))
+        edges.extend([child, spine] for child in branch)
+        node += len(branch)
+        if node < size:
+            edges.extend([node, child] for child in branch)
+            spine = node
+            node += 1
+    return list(range(size)), edges
+
+
+def star(size: int) -> tuple[list, list]:
+    """A single revision with every other revision as a child."""
+    return list(range(size)), [[i, 0] for i in range(1, size)]
+
+
+def dict_of_sets_graph(nodes: list, edges: list) -> dict:
+    """The graph structure used before `StackGraph`, for comparison."""
+    g = {node: (node, set(), set()) for node in nodes}
+    for child, parent in edges:
+        g[parent][1].add(child)
+        g[child][2].add(parent)
+    return g
+
+
+def measure(func) -> tuple[float, int]:
+    """Return the mean time in seconds and the peak memory in bytes of `func`."""
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return timer.timeit(number) / number, peak
+
+
+def main():
+    uncached = layout_stack_graph.__wrapped__
+    shapes = {"linear": linear, "fan-out": fan_out, "star": star}
+
+    print(f"{'shape':<8} {'nodes':>6}  {'step':<10} {'time':>12} {'peak memory':>14}")
+    for shape_name, shape in shapes.items():
+        for size in (10, 100, 1000, 10000):
+            # The drawing of a star is quadratic in size by definition, as
+            # every row has a line for each pending child.
+            if shape is star and size > 1000:
+                continue
+
+            nodes, edges = shape(size)
+            g = graph(nodes, edges)
+            order = tuple(sort_stack_topological(g))
+
+            steps = {
+                "sets": lambda: dict_of_sets_graph(nodes, edges),
+                "graph": lambda: graph(nodes, edges),
+                "sort": lambda: sort_stack_topological(g),
+                "layout": lambda: uncached(g, order),
+            }
+            for step, func in steps.items():
+                seconds, peak = measure(func)
+                print(
+                    f"{shape_name:<8} {size:>6}  {step:<10} "
+                    f"{seconds * 1000:9.3f} ms {peak / 1024:11.1f} KiB"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Render the stack page for a large synthetic stack and report how often each
+template filter and global is called, and how long is spent in each.
+
+Lando API is replaced by canned responses shaped like those recorded from
+`GET stacks/D<id>` and `GET transplants`, so no services are needed.
+
+Run with:
+
+    python -m benchmarks.bench_template_filters
+"""
+import functools
+import inspect
+import json
+import os
+import tempfile
+import time
+
+from collections import defaultdict
+from unittest.mock import patch
+
+from landoui.app import create_app
+
+REVIEWER_STATUSES = ("accepted", "rejected", "added", "blocking", "resigned")
+REVISION_STATUSES = ("accepted", "needs-review", "needs-revision", "published")
+TRANSPLANT_STATUSES = ("LANDED", "FAILED", "SUBMITTED", "ABORTED")
+
+
+def revision_data(i: int) -> dict:
+    status = REVISION_STATUSES[i % len(REVISION_STATUSES)]
+    return {
+        "phid": f"PHID-DREV-{i:020d}",
+        "repo_phid": "PHID-REPO-tk2tekowvewl4wfqh24m",
+        "id": f"D{i + 1}",
+        "bug_id": 1000000 + i,
+        "title": f"Bug {1000000 + i} - Change number {i} r=reviewer{i % 7}",
+        "url": f"http://phabricator.test/D{i + 1}",
+        "date_created": "2019-06-04T00:40:44+00:00",
+        "date_modified": "2019-06-13T15:04:33+00:00",
+        "summary": f"Summary of change {i}.",
+        "commit_message": f"Bug {1000000 + i} - Change number {i}",
+        "commit_message_title": f"Bug {1000000 + i} - Change number {i}",
+        "is_secure": False,
+        "status": {"display": status.title(), "value": status, "closed": False},
+        "blocked_reason": "" if i % 3 else "Revision is not accepted, see the FAQ.",
+        "author": {"phid": "PHID-USER-author", "username": "author"},
+        "diff": {
+            "id": i + 1,
+            "phid": f"PHID-DIFF-{i:020d}",
+            "date_created": "2019-06-04T00:40:43+00:00",
+            "date_modified": "2019-06-04T00:40:44+00:00",
+            "author": {"name": "Author", "email": "author@example.test"},
+        },
+        "reviewers": [
+            {
+                "phid": f"PHID-USER-reviewer{j}",
+                "status": REVIEWER_STATUSES[(i + j) % len(REVIEWER_STATUSES)],
+                "for_other_diff": bool((i + j) % 2),
+                "full_name": f"Reviewer {j}",
+                "identifier": f"reviewer{j}",
+                "blocking_landing": not j,
+            }
+            for j in range(4)
+        ],
+    }
+
+
+def stack_data(size: int) -> dict:
+    """A stack of `size` revisions, branching every tenth revision."""
+    revisions = [revision_data(i) for i in range(size)]
+    edges = [
+        [revisions[i]["phid"], revisions[i - 1 - (i % 10 == 0)]["phid"]]
+        for i in range(1, size)
+    ]
+    return {
+        "revisions": revisions,
+        "edges": edges,
+        "landable_paths": [[revisions[0]["phid"]]],
+        "repositories": [
+            {
+                "phid": "PHID-REPO-tk2tekowvewl4wfqh24m",
+                "landing_supported": True,
+                "url": "http://hg.test",
+                "short_name": "test-repo",
+                "commit_flags": [],
+            }
+        ],
+    }
+
+
+def transplants_data(count: int) -> list:
+    return [
+        {
+            "id": i,
+            "status": TRANSPLANT_STATUSES[i % len(TRANSPLANT_STATUSES)],
+            # Landed transplants have the commit id as their details.
+            "details": (
+                f"{i:040x}"
+                if i % len(TRANSPLANT_STATUSES) == 0
+                else f"Failed to land Bug {i}, see D{i + 1} and the FAQ."
+            ),
+            "repository_url": "http://hg.test",
+            "requester_email": "author@example.test",
+            "tree": "mozilla-central",
+            "created_at": "2019-06-04T00:40:44+00:00",
+            "updated_at": f"2019-06-04T00:{i % 60:02d}:44+00:00",
+            "landing_path": [
+                {"revision_id": f"D{j + 1}", "diff_id": j + 1} for j in range(3)
+            ],
+        }
+        for i in range(count)
+    ]
+
+
+def lando_api_double(stack: dict, transplants: list):
+    def request(api, method, operation, *args, **kwargs):
+        if operation.startswith("stacks"):
+            return stack
+        elif operation == "transplants":
+            return transplants
+        elif operation == "uplift":
+            return {"repos": ["m-c"]}
+        raise RuntimeError(f"No canned response for {operation}")
+
+    return request
+
+
+def instrument(functions: dict, calls: dict, seconds: dict):
+    """Wrap each function in `functions` to count its calls and time."""
+    for name, func in list(functions.items()):
+        if not inspect.isfunction(func):
+            continue
+
+        @functools.wraps(func)
+        def wrapper(*args, _name=name, _func=func, **kwargs):
+            start = time.perf_counter()
+            try:
+                return _func(*args, **kwargs)
+            finally:
+                seconds[_name] += time.perf_counter() - start
+                calls[_name] += 1
+
+        functions[name] = wrapper
+
+
+def main(size: int = 500, transplants: int = 200, renders: int = 5):
+    for name, value in {
+        "OIDC_DOMAIN": "oidc.test",
+        "OIDC_CLIENT_ID": "client_id",
+        "OIDC_CLIENT_SECRET": "secret",
+        "LANDO_API_OIDC_IDENTIFIER": "lando-api",
+        "SENTRY_DSN": "",
+        "LOG_LEVEL": "WARNING",
+    }.items():
+        os.environ.setdefault(name, value)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json") as versionfile:
+        json.dump({"source": "", "version": "", "commit": "", "build": ""}, versionfile)
+        versionfile.flush()
+
+        app = create_app(
+            version_path=versionfile.name,
+            secret_key="benchmark",
+            session_cookie_name="lando-ui",
+            session_cookie_domain="lando-ui.test",
+            session_cookie_secure=False,
+            use_https=False,
+            enable_asset_pipeline=False,
+            lando_api_url="http://lando-api.test",
+            treestatus_url="http://treestatus.test",
+            debug=False,
+        )
+
+    calls = defaultdict(int)
+    seconds = defaultdict(float)
+    instrument(app.jinja_env.filters, calls, seconds)
+    instrument(app.jinja_env.globals, calls, seconds)
+
+    double = lando_api_double(stack_data(size), transplants_data(transplants))
+    with patch("landoui.landoapi.LandoAPI.request", new=double):
+        client = app.test_client()
+        assert client.get("/D1/").status_code == 200
+        calls.clear()
+        seconds.clear()
+
+        start = time.perf_counter()
+        for _ in range(renders):
+            assert client.get("/D1/").status_code == 200
+        elapsed = (time.perf_counter() - start) / renders
+
+    print(f"{size} revisions, {transplants} transplants: {elapsed * 1000:.1f} ms/page")
+    print(f"{'filter':<40} {'calls':>8} {'total ms':>10} {'us/call':>8}")
+    for name in sorted(calls, key=seconds.get, reverse=True):
+        count = calls[name] // renders
+        total = seconds[name] / renders
+        print(
+            f"{name:<40} {count:>8} {total * 1000:>10.2f} {total / count * 1e6:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -14,7 +14,17 @@ from flask_talisman import Talisman as BaseTalisman
 from webassets.loaders import YAMLLoader
 
 from landoui import auth, errorhandlers
+from landoui.cache import (
+    conditional_request_cache,
+    reference_data_cache,
+    treestatus_cache,
+)
+from landoui.heartbeat import HeartbeatService, heartbeat_checker
+from landoui.helpers import str2bool
+from landoui.landoapi import request_executor, response_decoder, session_pool
 from landoui.logging import log_config_change, MozLogFormatter
+from landoui.metrics import metrics
+from landoui.resilience import upstream_policies
 from landoui.sentry import initialize_sentry
 
 logger = logging.getLogger(__name__)
@@ -93,7 +103,7 @@ def create_app(
     # Set configuration
     version_info = get_app_version(version_path)
     logger.info("application version", extra=version_info)
-    initialize_sentry(version_info["version"])
+    initialize_sentry(version_info["version"], app.url_map)
 
     set_config_param(app, "LANDO_API_URL", lando_api_url)
     set_config_param(app, "TREESTATUS_URL", treestatus_url)
@@ -122,6 +132,162 @@ def create_app(
         bool(os.getenv("ENABLE_EMBEDDED_TRANSPLANT_UI")),
     )
 
+    # Independent upstream requests made by a single view are issued
+    # concurrently on a shared per-worker thread pool.
+    set_config_param(
+        app,
+        "UPSTREAM_REQUEST_WORKERS",
+        int(os.getenv("UPSTREAM_REQUEST_WORKERS", 16)),
+    )
+    request_executor.configure(max_workers=app.config["UPSTREAM_REQUEST_WORKERS"])
+
+    # Upstream HTTP connection pooling. Each uWSGI thread, and each thread of
+    # the request executor, may hold a connection to each upstream at once, so
+    # size the per-host pool to match. Connections beyond the pool size are
+    # discarded after use rather than kept alive.
+    set_config_param(
+        app,
+        "HTTP_POOL_MAXSIZE",
+        int(
+            os.getenv(
+                "HTTP_POOL_MAXSIZE",
+                app.config["UPSTREAM_REQUEST_WORKERS"]
+                + int(os.getenv("UWSGI_THREADS", 10)),
+            )
+        ),
+    )
+    set_config_param(app, "HTTP_POOL_BLOCK", str2bool(os.getenv("HTTP_POOL_BLOCK", 0)))
+    set_config_param(app, "HTTP_KEEPALIVE", str2bool(os.getenv("HTTP_KEEPALIVE", 1)))
+    set_config_param(
+        app,
+        "HTTP_POOL_IDLE_TIMEOUT",
+        float(os.getenv("HTTP_POOL_IDLE_TIMEOUT", 60)),
+    )
+    session_pool.configure(
+        pool_maxsize=app.config["HTTP_POOL_MAXSIZE"],
+        pool_block=app.config["HTTP_POOL_BLOCK"],
+        keepalive=app.config["HTTP_KEEPALIVE"],
+        idle_timeout=app.config["HTTP_POOL_IDLE_TIMEOUT"],
+    )
+
+    # Rarely changing reference data from Lando API, such as the list of
+    # uplift repositories, is cached per worker.
+    set_config_param(
+        app,
+        "REFERENCE_DATA_CACHE_TTL",
+        float(os.getenv("REFERENCE_DATA_CACHE_TTL", 600)),
+    )
+    set_config_param(
+        app,
+        "REFERENCE_DATA_CACHE_STALE_TTL",
+        float(os.getenv("REFERENCE_DATA_CACHE_STALE_TTL", 3600)),
+    )
+    reference_data_cache.configure(
+        ttl=app.config["REFERENCE_DATA_CACHE_TTL"],
+        stale_ttl=app.config["REFERENCE_DATA_CACHE_STALE_TTL"],
+    )
+
+    # The Treestatus trees and recent changes are cached per worker for a
+    # short time, and invalidated by any change made through this worker.
+    set_config_param(
+        app,
+        "TREESTATUS_CACHE_TTL",
+        float(os.getenv("TREESTATUS_CACHE_TTL", 15)),
+    )
+    treestatus_cache.configure(ttl=app.config["TREESTATUS_CACHE_TTL"], stale_ttl=0.0)
+
+    # The number of log entries shown on each page of a tree's log.
+    set_config_param(
+        app,
+        "TREESTATUS_LOG_PAGE_SIZE",
+        int(os.getenv("TREESTATUS_LOG_PAGE_SIZE", 50)),
+    )
+
+    # Upstream responses with validators are revalidated with conditional
+    # requests, keeping at most this many bytes of response bodies per worker.
+    set_config_param(
+        app,
+        "CONDITIONAL_CACHE_MAX_BYTES",
+        int(os.getenv("CONDITIONAL_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+    )
+    conditional_request_cache.configure(
+        max_bytes=app.config["CONDITIONAL_CACHE_MAX_BYTES"]
+    )
+
+    # Upstream timeouts adapt to observed latency within these bounds, and
+    # requests fail fast while an upstream is failing.
+    for key, default in (
+        ("UPSTREAM_TIMEOUT_INITIAL", 10),
+        ("UPSTREAM_TIMEOUT_MIN", 2),
+        ("UPSTREAM_TIMEOUT_MAX", 30),
+        ("UPSTREAM_CONNECT_TIMEOUT", 3.05),
+        ("CIRCUIT_BREAKER_RESET_TIMEOUT", 30),
+    ):
+        set_config_param(app, key, float(os.getenv(key, default)))
+    set_config_param(
+        app,
+        "CIRCUIT_BREAKER_FAILURE_THRESHOLD",
+        int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", 5)),
+    )
+    # Idempotent requests which fail due to connection errors are retried,
+    # within an overall time budget for each page render.
+    set_config_param(
+        app, "UPSTREAM_RETRY_BUDGET", float(os.getenv("UPSTREAM_RETRY_BUDGET", 5))
+    )
+    for service in upstream_policies.SERVICES:
+        key = f"{service.upper()}_RETRY_ATTEMPTS"
+        set_config_param(app, key, int(os.getenv(key, 3)))
+    upstream_policies.configure(
+        timeout_initial=app.config["UPSTREAM_TIMEOUT_INITIAL"],
+        timeout_min=app.config["UPSTREAM_TIMEOUT_MIN"],
+        timeout_max=app.config["UPSTREAM_TIMEOUT_MAX"],
+        connect_timeout=app.config["UPSTREAM_CONNECT_TIMEOUT"],
+        failure_threshold=app.config["CIRCUIT_BREAKER_FAILURE_THRESHOLD"],
+        reset_timeout=app.config["CIRCUIT_BREAKER_RESET_TIMEOUT"],
+        retry_attempts={
+            service: app.config[f"{service.upper()}_RETRY_ATTEMPTS"]
+            for service in upstream_policies.SERVICES
+        },
+    )
+
+    # Metrics are kept per worker, and shared between the workers through
+    # snapshots written to this directory if it is set.
+    set_config_param(app, "METRICS_DIR", os.getenv("METRICS_DIR"))
+    set_config_param(
+        app, "METRICS_FLUSH_INTERVAL", float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+    )
+    metrics.configure(
+        directory=app.config["METRICS_DIR"],
+        flush_interval=app.config["METRICS_FLUSH_INTERVAL"],
+    )
+
+    # Upstream services are checked in the background for the heartbeat.
+    # Treestatus is only needed for the Treestatus pages, so it does not
+    # make the heartbeat fail.
+    set_config_param(
+        app, "HEARTBEAT_INTERVAL", float(os.getenv("HEARTBEAT_INTERVAL", 30))
+    )
+    set_config_param(app, "HEARTBEAT_TIMEOUT", float(os.getenv("HEARTBEAT_TIMEOUT", 5)))
+    heartbeat_services = {
+        "lando_api": HeartbeatService(lando_api_url + "/__lbheartbeat__"),
+    }
+    if treestatus_url:
+        heartbeat_services["treestatus"] = HeartbeatService(
+            treestatus_url + "/__lbheartbeat__", critical=False
+        )
+    heartbeat_checker.configure(
+        services=heartbeat_services,
+        interval=app.config["HEARTBEAT_INTERVAL"],
+        timeout=app.config["HEARTBEAT_TIMEOUT"],
+    )
+    # uWSGI creates the app in each worker (UWSGI_LAZY_APPS), so checks start
+    # as each worker does rather than on its first health probe.
+    heartbeat_checker.start()
+
+    set_config_param(app, "JSON_DECODER", os.getenv("JSON_DECODER", "auto"))
+    response_decoder.configure(backend=app.config["JSON_DECODER"])
+    log_config_change("JSON_DECODER_BACKEND", response_decoder.backend)
+
     Talisman(app, content_security_policy=csp, force_https=use_https)
 
     # Authentication
@@ -165,6 +331,11 @@ def create_app(
 def initialize_logging():
     """Initialize application-wide logging."""
     level = os.environ.get("LOG_LEVEL", "INFO")
+    # Sorting keys makes the output easier to read, but slows down formatting
+    # of every request summary, so it is only enabled when asked for.
+    sort_keys = str2bool(os.environ.get("LOG_SORT_KEYS", 0))
+    encoder = os.environ.get("LOG_JSON_ENCODER", "auto")
+    queue_size = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
     logging.config.dictConfig(
         {
             "version": 1,
@@ -172,12 +343,15 @@ def initialize_logging():
                 "mozlog": {
                     "()": MozLogFormatter,
                     "mozlog_logger": "lando-ui",
+                    "sort_keys": sort_keys,
+                    "encoder": encoder,
                 },
             },
             "handlers": {
                 "console": {
-                    "class": "logging.StreamHandler",
+                    "class": "landoui.logging.AsyncStreamHandler",
                     "formatter": "mozlog",
+                    "queue_size": queue_size,
                 },
                 "null": {
                     "class": "logging.NullHandler",
@@ -203,7 +377,15 @@ def initialize_logging():
             "disable_existing_loggers": True,
         }
     )
-    logger.info("logging configured", extra={"LOG_LEVEL": level})
+    logger.info(
+        "logging configured",
+        extra={
+            "LOG_LEVEL": level,
+            "LOG_SORT_KEYS": sort_keys,
+            "LOG_JSON_ENCODER": encoder,
+            "LOG_QUEUE_SIZE": queue_size,
+        },
+    )
 
 
 def _lookup_service_url(lando_api_url: str, service_name: str) -> str:
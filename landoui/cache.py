@@ -0,0 +1,379 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+from dataclasses import (
+    dataclass,
+    field,
+)
+from typing import (
+    Any,
+    Callable,
+    Hashable,
+    Optional,
+)
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    fetched_at: float
+
+
+@dataclass
+class InFlightFetch:
+    """A fetch of a cache key which other threads can wait on."""
+
+    generation: int
+    done: threading.Event = field(default_factory=threading.Event)
+    value: Any = None
+    error: Optional[BaseException] = None
+
+
+class TTLCache:
+    """A thread-safe, per-worker cache for rarely changing upstream data.
+
+    Values are considered fresh for `ttl` seconds. For a further `stale_ttl`
+    seconds the stale value is still returned while a single background
+    refresh fetches a new one. Concurrent misses for the same key are
+    de-duplicated, so only one thread fetches while the others wait for its
+    result.
+
+    Values are shared between threads and must not be mutated by callers.
+    """
+
+    def __init__(self, name: str, *, ttl: float = 300.0, stale_ttl: float = 0.0):
+        self.name = name
+        self._lock = threading.Lock()
+        self._entries: dict[Hashable, CacheEntry] = {}
+        self._in_flight: dict[Hashable, InFlightFetch] = {}
+        self._generation = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.configure(ttl=ttl, stale_ttl=stale_ttl)
+
+    def configure(self, *, ttl: float, stale_ttl: float):
+        """Set the cache lifetimes, discarding any cached values."""
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.invalidate()
+
+    def get(self, key: Hashable, fetch: Callable[[], Any]) -> Any:
+        """Return the value for `key`, calling `fetch` to load it if needed.
+
+        Exceptions raised by `fetch` are propagated to every caller waiting
+        on that fetch, and nothing is cached.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            age = now - entry.fetched_at if entry is not None else None
+
+            if age is not None and age < self.ttl:
+                self.hits += 1
+                return entry.value
+
+            flight = self._in_flight.get(key)
+
+            if age is not None and age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                if flight is None:
+                    flight = self._start_fetch(key)
+                    threading.Thread(
+                        target=self._fetch,
+                        args=(key, fetch, flight),
+                        name=f"{self.name}-refresh",
+                        daemon=True,
+                    ).start()
+                return entry.value
+
+            self.misses += 1
+            leader = flight is None
+            if leader:
+                flight = self._start_fetch(key)
+
+        if leader:
+            self._fetch(key, fetch, flight)
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+
+        return flight.value
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Discard the cached value for `key`, or every value if `key` is `None`.
+
+        Fetches which are in progress when the cache is invalidated will still
+        return their result to waiting callers, but it will not be cached.
+        """
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+                self._in_flight.clear()
+            else:
+                self._entries.pop(key, None)
+                self._in_flight.pop(key, None)
+
+    def set(self, key: Hashable, value: Any):
+        """Cache `value` for `key`, as if it had just been fetched.
+
+        This is used when a write is known to have changed the upstream data
+        in a way which can be applied locally. Fetches which are in progress
+        will not overwrite it.
+        """
+        with self._lock:
+            self._generation += 1
+            self._in_flight.pop(key, None)
+            self._entries[key] = CacheEntry(value=value, fetched_at=time.monotonic())
+
+    def age(self, key: Hashable) -> Optional[float]:
+        """Return the age in seconds of the cached value for `key`, if any."""
+        with self._lock:
+            entry = self._entries.get(key)
+
+        return time.monotonic() - entry.fetched_at if entry is not None else None
+
+    def stats(self) -> dict[str, float]:
+        """Return the hit and miss counters for this cache.
+
+        Along with the counters, `hit_rate` is the fraction of lookups served
+        from the cache, fresh or stale, and `max_age` is the age in seconds of
+        the oldest cached value.
+        """
+        now = time.monotonic()
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            oldest = min(
+                (entry.fetched_at for entry in self._entries.values()), default=now
+            )
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+                "max_age": now - oldest,
+            }
+
+    def _start_fetch(self, key: Hashable) -> InFlightFetch:
+        flight = InFlightFetch(generation=self._generation)
+        self._in_flight[key] = flight
+        return flight
+
+    def _fetch(self, key: Hashable, fetch: Callable[[], Any], flight: InFlightFetch):
+        try:
+            flight.value = fetch()
+        except Exception as exc:
+            logger.debug(
+                "cache fetch failed",
+                extra={"cache": self.name, "error": repr(exc)},
+            )
+            flight.error = exc
+
+        with self._lock:
+            if self._in_flight.get(key) is flight:
+                del self._in_flight[key]
+
+            if flight.error is None and flight.generation == self._generation:
+                self._entries[key] = CacheEntry(
+                    value=flight.value, fetched_at=time.monotonic()
+                )
+
+        flight.done.set()
+
+
+@dataclass
+class ConditionalResponse:
+    """A response body along with the validators needed to revalidate it."""
+
+    body: bytes
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    def conditional_headers(self) -> dict[str, str]:
+        """Return the headers for a conditional request for this response."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ConditionalRequestCache:
+    """A thread-safe LRU cache of responses which carry validators.
+
+    Responses with an `ETag` or `Last-Modified` header are kept so that later
+    requests for the same resource can be sent as conditional requests, and a
+    `304 Not Modified` response can be answered from the cached body. The raw
+    response body is stored rather than the decoded data, so callers always
+    receive their own copy which they are free to modify.
+
+    The cache is bounded by the total size of the stored bodies, evicting the
+    least recently used responses first.
+    """
+
+    def __init__(self, *, max_bytes: int = 32 * 1024 * 1024):
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, ConditionalResponse] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.configure(max_bytes=max_bytes)
+
+    def configure(self, *, max_bytes: int):
+        """Set the maximum cache size, discarding any cached responses."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._entries.clear()
+            self.size = 0
+
+    def get(self, key: Hashable) -> Optional[ConditionalResponse]:
+        """Return the cached response for `key`, marking it as recently used.
+
+        A lookup which finds nothing is counted as a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+            return entry
+
+    def store(
+        self,
+        key: Hashable,
+        body: bytes,
+        *,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ):
+        """Store a response body, evicting old responses to stay within bounds.
+
+        Responses without validators, or which are larger than the entire
+        cache, are not stored.
+        """
+        with self._lock:
+            self._discard(key)
+
+            if not (etag or last_modified) or len(body) > self.max_bytes:
+                return
+
+            self._entries[key] = ConditionalResponse(
+                body=body, etag=etag, last_modified=last_modified
+            )
+            self.size += len(body)
+
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def record_hit(self):
+        """Record that a cached response was used for a `304 Not Modified`."""
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self):
+        """Record that a cached response had changed and was not used."""
+        with self._lock:
+            self.misses += 1
+
+    def stats(self) -> dict[str, int]:
+        """Return the hit and miss counters for this cache."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "bytes": self.size,
+            }
+
+    def _discard(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry.body)
+
+
+# Upstream responses which can be revalidated with conditional requests.
+conditional_request_cache = ConditionalRequestCache()
+
+
+# Reference data from Lando API which changes rarely, such as the list of
+# uplift repositories.
+reference_data_cache = TTLCache("reference-data", ttl=600.0, stale_ttl=3600.0)
+
+
+# The trees and recent changes from Treestatus. Writes made through this
+# worker invalidate it, so the TTL only bounds how long writes made elsewhere
+# take to be seen.
+treestatus_cache = TTLCache("treestatus", ttl=15.0)
+
+
+class RequestMemo:
+    """Memoized values for the duration of a single request.
+
+    A fresh memo is created for each request (see
+    `landoui.helpers.get_request_memo`) so values are never shared between
+    requests or users. It is thread-safe so it can be used by upstream
+    requests issued concurrently while handling the request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: dict[Hashable, Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the memoized value for `key`, or `default` if there isn't one."""
+        with self._lock:
+            if key not in self._values:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            return self._values[key]
+
+    def set(self, key: Hashable, value: Any):
+        """Memoize `value` for `key`."""
+        with self._lock:
+            self._values[key] = value
+
+    def memoize(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the memoized value for `key`, calling `compute` if needed."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def discard(self, predicate: Callable[[Hashable], bool]):
+        """Discard memoized values whose key matches `predicate`."""
+        with self._lock:
+            for key in [key for key in self._values if predicate(key)]:
+                del self._values[key]
+
+    def describe(self) -> dict[str, Any]:
+        """Return a summary of the memo contents, for debugging."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "keys": [" ".join(map(str, key)) for key in self._values],
+            }
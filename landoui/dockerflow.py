@@ -4,8 +4,19 @@
 import logging
 import time
 
-import requests
-from flask import Blueprint, current_app, g, jsonify, request
+from flask import (
+    Blueprint,
+    before_render_template,
+    current_app,
+    g,
+    jsonify,
+    request,
+    template_rendered,
+)
+
+from landoui.heartbeat import heartbeat_checker
+from landoui.helpers import get_request_timeline
+from landoui.metrics import labels, metrics
 
 logger = logging.getLogger(__name__)
 request_logger = logging.getLogger("request.summary")
@@ -22,9 +33,39 @@ def disable_caching(response):
     return response
 
 
+def template_render_started(sender, template, context, **extra):
+    g.setdefault("_render_starts", []).append(get_request_timeline().now())
+
+
+def template_render_finished(sender, template, context, **extra):
+    starts = g.get("_render_starts")
+    if not starts:
+        return
+
+    timeline = get_request_timeline()
+    start = starts.pop()
+    timeline.record("render", template.name or "", start, timeline.now() - start)
+
+
+@dockerflow.record_once
+def connect_template_timing(state):
+    """Record the time spent rendering templates on the request timeline."""
+    before_render_template.connect(template_render_started, state.app)
+    template_rendered.connect(template_render_finished, state.app)
+
+
 @dockerflow.before_app_request
 def request_logging_before():
     g._request_start_timestamp = time.time()
+    metrics.add("lando_ui_requests_in_flight", (), 1)
+    g._request_in_flight = True
+
+
+@dockerflow.teardown_app_request
+def request_metrics_teardown(exc):
+    # Teardown runs even if the request failed before a response was made.
+    if g.pop("_request_in_flight", False):
+        metrics.add("lando_ui_requests_in_flight", (), -1)
 
 
 @dockerflow.after_app_request
@@ -41,6 +82,27 @@ def request_logging_after(response):
     start = g.get("_request_start_timestamp", None)
     if start is not None:
         summary["t"] = int(1000 * (time.time() - start))
+        metrics.observe(
+            "lando_ui_request_duration_seconds",
+            labels(
+                endpoint=request.endpoint or "none",
+                method=request.method,
+                status=response.status_code,
+            ),
+            time.time() - start,
+        )
+
+    # Break the time down by upstream service and phase of rendering.
+    if "_request_timeline" in g:
+        summary["timing"] = g._request_timeline.totals()
+        response.headers["Server-Timing"] = g._request_timeline.server_timing()
+
+    # Show what was memoized while handling the request when debugging.
+    if current_app.debug and "_request_memo" in g:
+        summary["memo"] = g._request_memo.describe()
+
+    if current_app.debug and "_request_timeline" in g:
+        summary["spans"] = g._request_timeline.describe()
 
     request_logger.info("request summary", extra=summary)
 
@@ -54,29 +116,31 @@ def heartbeat():
     This should check all the services that lando-ui depends on
     and return a 200 iff those services and the app itself are
     performing normally. Return a 5XX if something goes wrong.
+
+    The services are checked in the background, so this returns the latest
+    results along with how long each check took and how long ago it was.
+    Services which have not been checked yet, because the worker has just
+    started, are reported as pending and do not make this fail.
     """
-    try:
-        response = requests.get(
-            current_app.config["LANDO_API_URL"] + "/__lbheartbeat__"
-        )
-        response.raise_for_status()
-        healthy = True
-    except (requests.HTTPError, requests.ConnectionError) as exc:
-        logger.warning(
-            "unhealthy: problem with backing service",
-            extra={
-                "service_name": "lando_api",
-                "errors": ["requests.RequestException: {!s}".format(exc)],
-            },
-        )
-        healthy = False
+    statuses = heartbeat_checker.statuses()
+    healthy = heartbeat_checker.healthy(statuses)
+    now = time.monotonic()
 
     return (
         jsonify(
             {
                 "healthy": healthy,
-                "services": {
-                    "lando_api": healthy,
+                "services": {name: status.healthy for name, status in statuses.items()},
+                "checks": {
+                    name: {
+                        "healthy": status.healthy,
+                        "pending": status.pending,
+                        "critical": heartbeat_checker.services[name].critical,
+                        "latency_ms": round(status.latency * 1000, 1),
+                        "age_seconds": round(now - status.checked_at, 1),
+                        "error": status.error,
+                    }
+                    for name, status in statuses.items()
                 },
             }
         ),
@@ -94,6 +158,20 @@ def lbheartbeat():
     return "", 200
 
 
+@dockerflow.route("/__metrics__", endpoint="metrics")
+def metrics_endpoint():
+    """Respond with request, upstream, cache and circuit breaker metrics.
+
+    The metrics are in the Prometheus text format, and cover every uWSGI
+    worker when `METRICS_DIR` is set.
+    """
+    return (
+        metrics.render(),
+        200,
+        {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
 @dockerflow.route("/__version__")
 def version():
     """Respond with version information as defined in the app config."""
@@ -0,0 +1,180 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+
+from landoui.threads import BackgroundThread
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class HeartbeatService:
+    """An upstream service checked by the heartbeat.
+
+    Only `critical` services make lando-ui unhealthy when they fail.
+    """
+
+    url: str
+    critical: bool = True
+
+
+@dataclass(frozen=True)
+class ServiceStatus:
+    """The result of the latest check of a service.
+
+    A `pending` status means the service has not been checked yet.
+    """
+
+    healthy: bool
+    latency: float
+    checked_at: float
+    error: Optional[str] = None
+    pending: bool = False
+
+
+class HeartbeatChecker:
+    """Check upstream services in the background for the heartbeat.
+
+    Each service is checked every `interval` seconds from a background
+    thread, with requests which time out after `timeout` seconds, so that
+    frequent health probes neither add load to the upstreams nor wait on
+    them. Services are reported as pending until their first check has
+    completed. Results which are older than `max_age` seconds, because the
+    checker has fallen behind or never finished its first check, are
+    reported as unhealthy.
+
+    The background thread is started by `start`, which is called when the
+    app is created in each uWSGI worker. If the app was created before the
+    worker was forked, it is started by the first call to `statuses`
+    instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._checker = BackgroundThread(self._run, "heartbeat")
+        self.configure(services={})
+
+    def configure(
+        self,
+        *,
+        services: dict[str, HeartbeatService],
+        interval: float = 30.0,
+        timeout: float = 5.0,
+    ):
+        """Set the services to check, discarding any previous results."""
+        with self._lock:
+            self.services = services
+            self.interval = interval
+            self.timeout = timeout
+            self.max_age = 3 * interval + 2 * timeout
+            self._statuses: dict[str, ServiceStatus] = {}
+            self._pending_since = time.monotonic()
+
+    def statuses(self) -> dict[str, ServiceStatus]:
+        """Return the latest status of each service, without waiting."""
+        self.start()
+        with self._lock:
+            statuses = dict(self._statuses)
+            pending_since = self._pending_since
+
+        now = time.monotonic()
+        for name in self.services:
+            status = statuses.get(name)
+            if status is None:
+                status = ServiceStatus(
+                    healthy=False, latency=0.0, checked_at=pending_since, pending=True
+                )
+
+            if (status.healthy or status.pending) and (
+                now - status.checked_at > self.max_age
+            ):
+                status = ServiceStatus(
+                    healthy=False,
+                    latency=status.latency,
+                    checked_at=status.checked_at,
+                    error="Heartbeat check is out of date",
+                )
+
+            statuses[name] = status
+
+        return statuses
+
+    def healthy(self, statuses: dict[str, ServiceStatus]) -> bool:
+        """Return `True` if every critical service in `statuses` is healthy.
+
+        Services which are still pending do not make the heartbeat fail, so
+        that newly started workers are not reported as unhealthy.
+        """
+        return all(
+            status.healthy or status.pending
+            for name, status in statuses.items()
+            if self.services[name].critical
+        )
+
+    def check_all(self):
+        """Check every service, one at a time."""
+        # Concurrent callers wait for the check in progress, rather than
+        # sending their own requests.
+        with self._check_lock:
+            for name, service in list(self.services.items()):
+                status = self.check(name, service)
+                with self._lock:
+                    if self.services.get(name) is service:
+                        self._statuses[name] = status
+
+    def check(self, name: str, service: HeartbeatService) -> ServiceStatus:
+        """Check a single service."""
+        start = time.monotonic()
+        try:
+            response = requests.get(service.url, timeout=self.timeout)
+            response.raise_for_status()
+        except Exception as exc:
+            # Any failure to get a successful response makes the service
+            # unhealthy, rather than failing the heartbeat itself.
+            error = "{}: {!s}".format(type(exc).__name__, exc)
+            logger.warning(
+                "unhealthy: problem with backing service",
+                extra={"service_name": name, "errors": [error]},
+            )
+        else:
+            error = None
+
+        now = time.monotonic()
+        return ServiceStatus(
+            healthy=error is None, latency=now - start, checked_at=now, error=error
+        )
+
+    def start(self):
+        """Start checking services in the background, if not already started."""
+        if self._checker.ensure_started():
+            with self._lock:
+                self._pending_since = time.monotonic()
+
+    def stop(self):
+        """Stop checking services in the background."""
+        self._checker.stop()
+
+    def _run(self):
+        while True:
+            try:
+                self.check_all()
+            except Exception:
+                logger.exception("heartbeat check failed")
+
+            if not self._checker.sleep(self.interval):
+                return
+
+
+heartbeat_checker = HeartbeatChecker()
@@ -6,7 +6,10 @@ from typing import (
     Optional,
 )
 
-from flask import request, session
+from flask import g, request, session
+
+from landoui.cache import RequestMemo
+from landoui.timing import RequestTimeline
 
 
 def is_user_authenticated() -> bool:
@@ -51,3 +54,19 @@ def get_phabricator_api_token() -> Optional[str]:
         return request.cookies["phabricator-api-token"]
 
     return None
+
+
+def get_request_memo() -> RequestMemo:
+    """Return the memo for the current request, creating it if needed."""
+    if "_request_memo" not in g:
+        g._request_memo = RequestMemo()
+
+    return g._request_memo
+
+
+def get_request_timeline() -> RequestTimeline:
+    """Return the timeline for the current request, creating it if needed."""
+    if "_request_timeline" not in g:
+        g._request_timeline = RequestTimeline()
+
+    return g._request_timeline
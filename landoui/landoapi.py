@@ -4,24 +4,318 @@
 
 from __future__ import annotations
 
+import hashlib
+import json
 import logging
+import socket
+import threading
+import time
+
 import requests
 
-from json.decoder import JSONDecodeError
+from contextlib import (
+    contextmanager,
+    nullcontext,
+)
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    wait,
+)
+from http.cookiejar import DefaultCookiePolicy
 from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Hashable,
+    Iterator,
     Optional,
 )
 
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
 from flask import (
     current_app,
+    g,
     session,
 )
 
-from landoui.helpers import get_phabricator_api_token
+from landoui.cache import (
+    ConditionalRequestCache,
+    RequestMemo,
+    conditional_request_cache,
+)
+from landoui.helpers import (
+    get_phabricator_api_token,
+    get_request_memo,
+    get_request_timeline,
+)
+from landoui.metrics import (
+    labels,
+    metrics,
+    path_template,
+)
+from landoui.resilience import (
+    UpstreamPolicy,
+    upstream_policies,
+)
+from landoui.timing import RequestTimeline
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
 
+class SessionPool:
+    """A process-wide, thread-safe pool of `requests.Session` objects.
+
+    Sessions are keyed by the base URL of the service they talk to, so every
+    `API` instance for the same service shares the same connection pool and
+    keep-alive connections are reused across page views instead of paying
+    for a new TCP and TLS handshake on each request.
+
+    Sessions which have not been used for `idle_timeout` seconds since their
+    last request finished are closed and discarded, so a quiet worker does
+    not hold on to sockets the upstream load balancer has likely already
+    dropped. Sessions with requests in flight are never closed.
+    """
+
+    def __init__(
+        self,
+        *,
+        pool_maxsize: int = 10,
+        pool_block: bool = False,
+        keepalive: bool = True,
+        idle_timeout: float = 60.0,
+    ):
+        self._lock = threading.Lock()
+        self._sessions: dict[str, requests.Session] = {}
+        self._last_used: dict[str, float] = {}
+        self._in_use: dict[requests.Session, int] = {}
+        self.configure(
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            keepalive=keepalive,
+            idle_timeout=idle_timeout,
+        )
+
+    def configure(
+        self,
+        *,
+        pool_maxsize: int,
+        pool_block: bool,
+        keepalive: bool,
+        idle_timeout: float,
+    ):
+        """Set the pool parameters, discarding any existing sessions."""
+        with self._lock:
+            self.pool_maxsize = pool_maxsize
+            self.pool_block = pool_block
+            self.keepalive = keepalive
+            self.idle_timeout = idle_timeout
+            self._close_all()
+
+    def get(self, url: str) -> requests.Session:
+        """Return the shared session for the service at `url`."""
+        now = time.monotonic()
+        with self._lock:
+            self._reap_idle(now)
+
+            session = self._sessions.get(url)
+            if session is None:
+                session = self._sessions[url] = self._create_session()
+
+            self._last_used[url] = now
+            return session
+
+    @contextmanager
+    def in_use(self, session: requests.Session) -> Iterator[None]:
+        """Mark `session` as in use for the body of the `with` block.
+
+        The session will not be closed as idle while it is in use, and its
+        idle time starts again when the block exits.
+        """
+        with self._lock:
+            self._in_use[session] = self._in_use.get(session, 0) + 1
+
+        try:
+            yield
+        finally:
+            now = time.monotonic()
+            with self._lock:
+                count = self._in_use.pop(session) - 1
+                if count:
+                    self._in_use[session] = count
+
+                for url, pooled_session in self._sessions.items():
+                    if pooled_session is session:
+                        self._last_used[url] = now
+
+    def clear(self):
+        """Close and discard all pooled sessions."""
+        with self._lock:
+            self._close_all()
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+
+        # Pooled sessions are shared between users, so never persist cookies
+        # set by an upstream response.
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        socket_options = list(HTTPConnection.default_socket_options)
+        if self.keepalive:
+            socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+
+        adapter = PooledHTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+            socket_options=socket_options,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _reap_idle(self, now: float):
+        # Called with the lock held.
+        idle = [
+            url
+            for url, last_used in self._last_used.items()
+            if now - last_used > self.idle_timeout
+            and self._sessions[url] not in self._in_use
+        ]
+        for url in idle:
+            logger.debug("closing idle connections", extra={"url": url})
+            del self._last_used[url]
+            self._sessions.pop(url).close()
+
+    def _close_all(self):
+        for pooled_session in self._sessions.values():
+            pooled_session.close()
+
+        self._sessions.clear()
+        self._last_used.clear()
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """An `HTTPAdapter` which passes custom socket options to its pools."""
+
+    def __init__(self, *args, socket_options: Optional[list] = None, **kwargs):
+        self.socket_options = socket_options
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.socket_options is not None:
+            kwargs["socket_options"] = self.socket_options
+
+        super().init_poolmanager(*args, **kwargs)
+
+
+session_pool = SessionPool()
+
+
+class RequestExecutor:
+    """Run independent upstream requests concurrently.
+
+    Views which need several pieces of data that do not depend on each other
+    can pass the calls to `gather` to have them run on a shared thread pool,
+    so the total latency is close to that of the slowest call rather than the
+    sum of all of them.
+    """
+
+    def __init__(self, *, max_workers: int = 16):
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.max_workers = max_workers
+
+    def configure(self, *, max_workers: int):
+        """Set the size of the thread pool, shutting down the current one."""
+        with self._lock:
+            self.max_workers = max_workers
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def gather(self, *calls: Callable[[], Any]) -> list:
+        """Run each of `calls` concurrently and return their results in order.
+
+        Exceptions raised by a call are re-raised unchanged once every call has
+        finished. If more than one call fails, the exception from the earliest
+        call in `calls` is raised, matching what running them one after the
+        other would have done.
+        """
+        if len(calls) < 2 or self.max_workers < 1:
+            return [call() for call in calls]
+
+        executor = self._get_executor()
+        futures = [executor.submit(call) for call in calls]
+        wait(futures)
+        return [future.result() for future in futures]
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # The pool is created lazily so that it is started in the uWSGI
+        # worker rather than in the master process.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="landoapi"
+                )
+
+            return self._executor
+
+
+request_executor = RequestExecutor()
+
+
+class ResponseDecoder:
+    """Decode JSON response bodies with a configurable backend.
+
+    Bodies are decoded directly from the response bytes. This skips the
+    encoding detection and intermediate `str` which `Response.json()` builds,
+    and with the `orjson` backend no `str` copy of the body is made at all,
+    which matters for large stack and transplant payloads.
+
+    Backends:
+        json: The standard library `json` module.
+        orjson: The C-backed `orjson` library, if it is installed.
+        auto: `orjson` if it is installed, otherwise `json`.
+    """
+
+    BACKENDS = ("auto", "json", "orjson")
+
+    def __init__(self, *, backend: str = "auto"):
+        self.configure(backend=backend)
+
+    def configure(self, *, backend: str):
+        """Select the decoding backend."""
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown JSON decoder backend: {backend}")
+
+        if backend == "orjson" and orjson is None:
+            raise ValueError("The orjson JSON decoder backend is not installed")
+
+        if backend == "auto":
+            backend = "json" if orjson is None else "orjson"
+
+        self.backend = backend
+        self._loads = orjson.loads if backend == "orjson" else json.loads
+
+    def decode(self, content: bytes) -> dict | list:
+        """Decode a JSON response body.
+
+        Raises:
+            ValueError: If the body is not valid JSON.
+        """
+        return self._loads(content)
+
+
+response_decoder = ResponseDecoder()
+
+
 class API:
     """Common components of a Lando-based API."""
 
@@ -32,22 +326,53 @@ class API:
         phabricator_api_token: Optional[str] = None,
         auth0_access_token: Optional[str] = None,
         session: Optional[requests.Session] = None,
+        conditional_cache: Optional[ConditionalRequestCache] = None,
+        policy: Optional[UpstreamPolicy] = None,
+        deadline: Optional[float] = None,
+        memo: Optional[RequestMemo] = None,
+        timeline: Optional[RequestTimeline] = None,
     ):
         self.url = url + "/" if url[-1] == "/" else url + "/"
         self.phabricator_api_token = phabricator_api_token
         self.auth0_access_token = auth0_access_token
         self.session = session or self.create_session()
+        self.conditional_cache = conditional_cache
+        self.policy = policy
+        self.deadline = deadline
+        self.memo = memo
+        self.timeline = timeline
 
     @property
     def service_name(self):
         raise NotImplementedError
 
+    def shared_client(self) -> API:
+        """Return a client for fetching data which is shared between users.
+
+        The client sends no credentials and is not bound to the current
+        request, so it can be used by background refreshes of shared caches
+        after the request which started them has finished.
+        """
+        return type(self)(
+            self.url.rstrip("/"),
+            session=self.session,
+            conditional_cache=self.conditional_cache,
+            policy=self.policy,
+        )
+
     @staticmethod
     def create_session() -> requests.Session:
         return requests.Session()
 
     def request(
-        self, method: str, url_path: str, *, require_auth0: bool = False, **kwargs
+        self,
+        method: str,
+        url_path: str,
+        *,
+        require_auth0: bool = False,
+        idempotent: Optional[bool] = None,
+        url_template: Optional[str] = None,
+        **kwargs,
     ) -> dict | list:
         """Return the response of a request to Lando API.
 
@@ -55,6 +380,11 @@ class API:
             method: HTTP method to use for request.
             url_path: Path to be appended to api url for request.
             require_auth0: Should an auth0 token be required and sent.
+            idempotent: Whether the request is safe to retry. Defaults to
+                `True` for read-only methods such as GET.
+            url_template: `url_path` with any user supplied values replaced
+                by placeholders, such as `trees/{tree}`, used to label the
+                request's metrics. Defaults to `url_path` with numbers replaced.
             **kwargs: All other kwargs passed to underlying requests.
 
         Returns:
@@ -67,6 +397,8 @@ class API:
                 If the API returns an error response.
             LandoAPICommunicationException:
                 If there is an error communicating with the API.
+            LandoAPICircuitOpenException:
+                If the API is unhealthy and requests are not being sent.
         """
         headers = {
             "Content-Type": "application/json",
@@ -82,25 +414,85 @@ class API:
         headers.update(kwargs.get("headers", {}))
         kwargs["headers"] = headers
 
-        try:
-            response = self.session.request(method, self.url + url_path, **kwargs)
-
-            logger.debug(
-                f"{self.service_name} response",
-                extra={
-                    "status_code": response.status_code,
-                    "content_type": response.headers.get("Content-Type"),
-                },
+        request_key = None
+        if method.upper() == "GET" and (
+            self.memo is not None or self.conditional_cache is not None
+        ):
+            request_key = self.request_key(
+                url_path, kwargs.get("params"), require_auth0=require_auth0
             )
 
-        except requests.RequestException as exc:
-            raise LandoAPICommunicationException(
-                "An error occurred when communicating with Lando API"
-            ) from exc
+        # Serve repeated reads within the same page render from memory.
+        if self.memo is not None:
+            if request_key is None:
+                # Writes may change any resource, so forget earlier reads.
+                self.memo.discard(lambda key: str(key[0]).startswith(self.url))
+            else:
+                content = self.memo.get(request_key)
+                if content is not None:
+                    with self.timed("decode"):
+                        return response_decoder.decode(content)
+
+        # Revalidate previously seen responses rather than downloading them
+        # again if they have not changed.
+        cached = None
+        if self.conditional_cache is not None and request_key is not None:
+            cached = self.conditional_cache.get(request_key)
+            if cached is not None:
+                for header, value in cached.conditional_headers().items():
+                    headers.setdefault(header, value)
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = self.send(
+                    method, url_path, url_template=url_template, **kwargs
+                )
+            except requests.RequestException as exc:
+                # Only retry failures to connect, as a timeout waiting for a
+                # response likely means the upstream is already overloaded.
+                if isinstance(exc, requests.ConnectionError) and self.wait_for_retry(
+                    method, attempt, idempotent=idempotent
+                ):
+                    continue
+
+                raise LandoAPICommunicationException(
+                    "An error occurred when communicating with Lando API"
+                ) from exc
+
+            if not self.wait_for_retry(
+                method,
+                attempt,
+                idempotent=idempotent,
+                status_code=response.status_code,
+            ):
+                break
+
+        if cached is not None and response.status_code == 304:
+            self.conditional_cache.record_hit()
+            content = cached.body
+        else:
+            if cached is not None:
+                self.conditional_cache.record_miss()
+
+            content = response.content
+            if (
+                self.conditional_cache is not None
+                and request_key is not None
+                and response.status_code == 200
+            ):
+                self.conditional_cache.store(
+                    request_key,
+                    content,
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
+                )
 
         try:
-            data = response.json()
-        except JSONDecodeError as exc:
+            with self.timed("decode"):
+                data = response_decoder.decode(content)
+        except ValueError as exc:
             response.raise_for_status()
 
             raise LandoAPICommunicationException(
@@ -108,15 +500,197 @@ class API:
             ) from exc
 
         LandoAPIError.raise_if_error(response, data)
+
+        if self.memo is not None and request_key is not None:
+            self.memo.set(request_key, content)
+
         return data
 
+    def send(
+        self,
+        method: str,
+        url_path: str,
+        *,
+        url_template: Optional[str] = None,
+        **kwargs,
+    ) -> requests.Response:
+        """Send a single request, applying the upstream policy if there is one.
+
+        `url_template` is used in place of `url_path` to label the request's
+        metrics and to track its latency for the adaptive timeout, see
+        `request`.
+
+        Raises:
+            requests.RequestException:
+                If there is an error communicating with the API.
+            LandoAPICircuitOpenException:
+                If the API is unhealthy and requests are not being sent.
+        """
+        template = url_template or path_template(url_path)
+        timeout_key = (method.upper(), template)
+        if self.policy is not None:
+            if not self.policy.circuit_breaker.allow_request():
+                raise LandoAPICircuitOpenException(
+                    f"{self.service_name} is unavailable, not sending request"
+                )
+
+            kwargs.setdefault("timeout", self.policy.timeout.current(timeout_key))
+
+        service = labels(service=self.service_name)
+        metrics.add("lando_ui_upstream_requests_in_flight", service, 1)
+        try:
+            start = time.monotonic()
+            with session_pool.in_use(self.session), self.timed(
+                self.service_name.lower(), f"{method} {url_path}"
+            ):
+                response = self.session.request(method, self.url + url_path, **kwargs)
+        except requests.RequestException as exc:
+            self.observe_request(method, template, "error", time.monotonic() - start)
+            if self.policy is not None:
+                if isinstance(exc, requests.ReadTimeout):
+                    self.policy.timeout.observe_timeout(timeout_key)
+                self.policy.circuit_breaker.record_failure()
+            raise
+        finally:
+            metrics.add("lando_ui_upstream_requests_in_flight", service, -1)
+
+        self.observe_request(
+            method, template, response.status_code, time.monotonic() - start
+        )
+        self.record_response(response, time.monotonic() - start, timeout_key)
+
+        logger.debug(
+            f"{self.service_name} response",
+            extra={
+                "status_code": response.status_code,
+                "content_type": response.headers.get("Content-Type"),
+            },
+        )
+        return response
+
+    def observe_request(
+        self, method: str, url_template: str, status: int | str, elapsed: float
+    ):
+        """Record the latency of a request in the upstream metrics."""
+        metrics.observe(
+            "lando_ui_upstream_request_duration_seconds",
+            labels(
+                service=self.service_name,
+                method=method.upper(),
+                path=url_template,
+                status=status,
+            ),
+            elapsed,
+        )
+
+    def timed(self, name: str, description: str = "") -> ContextManager:
+        """Time the body of a `with` block as a span on the request timeline."""
+        if self.timeline is None:
+            return nullcontext()
+
+        return self.timeline.span(name, description)
+
+    def wait_for_retry(
+        self,
+        method: str,
+        attempt: int,
+        *,
+        idempotent: Optional[bool] = None,
+        status_code: Optional[int] = None,
+    ) -> bool:
+        """Wait before retrying a failed request and return `True` if it should be.
+
+        `status_code` is the status of the response received, or `None` if the
+        request failed without a response.
+        """
+        if self.policy is None or self.policy.retry is None:
+            return False
+
+        delay = self.policy.retry.delay(
+            method,
+            attempt,
+            idempotent=idempotent,
+            status_code=status_code,
+            deadline=self.deadline,
+        )
+        if delay is None:
+            return False
+
+        logger.info(
+            f"retrying {self.service_name} request",
+            extra={
+                "method": method,
+                "attempt": attempt,
+                "status_code": status_code,
+                "delay": delay,
+            },
+        )
+        # The wait shows up in the request summary and Server-Timing header.
+        with self.timed("retry", f"{method} attempt {attempt}"):
+            time.sleep(delay)
+        return True
+
+    def record_response(
+        self, response: requests.Response, elapsed: float, timeout_key: Hashable = None
+    ):
+        """Update the upstream policy with the outcome of a request."""
+        if self.policy is None:
+            return
+
+        self.policy.timeout.observe(elapsed, timeout_key)
+
+        # Gateway errors mean the service is unreachable, while other error
+        # responses (including maintenance mode) come from the service itself.
+        if response.status_code in (502, 504):
+            self.policy.circuit_breaker.record_failure()
+        else:
+            self.policy.circuit_breaker.record_success()
+
+    def request_key(
+        self, url_path: str, params: Optional[dict], *, require_auth0: bool = False
+    ) -> tuple:
+        """Return the key used to cache or memoize the response to a read.
+
+        Responses may differ between users, so the key includes a digest of the
+        credentials sent with the request rather than the credentials themselves.
+        """
+        identity = hashlib.sha256()
+        if require_auth0 and self.auth0_access_token:
+            identity.update(self.auth0_access_token.encode())
+        identity.update(b"\0")
+        if self.phabricator_api_token:
+            identity.update(self.phabricator_api_token.encode())
+
+        return (
+            self.url + url_path,
+            tuple(sorted((params or {}).items())),
+            identity.hexdigest(),
+        )
+
+
+def get_request_deadline() -> float:
+    """Return the `time.monotonic()` deadline for retrying upstream requests.
+
+    The deadline is shared by every upstream request made while rendering a
+    single page, so retries cannot add more than the configured budget to the
+    total response time.
+    """
+    if "_upstream_deadline" not in g:
+        g._upstream_deadline = (
+            time.monotonic() + current_app.config["UPSTREAM_RETRY_BUDGET"]
+        )
+
+    return g._upstream_deadline
+
 
 class LandoAPI(API):
     """Client for LandoAPI."""
 
+    SERVICE_NAME = "LandoAPI"
+
     @property
     def service_name(self) -> str:
-        return "LandoAPI"
+        return self.SERVICE_NAME
 
     @classmethod
     def from_environment(cls, token: Optional[str] = None) -> API:
@@ -124,26 +698,42 @@ class LandoAPI(API):
         if not token:
             token = get_phabricator_api_token()
 
+        url = current_app.config["LANDO_API_URL"]
         return cls(
-            current_app.config["LANDO_API_URL"],
+            url,
             auth0_access_token=session.get("access_token"),
             phabricator_api_token=token,
+            session=session_pool.get(url),
+            conditional_cache=conditional_request_cache,
+            policy=upstream_policies[cls.SERVICE_NAME],
+            deadline=get_request_deadline(),
+            memo=get_request_memo(),
+            timeline=get_request_timeline(),
         )
 
 
 class TreestatusAPI(API):
     """Client for Treestatus."""
 
+    SERVICE_NAME = "Treestatus"
+
     @property
     def service_name(self) -> str:
-        return "Treestatus"
+        return self.SERVICE_NAME
 
     @classmethod
     def from_environment(cls) -> API:
         """Build a `TreestatusAPI` object from the environment."""
+        url = current_app.config["TREESTATUS_URL"]
         return cls(
-            current_app.config["TREESTATUS_URL"],
+            url,
             auth0_access_token=session.get("access_token"),
+            session=session_pool.get(url),
+            conditional_cache=conditional_request_cache,
+            policy=upstream_policies[cls.SERVICE_NAME],
+            deadline=get_request_deadline(),
+            memo=get_request_memo(),
+            timeline=get_request_timeline(),
         )
 
 
@@ -155,6 +745,10 @@ class LandoAPICommunicationException(LandoAPIException):
     """Exception when communicating with Lando API fails."""
 
 
+class LandoAPICircuitOpenException(LandoAPICommunicationException):
+    """Exception when a request is not sent because the API is unhealthy."""
+
+
 class LandoAPIError(LandoAPIException):
     """Exception when Lando API responds with an error."""
 
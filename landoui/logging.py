@@ -4,8 +4,19 @@
 import json
 import logging
 import socket
+import sys
+import threading
 import traceback
 
+from collections import deque
+
+from landoui.threads import BackgroundThread
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -13,8 +24,20 @@ class MozLogFormatter(logging.Formatter):
     """A mozlog logging formatter.
 
     https://wiki.mozilla.org/Firefox/Services/Logging#MozLog_application_logging_standard
+
+    Records are formatted for every request, so the fields which never change
+    are built once, and the JSON encoder is chosen up front.
+
+    Args:
+        mozlog_logger: The `Logger` field of each record.
+        sort_keys: Whether to sort the keys of each record, which makes the
+            output stable for people reading it at the cost of speed.
+        encoder: The JSON encoder to use, one of `ENCODERS`. `auto` uses
+            `orjson` if it is installed, otherwise `json`.
     """
 
+    ENCODERS = ("auto", "json", "orjson")
+
     MOZLOG_ENVVERSION = "2.0"
 
     # Syslog severity levels.
@@ -36,7 +59,7 @@ class MozLogFormatter(logging.Formatter):
         "CRITICAL": SL_CRIT,
     }
 
-    BUILTIN_LOGRECORD_ATTRIBUTES = set(
+    BUILTIN_LOGRECORD_ATTRIBUTES = frozenset(
         (
             "args",
             "asctime",
@@ -58,49 +81,82 @@ class MozLogFormatter(logging.Formatter):
             "processName",
             "relativeCreated",
             "stack_info",
+            "taskName",
             "thread",
             "threadName",
         )
     )
 
-    def __init__(self, *args, mozlog_logger=None, **kwargs):
-        self.mozlog_logger = mozlog_logger or "Dockerflow"
-        self.hostname = socket.gethostname()
-        super().__init__(*args, **kwargs)
+    def __init__(
+        self, *args, mozlog_logger=None, sort_keys=True, encoder="json", **kwargs
+    ):
+        if encoder not in self.ENCODERS:
+            raise ValueError(f"Unknown JSON encoder: {encoder}")
 
-    def format(self, record):
-        """Formats a log record and serializes to mozlog json"""
+        if encoder == "orjson" and orjson is None:
+            raise ValueError("The orjson JSON encoder is not installed")
+
+        if encoder == "auto":
+            encoder = "json" if orjson is None else "orjson"
 
-        mozlog_record = {
+        self.mozlog_logger = mozlog_logger or "Dockerflow"
+        self.hostname = socket.gethostname()
+        self.sort_keys = sort_keys
+        self.encoder = encoder
+        self.envelope = {
             "EnvVersion": self.MOZLOG_ENVVERSION,
             "Hostname": self.hostname,
             "Logger": self.mozlog_logger,
-            "Type": record.name,
-            "Timestamp": int(record.created * 1e9),
-            "Severity": self.PRIORITY.get(record.levelname, self.SL_WARNING),
-            "Pid": record.process,
-            "Fields": {
-                k: v
-                for k, v in record.__dict__.items()
-                if k not in self.BUILTIN_LOGRECORD_ATTRIBUTES
-            },
         }
 
+        json_dumps = json.JSONEncoder(sort_keys=sort_keys).encode
+        if encoder == "orjson":
+            # Accept the non-string dict keys which `json` accepts.
+            option = orjson.OPT_NON_STR_KEYS
+            if sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+
+            def orjson_dumps(obj):
+                try:
+                    return orjson.dumps(obj, option=option).decode()
+                except TypeError:
+                    # Anything else `orjson` rejects, such as integers which
+                    # are too large, is left to `json`.
+                    return json_dumps(obj)
+
+            self._dumps = orjson_dumps
+        else:
+            self._dumps = json_dumps
+
+        super().__init__(*args, **kwargs)
+
+    def format(self, record):
+        """Formats a log record and serializes to mozlog json"""
+        builtin = self.BUILTIN_LOGRECORD_ATTRIBUTES
+        fields = {k: v for k, v in record.__dict__.items() if k not in builtin}
+
         msg = record.getMessage()
-        if msg and "msg" not in mozlog_record["Fields"]:
-            mozlog_record["Fields"]["msg"] = msg
+        if msg and "msg" not in fields:
+            fields["msg"] = msg
 
         if record.exc_info is not None:
-            mozlog_record["Fields"]["exc"] = {
+            fields["exc"] = {
                 "error": repr(record.exc_info[1]),  # Instance
                 "traceback": "".join(traceback.format_tb(record.exc_info[2])),
             }
 
+        mozlog_record = self.envelope.copy()
+        mozlog_record["Type"] = record.name
+        mozlog_record["Timestamp"] = int(record.created * 1e9)
+        mozlog_record["Severity"] = self.PRIORITY.get(record.levelname, self.SL_WARNING)
+        mozlog_record["Pid"] = record.process
+        mozlog_record["Fields"] = fields
+
         return self.serialize(mozlog_record)
 
     def serialize(self, mozlog_record):
         """Serialize a mozlog record."""
-        return json.dumps(mozlog_record, sort_keys=True)
+        return self._dumps(mozlog_record)
 
 
 class PrettyMozLogFormatter(MozLogFormatter):
@@ -111,6 +167,126 @@ class PrettyMozLogFormatter(MozLogFormatter):
         return json.dumps(mozlog_record, sort_keys=True, indent=2)
 
 
+class AsyncStreamHandler(logging.Handler):
+    """A stream handler which writes records from a background thread.
+
+    Records are put on a bounded in-memory queue by the logging thread, and
+    a writer thread formats them and writes them to the stream in batches,
+    so a slow stream does not hold up request threads. When the queue is
+    full the oldest record is dropped and counted, and the number dropped is
+    logged once the writer catches up.
+
+    Records are formatted on the writer thread, so they must not be modified
+    after they are logged. The writer is started on the first record logged
+    in each process, so that it runs in the uWSGI worker rather than the
+    master process, and queued records are written out when the handler is
+    closed, which `logging` does at exit.
+    """
+
+    def __init__(self, stream=None, *, queue_size: int = 10000, batch_size: int = 256):
+        super().__init__()
+        self.stream = stream or sys.stderr
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue: deque[logging.LogRecord] = deque()
+        self._ready = threading.Condition(threading.Lock())
+        self._write_lock = threading.Lock()
+        self._unreported_drops = 0
+        self._closed = False
+        self._writer = BackgroundThread(self._run, "log-writer")
+
+    def emit(self, record: logging.LogRecord):
+        """Queue `record` to be written, dropping the oldest record if full."""
+        with self._ready:
+            if self._closed:
+                return
+
+            if len(self._queue) >= self.queue_size:
+                self._queue.popleft()
+                self.dropped += 1
+                self._unreported_drops += 1
+
+            self._queue.append(record)
+            self._writer.ensure_started()
+            self._ready.notify()
+
+    def flush(self):
+        """Write out every queued record from the calling thread."""
+        while self._write_batch():
+            pass
+
+    def close(self):
+        """Stop the writer thread after it has written every queued record."""
+        with self._ready:
+            self._closed = True
+            writer = self._writer.current()
+            self._ready.notify()
+
+        if writer is not None and writer is not threading.current_thread():
+            writer.join(timeout=5)
+
+        self.flush()
+        super().close()
+
+    def stats(self) -> dict[str, int]:
+        """Return the queue length and the number of records dropped."""
+        with self._ready:
+            return {"queued": len(self._queue), "dropped": self.dropped}
+
+    def _run(self):
+        while True:
+            with self._ready:
+                while not self._queue and not self._closed:
+                    self._ready.wait()
+
+                if self._closed and not self._queue:
+                    return
+
+            self._write_batch()
+
+    def _write_batch(self) -> bool:
+        """Write up to `batch_size` queued records, returning `False` if none."""
+        with self._write_lock:
+            with self._ready:
+                count = min(len(self._queue), self.batch_size)
+                batch = [self._queue.popleft() for _ in range(count)]
+                dropped, self._unreported_drops = self._unreported_drops, 0
+
+            if dropped:
+                batch.append(self._dropped_record(dropped))
+
+            if not batch:
+                return False
+
+            lines = []
+            for record in batch:
+                try:
+                    lines.append(self.format(record) + "\n")
+                except Exception:
+                    self.handleError(record)
+
+            try:
+                self.stream.write("".join(lines))
+                self.stream.flush()
+            except Exception:
+                self.handleError(batch[-1])
+
+            return True
+
+    def _dropped_record(self, dropped: int) -> logging.LogRecord:
+        return logger.makeRecord(
+            logger.name,
+            logging.WARNING,
+            __file__,
+            0,
+            "log records dropped",
+            None,
+            None,
+            extra={"dropped": dropped, "total_dropped": self.dropped},
+        )
+
+
 def log_config_change(setting_name, value):
     """Helper to log configuration changes.
 
@@ -0,0 +1,448 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import atexit
+import bisect
+import fcntl
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Optional,
+)
+
+from landoui.cache import (
+    conditional_request_cache,
+    reference_data_cache,
+    treestatus_cache,
+)
+from landoui.resilience import (
+    CircuitState,
+    upstream_policies,
+)
+from landoui.threads import BackgroundThread
+
+logger = logging.getLogger(__name__)
+
+# The snapshot files written by each worker, and the snapshot which holds
+# the totals of workers which have exited.
+SNAPSHOT_FILENAME = re.compile(r"metrics-(\d+)\.json")
+RETIRED_FILENAME = "metrics-retired.json"
+
+# Latency buckets in seconds, matching the Prometheus client defaults.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+# A metric sample from a collector: its kind ("counter" or "gauge"), name,
+# labels and value.
+Sample = tuple[str, str, Labels, float]
+
+
+def labels(**values: Any) -> Labels:
+    """Return metric labels in a hashable, consistently ordered form."""
+    return tuple(sorted((name, str(value)) for name, value in values.items()))
+
+
+def path_template(url_path: str) -> str:
+    """Return `url_path` with numeric identifiers replaced, to bound labels.
+
+    For example `stacks/D1234` becomes `stacks/D{id}`.
+    """
+    return re.sub(r"\d+", "{id}", url_path.split("?", 1)[0])
+
+
+class MetricsRegistry:
+    """Thread-safe request metrics for this worker, rendered for Prometheus.
+
+    Histograms and gauges are updated as requests are handled, and
+    collectors are called to sample other state, such as cache statistics,
+    when the metrics are read.
+
+    Each uWSGI worker has its own registry. When `directory` is set, every
+    worker writes a snapshot of its metrics there each `flush_interval`
+    seconds, and the metrics of all workers are summed when they are
+    rendered. Gauges from workers which have stopped writing snapshots are
+    left out. When a worker exits, or is found to have died, the counters
+    and histograms from its snapshot are added to a single retired snapshot
+    and its own snapshot is removed. Totals never go backwards, and the
+    directory does not grow as workers are respawned.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collectors: list[Callable[[], Iterable[Sample]]] = []
+        self._writer = BackgroundThread(self._run, "metrics-writer")
+        self.configure()
+
+    def configure(
+        self,
+        *,
+        directory: Optional[str] = None,
+        flush_interval: float = 5.0,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        """Set where snapshots are shared between workers, resetting metrics."""
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._lock:
+            self.directory = directory
+            self.flush_interval = flush_interval
+            self.buckets = buckets
+            self._histograms: dict[tuple[str, Labels], dict[str, Any]] = {}
+            self._gauges: dict[tuple[str, Labels], float] = {}
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        """Add a function which samples metrics whenever they are read."""
+        self._collectors.append(collector)
+
+    def observe(self, name: str, labels: Labels, value: float):
+        """Record `value` in the histogram `name`."""
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = {
+                    "buckets": [0] * (len(self.buckets) + 1),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+                self._histograms[(name, labels)] = histogram
+
+            histogram["buckets"][bisect.bisect_left(self.buckets, value)] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+            self._ensure_writer()
+
+    def add(self, name: str, labels: Labels, amount: float):
+        """Add `amount` to the gauge `name`."""
+        with self._lock:
+            key = (name, labels)
+            self._gauges[key] = self._gauges.get(key, 0.0) + amount
+            self._ensure_writer()
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return the metrics of this worker, in a JSON serializable form."""
+        counters = {}
+        gauges = {}
+        for collector in self._collectors:
+            for kind, name, sample_labels, value in collector():
+                target = counters if kind == "counter" else gauges
+                target[(name, sample_labels)] = value
+
+        with self._lock:
+            gauges.update(self._gauges)
+            histograms = {
+                key: {**histogram, "buckets": list(histogram["buckets"])}
+                for key, histogram in self._histograms.items()
+            }
+
+        def encode(metrics: dict) -> list:
+            return [
+                [name, list(map(list, key)), value]
+                for (name, key), value in metrics.items()
+            ]
+
+        return {
+            "pid": os.getpid(),
+            "time": time.time(),
+            "buckets": list(self.buckets),
+            "counters": encode(counters),
+            "gauges": encode(gauges),
+            "histograms": encode(histograms),
+        }
+
+    def write_snapshot(self):
+        """Write this worker's snapshot to the shared directory, if there is one."""
+        if not self.directory:
+            return
+
+        path = os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+        try:
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as exc:
+            logger.warning(
+                "could not write metrics snapshot", extra={"error": str(exc)}
+            )
+
+    def snapshots(self) -> list[dict[str, Any]]:
+        """Return the snapshot of this worker, and those of the other workers."""
+        snapshots = [self.snapshot()]
+        if not self.directory:
+            return snapshots
+
+        self.prune()
+        own = os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+        for path in sorted(glob.glob(os.path.join(self.directory, "metrics-*.json"))):
+            if path == own:
+                continue
+
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # The file may be mid-write by a worker which is exiting.
+                continue
+
+        return snapshots
+
+    def prune(self):
+        """Retire the snapshots of workers which are no longer running."""
+        for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+            match = SNAPSHOT_FILENAME.fullmatch(os.path.basename(path))
+            if match is None:
+                continue
+
+            pid = int(match.group(1))
+            if pid != os.getpid() and not process_exists(pid):
+                self.retire(path)
+
+    def retire(self, path: Optional[str] = None):
+        """Add a snapshot to the retired snapshot, and remove it.
+
+        `path` is the snapshot of a worker which has died. If it is `None`,
+        this worker's current metrics are retired as it exits.
+        """
+        if not self.directory:
+            return
+
+        retired_path = os.path.join(self.directory, RETIRED_FILENAME)
+        own = os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+        try:
+            # Workers may retire snapshots at the same time, so they take
+            # turns to update the retired snapshot.
+            with open(os.path.join(self.directory, "retire.lock"), "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+                if path is None:
+                    self._writer.stop()
+                    path = own
+                    snapshot = self.snapshot()
+                else:
+                    try:
+                        with open(path) as f:
+                            snapshot = json.load(f)
+                    except FileNotFoundError:
+                        # Another worker has already retired it.
+                        return
+                    except ValueError:
+                        # The worker died while writing it, so it is lost.
+                        snapshot = None
+
+                snapshots = [snapshot] if snapshot is not None else []
+                try:
+                    with open(retired_path) as f:
+                        snapshots.append(json.load(f))
+                except FileNotFoundError:
+                    pass
+
+                with open(f"{retired_path}.tmp", "w") as f:
+                    json.dump(merge(snapshots), f)
+                os.replace(f"{retired_path}.tmp", retired_path)
+
+                if os.path.exists(path):
+                    os.remove(path)
+        except (OSError, ValueError) as exc:
+            logger.warning(
+                "could not retire metrics snapshot", extra={"error": str(exc)}
+            )
+
+    def render(self) -> str:
+        """Return the metrics of every worker in the Prometheus text format."""
+        return render(self.snapshots(), stale_after=3 * self.flush_interval)
+
+    def _ensure_writer(self):
+        # Called with the lock held.
+        if self.directory and self._writer.ensure_started():
+            atexit.register(self.retire)
+
+    def _run(self):
+        # Stops once the worker is exiting and has retired its snapshot.
+        while self._writer.sleep(self.flush_interval):
+            self.write_snapshot()
+
+
+def process_exists(pid: int) -> bool:
+    """Return `True` if a process with the given pid is running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists, but belongs to another user.
+        pass
+
+    return True
+
+
+def merge(snapshots: list[dict[str, Any]]) -> dict[str, Any]:
+    """Sum the counters and histograms of `snapshots` into a single snapshot.
+
+    Gauges describe the workers they came from, so they are left out.
+    """
+    counters: dict[tuple, float] = {}
+    histograms: dict[tuple, dict[str, Any]] = {}
+    buckets: list[float] = []
+
+    for snapshot in snapshots:
+        buckets = buckets or snapshot["buckets"]
+        for name, sample_labels, value in snapshot["counters"]:
+            key = (name, tuple(map(tuple, sample_labels)))
+            counters[key] = counters.get(key, 0.0) + value
+
+        for name, sample_labels, histogram in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, sample_labels)))
+            merged = histograms.setdefault(
+                key,
+                {"buckets": [0] * len(histogram["buckets"]), "sum": 0.0, "count": 0},
+            )
+            for i, count in enumerate(histogram["buckets"]):
+                merged["buckets"][i] += count
+            merged["sum"] += histogram["sum"]
+            merged["count"] += histogram["count"]
+
+    def encode(metrics: dict) -> list:
+        return [
+            [name, list(map(list, key)), value]
+            for (name, key), value in metrics.items()
+        ]
+
+    return {
+        "pid": None,
+        "time": time.time(),
+        "buckets": buckets,
+        "counters": encode(counters),
+        "gauges": [],
+        "histograms": encode(histograms),
+    }
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: Iterable[tuple[str, str]]) -> str:
+    pairs = ",".join(f'{name}="{escape(value)}"' for name, value in labels)
+    return f"{{{pairs}}}" if pairs else ""
+
+
+def render(snapshots: list[dict[str, Any]], *, stale_after: float) -> str:
+    """Sum the snapshots of each worker, and render them for Prometheus."""
+    now = time.time()
+    gauges: dict[tuple, float] = {}
+    for snapshot in snapshots:
+        if now - snapshot["time"] <= stale_after:
+            for name, sample_labels, value in snapshot["gauges"]:
+                key = (name, tuple(map(tuple, sample_labels)))
+                gauges[key] = gauges.get(key, 0.0) + value
+
+    merged = merge(snapshots)
+    counters = {
+        (name, tuple(map(tuple, key))): value for name, key, value in merged["counters"]
+    }
+    histograms = {
+        (name, tuple(map(tuple, key))): histogram
+        for name, key, histogram in merged["histograms"]
+    }
+
+    # Hit ratios are derived from the summed counters, as ratios from each
+    # worker cannot be combined.
+    for (name, key), hits in list(counters.items()):
+        if name == "lando_ui_cache_hits_total":
+            hits += counters.get(("lando_ui_cache_stale_hits_total", key), 0.0)
+            lookups = hits + counters.get(("lando_ui_cache_misses_total", key), 0.0)
+            gauges[("lando_ui_cache_hit_ratio", key)] = (
+                hits / lookups if lookups else 0.0
+            )
+
+    lines = []
+    for kind, metrics in (("counter", counters), ("gauge", gauges)):
+        for name in sorted({name for name, _ in metrics}):
+            lines.append(f"# TYPE {name} {kind}")
+            for (metric, key), value in sorted(metrics.items()):
+                if metric == name:
+                    lines.append(f"{name}{format_labels(key)} {value:g}")
+
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        bounds = [f"{bound:g}" for bound in merged["buckets"]] + ["+Inf"]
+        for (metric, key), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+
+            cumulative = 0
+            for bound, count in zip(bounds, histogram["buckets"]):
+                cumulative += count
+                bucket_labels = format_labels(key + (("le", bound),))
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(key)} {histogram['sum']:g}")
+            lines.append(f"{name}_count{format_labels(key)} {histogram['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+def collect_cache_stats() -> Iterable[Sample]:
+    """Sample the hit and miss counters of the per-worker caches."""
+    for cache in (reference_data_cache, treestatus_cache):
+        stats = cache.stats()
+        cache_labels = labels(cache=cache.name)
+        yield "counter", "lando_ui_cache_hits_total", cache_labels, stats["hits"]
+        yield "counter", "lando_ui_cache_stale_hits_total", cache_labels, stats[
+            "stale_hits"
+        ]
+        yield "counter", "lando_ui_cache_misses_total", cache_labels, stats["misses"]
+        yield "gauge", "lando_ui_cache_entries", cache_labels, stats["size"]
+
+    stats = conditional_request_cache.stats()
+    cache_labels = labels(cache="conditional-request")
+    yield "counter", "lando_ui_cache_hits_total", cache_labels, stats["hits"]
+    yield "counter", "lando_ui_cache_misses_total", cache_labels, stats["misses"]
+    yield "gauge", "lando_ui_cache_entries", cache_labels, stats["size"]
+    yield "gauge", "lando_ui_cache_bytes", cache_labels, stats["bytes"]
+
+
+def collect_circuit_breakers() -> Iterable[Sample]:
+    """Sample the state of each upstream circuit breaker.
+
+    Summed across workers, this is the number of workers whose circuit for
+    the service is in each state.
+    """
+    for service, policy in upstream_policies.items():
+        for state in CircuitState:
+            yield (
+                "gauge",
+                "lando_ui_circuit_breaker_state",
+                labels(service=service, state=state.value),
+                float(policy.circuit_breaker.state == state),
+            )
+
+
+def collect_retries() -> Iterable[Sample]:
+    """Sample the number of retried requests to each upstream service."""
+    for service, policy in upstream_policies.items():
+        if policy.retry is not None:
+            yield (
+                "counter",
+                "lando_ui_upstream_retries_total",
+                labels(service=service),
+                policy.retry.retries,
+            )
+
+
+metrics = MetricsRegistry()
+metrics.register_collector(collect_cache_stats)
+metrics.register_collector(collect_circuit_breakers)
+metrics.register_collector(collect_retries)
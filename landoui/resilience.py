@@ -0,0 +1,316 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import enum
+import logging
+import math
+import random
+import threading
+import time
+
+from collections import (
+    OrderedDict,
+    deque,
+)
+from dataclasses import dataclass
+from typing import (
+    Hashable,
+    Optional,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveTimeout:
+    """A request timeout derived from recently observed upstream latencies.
+
+    The read timeout is a multiple of a high percentile of the most recent
+    response times, clamped between `minimum` and `maximum`. Until enough
+    responses have been observed the `initial` timeout is used.
+
+    Latencies are tracked separately for each `key`, such as the method and
+    path template of a request, so that frequent fast reads do not shorten
+    the timeout of slower requests to the same service. At most `max_keys`
+    keys are tracked, forgetting the least recently used first.
+    """
+
+    def __init__(
+        self,
+        *,
+        initial: float = 10.0,
+        minimum: float = 2.0,
+        maximum: float = 30.0,
+        connect: float = 3.05,
+        percentile: float = 0.99,
+        multiplier: float = 2.0,
+        window: int = 200,
+        min_samples: int = 20,
+        max_keys: int = 64,
+    ):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.connect = connect
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.window = window
+        self.min_samples = min_samples
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._latencies: OrderedDict[Hashable, deque[float]] = OrderedDict()
+
+    def observe(self, seconds: float, key: Hashable = None):
+        """Record the latency of a completed request."""
+        with self._lock:
+            latencies = self._latencies.get(key)
+            if latencies is None:
+                latencies = deque(maxlen=self.window)
+                self._latencies[key] = latencies
+                if len(self._latencies) > self.max_keys:
+                    self._latencies.popitem(last=False)
+            else:
+                self._latencies.move_to_end(key)
+
+            latencies.append(seconds)
+
+    def observe_timeout(self, key: Hashable = None):
+        """Record a request for `key` which timed out.
+
+        The request took at least as long as its timeout, so the timeout is
+        recorded as its latency. Otherwise the timeout would only learn from
+        requests which finish in time, and could never grow again once the
+        upstream slows down past it.
+        """
+        self.observe(self.current(key)[1], key)
+
+    def latency_percentile(self, key: Hashable = None) -> float | None:
+        """Return the configured percentile of the latencies observed for `key`."""
+        with self._lock:
+            latencies = self._latencies.get(key, ())
+            if len(latencies) < self.min_samples:
+                return None
+            latencies = sorted(latencies)
+
+        index = min(len(latencies) - 1, math.ceil(self.percentile * len(latencies)) - 1)
+        return latencies[index]
+
+    def current(self, key: Hashable = None) -> tuple[float, float]:
+        """Return the `(connect, read)` timeout for the next request for `key`."""
+        latency = self.latency_percentile(key)
+        if latency is None:
+            return self.connect, self.initial
+
+        read = min(self.maximum, max(self.minimum, latency * self.multiplier))
+        return self.connect, read
+
+
+class CircuitState(enum.Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Fail fast while an upstream service is unhealthy.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    requests are rejected without being sent. Once `reset_timeout` seconds
+    have passed a single trial request is let through; if it succeeds the
+    circuit closes again, otherwise it stays open for another `reset_timeout`.
+    """
+
+    def __init__(
+        self, name: str, *, failure_threshold: int = 5, reset_timeout: float = 30.0
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def state(self) -> CircuitState:
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Return `True` if a request to the upstream should be attempted."""
+        with self._lock:
+            if self._state == CircuitState.CLOSED:
+                return True
+
+            # Let a single trial request through once the reset timeout has
+            # elapsed. If the trial never reports back, allow another after
+            # the timeout elapses again.
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_timeout:
+                return False
+
+            self._state = CircuitState.HALF_OPEN
+            self._opened_at = now
+            return True
+
+    def record_success(self):
+        """Record a successful request, closing the circuit."""
+        with self._lock:
+            if self._state != CircuitState.CLOSED:
+                logger.info("circuit closed", extra={"service_name": self.name})
+
+            self._state = CircuitState.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        """Record a failed request, opening the circuit if needed."""
+        with self._lock:
+            self._failures += 1
+            if (
+                self._state == CircuitState.HALF_OPEN
+                or self._failures >= self.failure_threshold
+            ):
+                if self._state != CircuitState.OPEN:
+                    logger.warning(
+                        "circuit opened",
+                        extra={"service_name": self.name, "failures": self._failures},
+                    )
+
+                self._state = CircuitState.OPEN
+                self._opened_at = time.monotonic()
+
+
+class RetryPolicy:
+    """Decide whether, and after how long, a failed request should be retried.
+
+    Only idempotent requests are retried, and only after connection errors or
+    gateway error responses. Each retry waits for an exponential backoff with
+    full jitter, so clients retrying after the same upstream blip spread out
+    rather than arriving together.
+    """
+
+    RETRYABLE_STATUS_CODES = (502, 504)
+
+    def __init__(
+        self,
+        *,
+        attempts: int = 3,
+        backoff: float = 0.1,
+        max_backoff: float = 2.0,
+        methods: tuple[str, ...] = ("GET", "HEAD", "OPTIONS"),
+    ):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.methods = methods
+        self._lock = threading.Lock()
+        self.retries = 0
+
+    def delay(
+        self,
+        method: str,
+        attempt: int,
+        *,
+        idempotent: Optional[bool] = None,
+        status_code: Optional[int] = None,
+        deadline: Optional[float] = None,
+    ) -> Optional[float]:
+        """Return how long to wait before retrying, or `None` to give up.
+
+        Args:
+            method: The HTTP method of the failed request.
+            attempt: The number of attempts made so far.
+            idempotent: Whether the request is safe to repeat. Defaults to
+                whether `method` is one of the policy's retryable methods.
+            status_code: The response status code, or `None` if no response
+                was received.
+            deadline: A `time.monotonic()` value after which no more retries
+                should be attempted.
+        """
+        if idempotent is None:
+            idempotent = method.upper() in self.methods
+
+        if not idempotent or attempt >= self.attempts:
+            return None
+
+        if status_code is not None and status_code not in self.RETRYABLE_STATUS_CODES:
+            return None
+
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+
+        with self._lock:
+            self.retries += 1
+
+        return delay
+
+
+@dataclass
+class UpstreamPolicy:
+    """Shared per-service state used when making requests to an upstream."""
+
+    circuit_breaker: CircuitBreaker
+    timeout: AdaptiveTimeout
+    retry: Optional[RetryPolicy] = None
+
+
+class UpstreamPolicies:
+    """The `UpstreamPolicy` for each upstream service in this worker."""
+
+    SERVICES = ("LandoAPI", "Treestatus")
+
+    def __init__(self):
+        self._policies: dict[str, UpstreamPolicy] = {}
+        self.configure()
+
+    def configure(
+        self,
+        *,
+        timeout_initial: float = 10.0,
+        timeout_min: float = 2.0,
+        timeout_max: float = 30.0,
+        connect_timeout: float = 3.05,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        retry_attempts: Optional[dict[str, int]] = None,
+        retry_backoff: float = 0.1,
+        retry_max_backoff: float = 2.0,
+    ):
+        """Build fresh policies for each service with the given settings.
+
+        `retry_attempts` maps service names to the maximum number of attempts
+        for each request, defaulting to 3.
+        """
+        retry_attempts = retry_attempts or {}
+        self._policies = {
+            service: UpstreamPolicy(
+                circuit_breaker=CircuitBreaker(
+                    service,
+                    failure_threshold=failure_threshold,
+                    reset_timeout=reset_timeout,
+                ),
+                timeout=AdaptiveTimeout(
+                    initial=timeout_initial,
+                    minimum=timeout_min,
+                    maximum=timeout_max,
+                    connect=connect_timeout,
+                ),
+                retry=RetryPolicy(
+                    attempts=retry_attempts.get(service, 3),
+                    backoff=retry_backoff,
+                    max_backoff=retry_max_backoff,
+                ),
+            )
+            for service in self.SERVICES
+        }
+
+    def __getitem__(self, service: str) -> UpstreamPolicy:
+        return self._policies[service]
+
+    def items(self):
+        return self._policies.items()
+
+
+upstream_policies = UpstreamPolicies()
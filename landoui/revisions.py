@@ -25,6 +25,7 @@ from flask import (
 )
 
 from landoui.app import oidc
+from landoui.cache import reference_data_cache
 from landoui.forms import (
     SecApprovalRequestForm,
     TransplantRequestForm,
@@ -32,15 +33,17 @@ from landoui.forms import (
 )
 from landoui.helpers import (
     get_phabricator_api_token,
+    get_request_timeline,
     is_user_authenticated,
     set_last_local_referrer,
 )
 from landoui.landoapi import (
     LandoAPI,
     LandoAPIError,
+    request_executor,
 )
 from landoui.errorhandlers import RevisionNotFound
-from landoui.stacks import draw_stack_graph, Edge, sort_stack_topological
+from landoui.stacks import draw_stack_graph, graph, sort_stack_topological
 
 logger = logging.getLogger(__name__)
 
@@ -83,11 +86,35 @@ def annotate_sec_approval_workflow_info(revisions: dict[str, dict]):
 
 
 def get_uplift_repos(api: LandoAPI) -> list[tuple[str, str]]:
-    """Return the set of uplift repositories as a list of `(name, value)` tuples."""
-    uplift_repos = api.request("GET", "uplift")
+    """Return the set of uplift repositories as a list of `(name, value)` tuples.
+
+    The list of uplift repositories rarely changes, so it is cached in the
+    shared reference data cache. It may be refreshed in the background after
+    this request has finished, so it is fetched without the user's
+    credentials or request state.
+    """
+    uplift_repos = reference_data_cache.get(
+        (api.url, "uplift"),
+        functools.partial(api.shared_client().request, "GET", "uplift"),
+    )
     return [(repo, repo) for repo in uplift_repos["repos"]]
 
 
+def get_stack(api: LandoAPI, revision_id: int) -> dict:
+    """Return the stack containing `revision_id`.
+
+    Raises:
+        RevisionNotFound: If Lando API could not find the revision.
+    """
+    try:
+        return api.request("GET", "stacks/D{}".format(revision_id))
+    except LandoAPIError as e:
+        if e.status_code == 404:
+            raise RevisionNotFound(revision_id)
+        else:
+            raise
+
+
 @revisions.route("/uplift/", methods=("POST",))
 @oidc_auth_optional
 def uplift():
@@ -139,9 +166,6 @@ def revision(revision_id: int):
     form = TransplantRequestForm()
     sec_approval_form = SecApprovalRequestForm()
     uplift_request_form = UpliftRequestForm()
-
-    # Get the list of available uplift repos and populate the form with it.
-    uplift_request_form.repository.choices = get_uplift_repos(api)
     uplift_request_form.revision_id.data = revision_id
 
     errors = []
@@ -175,14 +199,22 @@ def revision(revision_id: int):
 
                 errors.append(e.detail)
 
-    # Request the entire stack.
-    try:
-        stack = api.request("GET", "stacks/D{}".format(revision_id))
-    except LandoAPIError as e:
-        if e.status_code == 404:
-            raise RevisionNotFound(revision_id)
-        else:
-            raise
+    # Request the list of available uplift repos, the entire stack and all
+    # previous transplants for the stack. These don't depend on each other so
+    # they are requested concurrently.
+    uplift_repos, stack, transplants = request_executor.gather(
+        functools.partial(get_uplift_repos, api),
+        functools.partial(get_stack, api, revision_id),
+        functools.partial(
+            api.request,
+            "GET",
+            "transplants",
+            params={"stack_revision_id": "D{}".format(revision_id)},
+        ),
+    )
+
+    # Populate the uplift form with the available uplift repos.
+    uplift_request_form.repository.choices = uplift_repos
 
     # Build a mapping from phid to revision and identify
     # the data for the revision used to load this page.
@@ -198,11 +230,6 @@ def revision(revision_id: int):
     for r in stack["repositories"]:
         repositories[r["phid"]] = r
 
-    # Request all previous transplants for the stack.
-    transplants = api.request(
-        "GET", "transplants", params={"stack_revision_id": "D{}".format(revision_id)}
-    )
-
     # The revision may appear in many `landable_paths`` if it has
     # multiple children, or any of its landable descendents have
     # multiple children. That being said, there should only be a
@@ -247,12 +274,13 @@ def revision(revision_id: int):
         series = list(reversed(series))
         target_repo = repositories.get(revisions[series[0]]["repo_phid"])
 
-    phids = set(revisions.keys())
-    edges = set(Edge(child=e[0], parent=e[1]) for e in stack["edges"])
-    order = sort_stack_topological(
-        phids, edges, key=lambda x: int(revisions[x]["id"][1:])
-    )
-    drawing_width, drawing_rows = draw_stack_graph(phids, edges, order)
+    with get_request_timeline().span("layout", "stack graph"):
+        stack_graph = graph(revisions, stack["edges"])
+        revision_ids = {
+            phid: int(revision["id"][1:]) for phid, revision in revisions.items()
+        }
+        order = sort_stack_topological(stack_graph, key=revision_ids.__getitem__)
+        drawing_width, drawing_rows = draw_stack_graph(stack_graph, order=order)
 
     annotate_sec_approval_workflow_info(revisions)
 
@@ -2,12 +2,31 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 import os
+import threading
+import time
+
+from typing import (
+    Callable,
+    Optional,
+)
 
 import sentry_sdk
 from sentry_sdk.integrations.flask import FlaskIntegration
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map
 
 from landoui.logging import log_config_change
 
+# Endpoints polled by infrastructure, which are never traced.
+HEALTH_CHECK_ENDPOINTS = frozenset(
+    (
+        "dockerflow.heartbeat",
+        "dockerflow.lbheartbeat",
+        "dockerflow.metrics",
+        "dockerflow.version",
+    )
+)
+
 
 def sanitize_headers(headers: dict[str, str]):
     """Filter security sensitive values from headers.
@@ -27,13 +46,140 @@ def before_send(event: dict, *args) -> dict:
     return event
 
 
-def initialize_sentry(release: str):
+def parse_sample_rates(value: str) -> dict[str, float]:
+    """Parse per-endpoint trace sample rates from a configuration string.
+
+    The string is a comma separated list of `name=rate` pairs, where `name`
+    is either a blueprint (such as `treestatus`) or an endpoint (such as
+    `revisions.revision`).
+
+    Raises:
+        ValueError: If a pair is malformed or a rate is not between 0 and 1.
+    """
+    rates = {}
+    for pair in filter(None, (pair.strip() for pair in value.split(","))):
+        name, separator, rate = pair.partition("=")
+        if not separator or not name.strip():
+            raise ValueError(f"Invalid trace sample rate: {pair}")
+
+        rates[name.strip()] = float(rate)
+        if not 0.0 <= rates[name.strip()] <= 1.0:
+            raise ValueError(f"Trace sample rate must be between 0 and 1: {pair}")
+
+    return rates
+
+
+class TracesSampler:
+    """Decide the rate at which each request is traced.
+
+    The rate for a request is taken from its endpoint, then its blueprint,
+    then the default rate, and health checks are never traced. Requests
+    which continue a trace keep the sampling decision made upstream.
+
+    When `target_per_second` is set, rates are scaled down while this worker
+    handles more requests than that, so the number of traces stays roughly
+    constant as traffic grows. The request rate is measured over `window`
+    seconds.
+
+    Errors are reported separately from traces, so every error is sent to
+    Sentry regardless of the rate chosen here.
+    """
+
+    def __init__(self, *, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.configure(default_rate=1.0)
+
+    def configure(
+        self,
+        *,
+        default_rate: float,
+        rates: Optional[dict[str, float]] = None,
+        target_per_second: float = 0.0,
+        window: float = 10.0,
+        url_map: Optional[Map] = None,
+    ):
+        """Set the sample rates, and the URL map used to find endpoints."""
+        with self._lock:
+            self.default_rate = default_rate
+            self.rates = rates or {}
+            self.target_per_second = target_per_second
+            self.window = window
+            self.url_map = url_map
+            self.requests_per_second = 0.0
+            self._window_start = self._clock()
+            self._window_requests = 0
+
+    def __call__(self, sampling_context: dict) -> float:
+        parent_sampled = sampling_context.get("parent_sampled")
+        if parent_sampled is not None:
+            return float(parent_sampled)
+
+        environ = sampling_context.get("wsgi_environ")
+        if environ is None:
+            return self.default_rate
+
+        endpoint = self.endpoint(environ)
+        if endpoint in HEALTH_CHECK_ENDPOINTS:
+            return 0.0
+
+        return self.rate(endpoint) * self.volume_factor()
+
+    def endpoint(self, environ: dict) -> Optional[str]:
+        """Return the endpoint a request will be routed to, if any."""
+        if self.url_map is None:
+            return None
+
+        adapter = self.url_map.bind("localhost")
+        try:
+            endpoint, _ = adapter.match(
+                environ.get("PATH_INFO", "/"), method=environ.get("REQUEST_METHOD")
+            )
+        except HTTPException:
+            return None
+
+        return endpoint
+
+    def rate(self, endpoint: Optional[str]) -> float:
+        """Return the configured sample rate for `endpoint`."""
+        if endpoint is None:
+            return self.default_rate
+
+        if endpoint in self.rates:
+            return self.rates[endpoint]
+
+        blueprint, _, _ = endpoint.rpartition(".")
+        return self.rates.get(blueprint or endpoint, self.default_rate)
+
+    def volume_factor(self) -> float:
+        """Count a request, and return the factor to scale its rate by."""
+        now = self._clock()
+        with self._lock:
+            self._window_requests += 1
+            elapsed = now - self._window_start
+            if elapsed >= self.window:
+                self.requests_per_second = self._window_requests / elapsed
+                self._window_start = now
+                self._window_requests = 0
+
+            if not self.target_per_second or not self.requests_per_second:
+                return 1.0
+
+            return min(1.0, self.target_per_second / self.requests_per_second)
+
+
+traces_sampler = TracesSampler()
+
+
+def initialize_sentry(release: str, url_map: Optional[Map] = None):
     """Initialize Sentry application monitoring.
 
     Args:
         release: A string representing this application release number (such as
             a git sha).  Will be used as the Sentry "release" identifier. See
             the Sentry client configuration docs for details.
+        url_map: The application's URL map, used to find the endpoint and
+            blueprint of a request when choosing its trace sample rate.
     """
     sentry_dsn = os.environ.get("SENTRY_DSN", None)
     if sentry_dsn:
@@ -48,11 +194,24 @@ def initialize_sentry(release: str):
     environment = os.environ.get("ENV", None)
     log_config_change("SENTRY_LOG_ENVIRONMENT_AS", environment)
 
+    # Log trace sampling.
+    traces_sampler.configure(
+        default_rate=float(os.environ.get("SENTRY_TRACES_SAMPLE_RATE", 1.0)),
+        rates=parse_sample_rates(os.environ.get("SENTRY_TRACES_SAMPLE_RATES", "")),
+        target_per_second=float(os.environ.get("SENTRY_TRACES_PER_SECOND", 0.0)),
+        url_map=url_map,
+    )
+    log_config_change("SENTRY_TRACES_SAMPLE_RATE", traces_sampler.default_rate)
+    log_config_change("SENTRY_TRACES_SAMPLE_RATES", traces_sampler.rates)
+    log_config_change("SENTRY_TRACES_PER_SECOND", traces_sampler.target_per_second)
+
     sentry_sdk.init(
         before_send=before_send,
         dsn=sentry_dsn,
         environment=environment,
         integrations=[FlaskIntegration()],
         release=release,
-        traces_sample_rate=1.0,
+        # Every error is reported, whichever requests are traced.
+        sample_rate=1.0,
+        traces_sampler=traces_sampler,
     )
@@ -2,49 +2,138 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+from __future__ import annotations
+
+import functools
+import heapq
+import itertools
+
+from array import array
 from collections import namedtuple
 from typing import (
     Any,
     Callable,
+    Iterable,
+    Optional,
+    Sequence,
 )
-from types import SimpleNamespace
 
 Edge = namedtuple("Edge", ("child", "parent"))
-Node = namedtuple("Node", ("id", "children", "parents"))
 
 
-def graph(nodes: set[str], edges: set[Edge]) -> dict[str, Node]:
-    """Construct a graph dictionary from nodes and edges.
+class StackGraph:
+    """An array-backed graph of the revisions in a stack.
+
+    Nodes are numbered from zero in the order they were given. `ids` maps
+    node indices to node identifiers and `index` maps them back. Adjacency is
+    stored in compressed sparse row form: the children of node `i` are
+    `child_indices[child_offsets[i]:child_offsets[i + 1]]`, and its parents
+    are found the same way in `parent_offsets` and `parent_indices`.
+
+    Graphs are immutable once built, and hashable so layouts can be cached.
+    """
+
+    __slots__ = (
+        "ids",
+        "index",
+        "child_offsets",
+        "child_indices",
+        "parent_offsets",
+        "parent_indices",
+        "_hash",
+    )
+
+    def __init__(self, nodes: Iterable[str], edges: Iterable[Sequence[str]]):
+        self.ids = tuple(nodes)
+        self.index = {node: i for i, node in enumerate(self.ids)}
+        size = len(self.ids)
+
+        # Encode each edge as a single integer, ordered by parent for the
+        # children and by child for the parents. This de-duplicates edges and
+        # groups them by node without allocating a tuple for each one.
+        by_parent = sorted(
+            {self.index[parent] * size + self.index[child] for child, parent in edges}
+        )
+        by_child = sorted([code % size * size + code // size for code in by_parent])
+
+        self.child_offsets = self._offsets([code // size for code in by_parent], size)
+        self.child_indices = array("l", [code % size for code in by_parent])
+        self.parent_offsets = self._offsets([code // size for code in by_child], size)
+        self.parent_indices = array("l", [code % size for code in by_child])
+
+        self._hash = None
+
+    @staticmethod
+    def _offsets(groups: list[int], size: int) -> array:
+        """Return the row offsets for the sorted group of each adjacency entry."""
+        counts = [0] * (size + 1)
+        for group in groups:
+            counts[group + 1] += 1
+        return array("l", itertools.accumulate(counts))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, StackGraph):
+            return NotImplemented
+
+        return (
+            self.ids == other.ids
+            and self.child_offsets == other.child_offsets
+            and self.child_indices == other.child_indices
+        )
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash(
+                (
+                    self.ids,
+                    self.child_offsets.tobytes(),
+                    self.child_indices.tobytes(),
+                )
+            )
+        return self._hash
+
+    def children(self, i: int) -> array:
+        """Return the indices of the children of node `i`."""
+        return self.child_indices[self.child_offsets[i] : self.child_offsets[i + 1]]
+
+    def parents(self, i: int) -> array:
+        """Return the indices of the parents of node `i`."""
+        return self.parent_indices[self.parent_offsets[i] : self.parent_offsets[i + 1]]
+
+
+def graph(nodes: Iterable[str], edges: Iterable[Sequence[str]]) -> StackGraph:
+    """Construct a graph from nodes and edges.
 
     Args:
-        nodes: A set() of node identifiers which form the stack. Each
+        nodes: An iterable of node identifiers which form the stack. Each
             node identifier is most likely a string PHID, but isn't
             required to be.
-        edges: A set() of Edge objects, identifying the edges between
-            nodes in the stack. The "children" and "parents" fields of
-            each edge should contain a set of node identifiers.
+        edges: An iterable of Edge objects, or `(child, parent)` pairs such
+            as the "edges" of a stack returned by Lando API, identifying the
+            edges between nodes in the stack.
 
     Returns:
-        A dictionary mapping node identifiers to Node objects.
+        A StackGraph of the stack.
     """
-    g = {node: Node(id=node, children=set(), parents=set()) for node in nodes}
-
-    for e in edges:
-        g[e.parent].children.add(e.child)
-        g[e.child].parents.add(e.parent)
-
-    return g
+    return StackGraph(nodes, edges)
 
 
 def sort_stack_topological(
-    nodes: set[str], edges: set[Edge], *, key: Callable = lambda x: x
+    nodes: set[str] | StackGraph,
+    edges: Optional[set[Edge]] = None,
+    *,
+    key: Callable = lambda x: x,
 ) -> list[str]:
     """Return a topological sort of the stack revisions.
 
     Args:
         nodes: A set() of node identifiers which form the stack. Each
             node identifier is most likely a string PHID, but isn't
-            required to be.
+            required to be. A StackGraph may be passed instead, in which
+            case `edges` should be omitted.
         edges: A set() of Edge objects, identifying the edges between
             nodes in the stack. The "children" and "parents" fields of
             each edge should contain a set of node identifiers.
@@ -61,37 +150,58 @@ def sort_stack_topological(
     Raises:
         ValueError: If the provided stack contains a cycle.
     """
-    g = graph(nodes, edges)
-
-    sources = {node for node in g if not g[node].parents}
+    g = nodes if isinstance(nodes, StackGraph) else graph(nodes, edges)
+    parent_offsets = g.parent_offsets
+    child_offsets = g.child_offsets
+    child_indices = g.child_indices
+
+    # The number of parents of each node which have not been sorted yet.
+    pending = [parent_offsets[i + 1] - parent_offsets[i] for i in range(len(g))]
+
+    # Sources are kept in a heap ordered by their key, which is computed once
+    # when the node becomes a source. Nodes with equal keys are taken in the
+    # order they became sources, as the nodes themselves may not be orderable.
+    sequence = 0
+    sources = []
+    for i, count in enumerate(pending):
+        if not count:
+            sources.append((key(g.ids[i]), sequence, i))
+            sequence += 1
+    heapq.heapify(sources)
     order = []
 
     while sources:
-        node = min(sources, key=key)
-        sources.remove(node)
-        order.append(node)
+        _, _, i = heapq.heappop(sources)
+        order.append(g.ids[i])
 
-        for child in g.pop(node).children:
-            g[child].parents.remove(node)
+        for child in child_indices[child_offsets[i] : child_offsets[i + 1]]:
+            pending[child] -= 1
 
-            if not g[child].parents:
-                sources.add(child)
+            if not pending[child]:
+                heapq.heappush(sources, (key(g.ids[child]), sequence, child))
+                sequence += 1
 
-    if g:
+    if len(order) != len(g):
         raise ValueError("Provided graph has a cycle.")
 
     return order
 
 
 def draw_stack_graph(
-    nodes: set[str], edges: set[Edge], order: list[str]
+    nodes: set[str] | StackGraph,
+    edges: Optional[set[Edge]] = None,
+    order: Sequence[str] = (),
 ) -> tuple[int, list[dict[str, Any]]]:
     """Return metadata useful for representing a stack visually.
 
+    Layouts are cached per worker, keyed by the stack's graph and order, so
+    drawing an unchanged stack again skips the layout entirely.
+
     Args:
         nodes: A set() of node identifiers which form the stack. Each
             node identifier is most likely a string PHID, but isn't
-            required to be.
+            required to be. A StackGraph may be passed instead, in which
+            case `edges` should be omitted.
         edges: A set() of Edge objects, identifying the edges between
             nodes in the stack. The "children" and "parents" fields of
             each edge should contain a set of node identifiers.
@@ -110,61 +220,109 @@ def draw_stack_graph(
           - 'other': A list of columns which should connect vertically
                      from top to bottom.
     """
-    g = graph(nodes, edges)
-    next_node = []
-    drawing = SimpleNamespace(rows=[], width=0)
+    g = nodes if isinstance(nodes, StackGraph) else graph(nodes, edges)
+    width, rows = layout_stack_graph(g, tuple(order))
+
+    # The cached rows are shared, so hand out copies.
+    return width, [
+        {
+            **row,
+            "above": list(row["above"]),
+            "below": list(row["below"]),
+            "other": list(row["other"]),
+        }
+        for row in rows
+    ]
+
+
+@functools.lru_cache(maxsize=256)
+def layout_stack_graph(
+    g: StackGraph, order: tuple[str, ...]
+) -> tuple[int, tuple[dict[str, Any], ...]]:
+    """Lay out the stack graph drawing, see `draw_stack_graph`.
+
+    Each column of the drawing is either free or reserved for the next node
+    it connects to. The columns reserved for each node and a heap of free
+    columns are kept up to date as rows are placed, so placing a row doesn't
+    require scanning every column.
+
+    The rows are cached and shared, so their columns are stored as tuples.
+    """
+    child_offsets = g.child_offsets
+    child_indices = g.child_indices
+    position = array("l", [0]) * len(g)
+    for pos, node in enumerate(order):
+        position[g.index[node]] = pos
+
+    # The node index each column connects to next, or -1 if the column is free.
+    next_node = array("l")
+    # The columns reserved for each node index.
+    reserved = {}
+    # The columns currently reserved, and a heap of possibly free columns.
+    # Columns are lazily removed from the heap once they are reserved.
+    occupied = set()
+    free = []
+    rows = []
 
     def empty_column_or_new():
         """Return the index of an empty column or create a new one."""
-        if not next_node.count(None):
-            next_node.append(None)
-            drawing.width += 1
-            return drawing.width - 1
+        while free and next_node[free[0]] != -1:
+            heapq.heappop(free)
+
+        if free:
+            return free[0]
+
+        next_node.append(-1)
+        heapq.heappush(free, len(next_node) - 1)
+        return len(next_node) - 1
 
-        return next_node.index(None)
+    def reserve(col, i):
+        next_node[col] = i
+        occupied.add(col)
+        reserved.setdefault(i, []).append(col)
 
     # Iterate over the order and build the drawing.
     for node in order:
-        # What column should this node go in?
-        col = next_node.index(node) if next_node.count(node) else empty_column_or_new()
+        i = g.index[node]
 
-        # Calculate connections from earlier rows.
-        below = set()
-        for from_col in range(len(next_node)):
-            target = next_node[from_col]
-            if target == node:
-                below.add(from_col)
+        # Connect the columns from earlier rows which lead to this node.
+        # Because we've connected these columns they are now free.
+        below = sorted(reserved.pop(i, ()))
+        for from_col in below:
+            next_node[from_col] = -1
+            occupied.discard(from_col)
+            heapq.heappush(free, from_col)
 
-                # Because we've connected this column it should
-                # now be free.
-                next_node[from_col] = None
+        # What column should this node go in?
+        col = below[0] if below else empty_column_or_new()
 
         # What columns need to connect vertically to continue?
-        other = {i for i, target in enumerate(next_node) if target is not None}
+        other = sorted(occupied)
 
-        # Order the children for placement.
+        # Place the closest child in the order above the current node,
+        # and the remaining children in the first free columns.
         above = set()
-        if g[node].children:
-            # Place the closest child in the order above
-            # the current node.
-            closest = order[min([order.index(child) for child in g[node].children])]
-            next_node[col] = closest
+        children = sorted(
+            child_indices[child_offsets[i] : child_offsets[i + 1]],
+            key=position.__getitem__,
+        )
+        if children:
+            reserve(col, children[0])
             above.add(col)
 
-            for child in g[node].children:
-                if child != closest:
-                    position = empty_column_or_new()
-                    next_node[position] = child
-                    above.add(position)
+            for child in children[1:]:
+                position_col = empty_column_or_new()
+                reserve(position_col, child)
+                above.add(position_col)
 
-        drawing.rows.append(
+        rows.append(
             {
                 "node": node,
                 "pos": col,
-                "above": sorted(above),
-                "below": sorted(below),
-                "other": sorted(other),
+                "above": tuple(sorted(above)),
+                "below": tuple(below),
+                "other": tuple(other),
             }
         )
 
-    return drawing.width, drawing.rows
+    return len(next_node), tuple(rows)
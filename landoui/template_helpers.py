@@ -5,13 +5,15 @@
 from __future__ import annotations
 
 import datetime
+import functools
 import logging
 import re
 import urllib.parse
 
+from types import MappingProxyType
 from typing import Optional
 
-from flask import Blueprint, current_app, escape, session
+from flask import Blueprint, Markup, current_app, escape, session
 from landoui.forms import (
     ReasonCategory,
     TreeCategory,
@@ -40,6 +42,12 @@ TREESTATUS_USER_GROUPS = {
 
 @template_helpers.app_template_global()
 def is_treestatus_user() -> bool:
+    return helpers.get_request_memo().memoize(
+        ("is_treestatus_user",), _is_treestatus_user
+    )
+
+
+def _is_treestatus_user() -> bool:
     if not is_user_authenticated():
         return False
 
@@ -53,7 +61,10 @@ def is_treestatus_user() -> bool:
 
 @template_helpers.app_template_global()
 def user_has_phabricator_token() -> bool:
-    return helpers.get_phabricator_api_token() is not None
+    return helpers.get_request_memo().memoize(
+        ("user_has_phabricator_token",),
+        lambda: helpers.get_phabricator_api_token() is not None,
+    )
 
 
 @template_helpers.app_template_global()
@@ -66,6 +77,32 @@ def escape_html(text: str) -> str:
     return escape(text)
 
 
+# Matches the fractional seconds of an ISO 8601 timestamp, which
+# `datetime.fromisoformat` only accepts with exactly 3 or 6 digits before 3.11.
+FRACTIONAL_SECONDS_RE = re.compile(r"(?<=:\d\d)\.(\d+)")
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_timestamp(timestamp: str) -> datetime.datetime:
+    """Parse an ISO 8601 timestamp as returned by Lando API.
+
+    Timelines show the same timestamps repeatedly, so parsed values are cached.
+    """
+    if timestamp.endswith("Z"):
+        timestamp = timestamp[:-1] + "+00:00"
+    timestamp = FRACTIONAL_SECONDS_RE.sub(
+        lambda match: "." + match.group(1)[:6].ljust(6, "0"), timestamp, count=1
+    )
+    return datetime.datetime.fromisoformat(timestamp)
+
+
+def _duration(start: str, end: Optional[str], now: datetime.datetime) -> dict[str, int]:
+    time_end = parse_timestamp(end) if end else now
+    elapsed = time_end - parse_timestamp(start)
+    minutes, seconds = divmod(elapsed.total_seconds(), 60)
+    return {"minutes": int(minutes), "seconds": int(seconds)}
+
+
 @template_helpers.app_template_global()
 def calculate_duration(start: str, end: Optional[str] = None) -> dict[str, int]:
     """Calculates the duration between the two iso8061 timestamps.
@@ -73,94 +110,132 @@ def calculate_duration(start: str, end: Optional[str] = None) -> dict[str, int]:
     If end is None then the current time in UTC will be used.
     Returns a dict with the minutes and seconds as integers.
     """
-    if not end:
-        utc_tz = datetime.timezone.utc
-        end = datetime.datetime.utcnow().replace(tzinfo=utc_tz).isoformat()
+    return _duration(start, end, datetime.datetime.now(datetime.timezone.utc))
 
-    # Work around for ':' in timezone until we upgrade to Python 3.7.
-    # https://bugs.python.org/issue24954
-    start = start[:-3] + start[-2:]
-    end = end[:-3] + end[-2:]
 
-    time_start = datetime.datetime.strptime(start, "%Y-%m-%dT%H:%M:%S.%f%z")
-    time_end = datetime.datetime.strptime(end, "%Y-%m-%dT%H:%M:%S.%f%z")
-    elapsedTime = time_end - time_start
-    result = divmod(elapsedTime.total_seconds(), 60)
-    return {"minutes": int(result[0]), "seconds": int(result[1])}
+@template_helpers.app_template_global()
+def calculate_durations(
+    transplants: list[dict], *, start: str = "created_at", end: str = "updated_at"
+) -> list[dict[str, int]]:
+    """Calculate the duration of every transplant in a list at once.
+
+    Returns a list with the result of `calculate_duration` for the `start` and
+    `end` timestamps of each transplant, measured against the same current
+    time for any transplant without an `end`.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return [
+        _duration(transplant[start], transplant.get(end), now)
+        for transplant in transplants
+    ]
 
 
-@template_helpers.app_template_filter()
-def tostatusbadgeclass(status: dict) -> str:
-    mapping = {
+# Lookup tables for the status filters below, which are called for every
+# transplant, revision and reviewer shown on a page. Reviewer tables are keyed
+# by `(status, for_other_diff)`.
+TRANSPLANT_STATUS_BADGE_CLASSES = MappingProxyType(
+    {
         "aborted": "Badge Badge--negative",
         "submitted": "Badge Badge--warning",
         "in_progress": "Badge Badge--warning",
         "landed": "Badge Badge--positive",
         "failed": "Badge Badge--negative",
     }
-    return mapping.get(status["status"].lower(), "Badge Badge--negative")
+)
+TRANSPLANT_STATUS_BADGE_NAMES = MappingProxyType(
+    {
+        "aborted": "Aborted",
+        "submitted": "Landing queued",
+        "in_progress": "In progress",
+        "landed": "Successfully landed",
+        "failed": "Failed to land",
+    }
+)
+REVIEWER_STATUS_BADGE_CLASSES = MappingProxyType(
+    {
+        ("accepted", False): "Badge Badge--positive",
+        ("accepted", True): "Badge Badge--neutral",
+        ("rejected", False): "Badge Badge--negative",
+        ("rejected", True): "Badge Badge--warning",
+        ("added", False): "Badge",
+        ("added", True): "Badge",
+        ("blocking", False): "Badge",
+        ("blocking", True): "Badge",
+        ("resigned", False): "Badge",
+        ("resigned", True): "Badge",
+    }
+)
+REVIEWER_ACTION_TEXTS = MappingProxyType(
+    {
+        ("accepted", False): "accepted",
+        ("accepted", True): "accepted a prior diff",
+        ("rejected", False): "requested changes",
+        ("rejected", True): "requested changes to a prior diff",
+        ("added", False): "to review",
+        ("added", True): "to review",
+        ("blocking", False): "must review",
+        ("blocking", True): "must review",
+        ("resigned", False): "resigned",
+        ("resigned", True): "resigned",
+    }
+)
+TREESTATUS_STATUS_BADGE_CLASSES = MappingProxyType(
+    {
+        "open": "Badge Badge--positive",
+        "closed": "Badge Badge--negative",
+        "approval required": "Badge Badge--warning",
+    }
+)
+REVISION_STATUS_BADGE_CLASSES = MappingProxyType(
+    {
+        "abandoned": "Badge",
+        "accepted": "Badge Badge--positive",
+        "changes-planned": "Badge Badge--neutral",
+        "published": "Badge",
+        "needs-review": "Badge Badge--warning",
+        "needs-revision": "Badge Badge--negative",
+        "draft": "Badge Badge--neutral",
+    }
+)
+
+
+@template_helpers.app_template_filter()
+def tostatusbadgeclass(status: dict) -> str:
+    return TRANSPLANT_STATUS_BADGE_CLASSES.get(
+        status["status"].lower(), "Badge Badge--negative"
+    )
 
 
 @template_helpers.app_template_filter()
 def reviewer_to_status_badge_class(reviewer: dict) -> str:
-    return {
-        # status: (current_diff, for_other_diff),
-        "accepted": ("Badge Badge--positive", "Badge Badge--neutral"),
-        "rejected": ("Badge Badge--negative", "Badge Badge--warning"),
-        "added": ("Badge", "Badge"),
-        "blocking": ("Badge", "Badge"),
-        "resigned": ("Badge", "Badge"),
-    }.get(reviewer["status"], ("Badge Badge--warning", "Badge Badge--warning"))[
-        1 if reviewer["for_other_diff"] else 0
-    ]
+    return REVIEWER_STATUS_BADGE_CLASSES.get(
+        (reviewer["status"], bool(reviewer["for_other_diff"])), "Badge Badge--warning"
+    )
 
 
 @template_helpers.app_template_filter()
 def treestatus_to_status_badge_class(tree_status: str) -> str:
     """Convert Tree statuses into status badges."""
-    return {
-        "open": "Badge Badge--positive",
-        "closed": "Badge Badge--negative",
-        "approval required": "Badge Badge--warning",
-    }.get(tree_status, "Badge Badge--warning")
+    return TREESTATUS_STATUS_BADGE_CLASSES.get(tree_status, "Badge Badge--warning")
 
 
 @template_helpers.app_template_filter()
 def reviewer_to_action_text(reviewer: dict) -> str:
-    options = {
-        # status: (current_diff, for_other_diff),
-        "accepted": ("accepted", "accepted a prior diff"),
-        "rejected": ("requested changes", "requested changes to a prior diff"),
-        "added": ("to review", "to review"),
-        "blocking": ("must review", "must review"),
-        "resigned": ("resigned", "resigned"),
-    }.get(reviewer["status"], ("UNKNOWN STATE", "UNKNOWN STATE"))
-    return options[1 if reviewer["for_other_diff"] else 0]
+    return REVIEWER_ACTION_TEXTS.get(
+        (reviewer["status"], bool(reviewer["for_other_diff"])), "UNKNOWN STATE"
+    )
 
 
 @template_helpers.app_template_filter()
 def revision_status_to_badge_class(status: str) -> str:
-    return {
-        "abandoned": "Badge",
-        "accepted": "Badge Badge--positive",
-        "changes-planned": "Badge Badge--neutral",
-        "published": "Badge",
-        "needs-review": "Badge Badge--warning",
-        "needs-revision": "Badge Badge--negative",
-        "draft": "Badge Badge--neutral",
-    }.get(status, "Badge Badge--warning")
+    return REVISION_STATUS_BADGE_CLASSES.get(status, "Badge Badge--warning")
 
 
 @template_helpers.app_template_filter()
 def tostatusbadgename(status: dict) -> str:
-    mapping = {
-        "aborted": "Aborted",
-        "submitted": "Landing queued",
-        "in_progress": "In progress",
-        "landed": "Successfully landed",
-        "failed": "Failed to land",
-    }
-    return mapping.get(status["status"].lower(), status["status"].capitalize())
+    return TRANSPLANT_STATUS_BADGE_NAMES.get(
+        status["status"].lower(), status["status"].capitalize()
+    )
 
 
 @template_helpers.app_template_filter()
@@ -206,33 +281,93 @@ def avatar_url(url: str) -> str:
     return urllib.parse.urlunsplit(parsed_url)
 
 
+class Linkifier:
+    """Replace references in text with links, in a single pass over the text.
+
+    The patterns for each kind of link are combined into one alternation,
+    compiled once for each combination of kinds used. The result is the same
+    as applying the individual `linkify_*` filters one after another.
+    """
+
+    KINDS = ("bug", "revision_url", "faq", "sec_bug_docs")
+
+    def __init__(self, *, bugzilla_url: str, phabricator_url: str):
+        self.bugzilla_url = bugzilla_url
+        self.phabricator_url = phabricator_url
+        self._patterns = {
+            "bug": r"\bBug \d+\b",
+            "revision_url": r"\b" + re.escape(phabricator_url) + r"/D\d+\b",
+            "revision_id": r"\bD\d+\b",
+            "faq": r"\bFAQ\b",
+            "sec_bug_docs": r"\bSecurity Bug Approval Process\b",
+        }
+        self._compiled = {}
+
+    def linkify(self, text: str, kinds: tuple[str, ...] = KINDS) -> str:
+        """Return `text` with each of the given kinds of reference linked."""
+        pattern = self._compiled.get(kinds)
+        if pattern is None:
+            pattern = re.compile(
+                "|".join(f"(?P<{kind}>{self._patterns[kind]})" for kind in kinds),
+                flags=re.IGNORECASE,
+            )
+            self._compiled[kinds] = pattern
+
+        return pattern.sub(self._link, str(text))
+
+    def _link(self, match: re.Match) -> str:
+        kind = match.lastgroup
+        text = match.group()
+        if kind == "bug":
+            href = f"{self.bugzilla_url}/show_bug.cgi?id={text[4:]}"
+        elif kind == "revision_url":
+            href = text
+        elif kind == "revision_id":
+            return f'<a href="{self.phabricator_url}/{text}" target="_blank">{text}</a>'
+        elif kind == "faq":
+            href = FAQ_URL
+        else:
+            href = SEC_BUG_DOCS
+
+        return f'<a href="{href}">{text}</a>'
+
+
+@functools.lru_cache(maxsize=8)
+def _linkifier(bugzilla_url: str, phabricator_url: str) -> Linkifier:
+    return Linkifier(bugzilla_url=bugzilla_url, phabricator_url=phabricator_url)
+
+
+def get_linkifier() -> Linkifier:
+    """Return the `Linkifier` for the current app's configuration."""
+    return _linkifier(
+        current_app.config["BUGZILLA_URL"], current_app.config["PHABRICATOR_URL"]
+    )
+
+
+@template_helpers.app_template_filter()
+def linkify(text: str, *kinds: str) -> str:
+    """Linkify bug numbers, revision URLs, the FAQ and the sec-approval docs.
+
+    If any `kinds` are given, only those kinds of reference are linked, see
+    `Linkifier.KINDS`.
+    """
+    return get_linkifier().linkify(text, kinds or Linkifier.KINDS)
+
+
 @template_helpers.app_template_filter()
 def linkify_bug_numbers(text: str) -> str:
-    search = r"(?=\b)(Bug (\d+))(?=\b)"
-    replace = r'<a href="{bmo_url}/show_bug.cgi?id=\g<2>">\g<1></a>'.format(
-        bmo_url=current_app.config["BUGZILLA_URL"]
-    )
-    return re.sub(search, replace, str(text), flags=re.IGNORECASE)
+    return get_linkifier().linkify(text, ("bug",))
 
 
 @template_helpers.app_template_filter()
 def linkify_revision_urls(text: str) -> str:
-    search = (
-        r"(?=\b)(" + re.escape(current_app.config["PHABRICATOR_URL"]) + r"/D\d+)(?=\b)"
-    )
-    replace = r'<a href="\g<1>">\g<1></a>'
-    return re.sub(search, replace, str(text), flags=re.IGNORECASE)
+    return get_linkifier().linkify(text, ("revision_url",))
 
 
 @template_helpers.app_template_filter()
 def linkify_revision_ids(text: str) -> str:
     """Linkify revision IDs to proper Phabricator URLs."""
-    search = r"\b(D\d+)\b"
-    replace = (
-        rf'<a href="{current_app.config["PHABRICATOR_URL"]}/\g<1>" '
-        r'target="_blank">\g<1></a>'
-    )
-    return re.sub(search, replace, str(text), flags=re.IGNORECASE)
+    return get_linkifier().linkify(text, ("revision_id",))
 
 
 @template_helpers.app_template_filter()
@@ -252,16 +387,12 @@ def linkify_transplant_details(text: str, transplant: dict) -> str:
 
 @template_helpers.app_template_filter()
 def linkify_faq(text: str) -> str:
-    search = r"\b(FAQ)\b"
-    replace = r'<a href="{faq_url}">\g<1></a>'.format(faq_url=FAQ_URL)
-    return re.sub(search, replace, str(text), flags=re.IGNORECASE)
+    return get_linkifier().linkify(text, ("faq",))
 
 
 @template_helpers.app_template_filter()
 def linkify_sec_bug_docs(text: str) -> str:
-    search = r"\b(Security Bug Approval Process)\b"
-    replace = r'<a href="{docs_url}">\g<1></a>'.format(docs_url=SEC_BUG_DOCS)
-    return re.sub(search, replace, str(text), flags=re.IGNORECASE)
+    return get_linkifier().linkify(text, ("sec_bug_docs",))
 
 
 @template_helpers.app_template_filter()
@@ -367,6 +498,65 @@ def graph_below_path(col: int, below: int) -> str:
     return " ".join(commands)
 
 
+@template_helpers.app_template_global()
+def graph_drawing(width: int, drawing: dict) -> Markup:
+    """Return the SVG drawing of a row from `landoui.stacks.draw_stack_graph`."""
+    return _graph_drawing_svg(
+        width,
+        drawing["pos"],
+        tuple(drawing["above"]),
+        tuple(drawing["below"]),
+        tuple(drawing["other"]),
+    )
+
+
+@functools.lru_cache(maxsize=1024)
+def _graph_drawing_svg(
+    width: int,
+    pos: int,
+    above: tuple[int, ...],
+    below: tuple[int, ...],
+    other: tuple[int, ...],
+) -> Markup:
+    """Render the SVG for a row of the stack graph drawing.
+
+    Rows of a drawing are often identical apart from their node, even
+    across stacks, so the rendered SVG is cached by the row's layout.
+    """
+    parts = [
+        '<svg class="GraphDrawing" width="{}" height="{}" version="1.1" '
+        'xmlns="http://www.w3.org/2000/svg">'.format(
+            graph_width(width), GRAPH_DRAWING_HEIGHT
+        )
+    ]
+    parts.extend(
+        '<path d="{}" fill="none" stroke="{}" stroke-width="1"/>'.format(
+            graph_above_path(pos, target), graph_color(target)
+        )
+        for target in above
+    )
+    parts.extend(
+        '<path d="{}" fill="none" stroke="{}" stroke-width="1"/>'.format(
+            graph_below_path(pos, target), graph_color(target)
+        )
+        for target in below
+    )
+    parts.extend(
+        '<line x1="{x}" x2="{x}" y1="0" y2="{y}" stroke="{color}" '
+        'stroke-width="1"/>'.format(
+            x=graph_x_pos(target), y=GRAPH_DRAWING_HEIGHT, color=graph_color(target)
+        )
+        for target in other
+    )
+    parts.append(
+        '<circle cx="{x}" stroke="{color}" fill="{color}" cy="{y}" r="3"/>'.format(
+            x=graph_x_pos(pos), y=GRAPH_DRAWING_HEIGHT / 2, color=graph_color(pos)
+        )
+    )
+    parts.append("</svg>")
+    return Markup("".join(parts))
+
+
 @template_helpers.app_template_filter()
 def message_type_to_notification_class(flash_message_category: str) -> str:
     """Map a Flask flash message category to a Bulma notification CSS class.
@@ -0,0 +1,65 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import os
+import threading
+
+from typing import (
+    Callable,
+    Optional,
+)
+
+
+class BackgroundThread:
+    """A daemon thread which is started on demand in each process.
+
+    Threads do not survive a fork, so a thread started before one belongs
+    to another process. `ensure_started` starts a new thread in each process
+    which needs one, such as each uWSGI worker, however the application was
+    loaded. `target` should loop while `should_run` returns `True`.
+    """
+
+    def __init__(self, target: Callable[[], None], name: str):
+        self.target = target
+        self.name = name
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def ensure_started(self) -> bool:
+        """Start the thread if this process has none, returning `True` if so."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return False
+
+            self._pid = os.getpid()
+            self._stopped = threading.Event()
+            self._thread = threading.Thread(
+                target=self.target, name=self.name, daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """Ask the thread to stop, waking it if it is in `sleep`."""
+        with self._lock:
+            self._pid = None
+            self._stopped.set()
+
+    def current(self) -> Optional[threading.Thread]:
+        """Return the thread started in this process, if there is one."""
+        with self._lock:
+            return self._thread if self._pid == os.getpid() else None
+
+    def should_run(self) -> bool:
+        """Return `True` if the calling thread is this process's thread."""
+        return self.current() is threading.current_thread()
+
+    def sleep(self, seconds: float) -> bool:
+        """Wait for `seconds`, returning `False` if the thread should stop."""
+        self._stopped.wait(seconds)
+        return self.should_run()
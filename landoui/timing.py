@@ -0,0 +1,104 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import threading
+import time
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Callable,
+    Iterator,
+)
+
+
+@dataclass
+class Span:
+    """A timed phase of handling a request, in seconds."""
+
+    name: str
+    description: str
+    start: float
+    duration: float
+
+
+class RequestTimeline:
+    """Timed spans recorded while handling a single request.
+
+    A fresh timeline is created for each request (see
+    `landoui.helpers.get_request_timeline`). Spans are grouped by name, such
+    as the upstream service called or the phase of rendering, to give a
+    breakdown of where the time handling a request went. It is thread-safe
+    so it can be used by upstream requests issued concurrently, in which case
+    the total for a name may be more than the time the request took.
+    """
+
+    def __init__(self, *, clock: Callable[[], float] = time.perf_counter):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.origin = clock()
+        self.spans: list[Span] = []
+
+    def now(self) -> float:
+        """Return the current time on this timeline's clock."""
+        return self._clock()
+
+    @contextmanager
+    def span(self, name: str, description: str = "") -> Iterator[None]:
+        """Time the body of the `with` block as a span called `name`."""
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.record(name, description, start, self._clock() - start)
+
+    def record(self, name: str, description: str, start: float, duration: float):
+        """Record a span which started at `start` on this timeline's clock."""
+        with self._lock:
+            self.spans.append(
+                Span(
+                    name=name,
+                    description=description,
+                    start=start - self.origin,
+                    duration=duration,
+                )
+            )
+
+    def totals(self) -> dict[str, dict[str, Any]]:
+        """Return the number of spans and their total milliseconds, by name."""
+        totals = {}
+        with self._lock:
+            for span in self.spans:
+                total = totals.setdefault(span.name, {"count": 0, "ms": 0.0})
+                total["count"] += 1
+                total["ms"] += span.duration * 1000
+
+        for total in totals.values():
+            total["ms"] = round(total["ms"], 1)
+        return totals
+
+    def describe(self) -> list[dict[str, Any]]:
+        """Return every span in the order they started, for debugging."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+
+        return [
+            {
+                "name": span.name,
+                "description": span.description,
+                "start_ms": round(span.start * 1000, 1),
+                "ms": round(span.duration * 1000, 1),
+            }
+            for span in spans
+        ]
+
+    def server_timing(self) -> str:
+        """Return the totals as the value of a `Server-Timing` header."""
+        return ", ".join(
+            f'{name};dur={total["ms"]};desc="{total["count"]}"'
+            for name, total in self.totals().items()
+        )
@@ -2,17 +2,25 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import functools
 import logging
 
+from dataclasses import dataclass
+
 from flask import (
     Blueprint,
+    current_app,
     flash,
+    jsonify,
     redirect,
+    make_response,
     render_template,
     request,
+    session,
     url_for,
 )
 
+from landoui.cache import treestatus_cache
 from landoui.helpers import (
     is_user_authenticated,
     set_last_local_referrer,
@@ -30,6 +38,7 @@ from landoui.forms import (
     TreeStatusUpdateTreesForm,
     build_update_json_body,
 )
+from landoui.template_helpers import is_treestatus_user
 
 logger = logging.getLogger(__name__)
 
@@ -37,12 +46,106 @@ treestatus_blueprint = Blueprint("treestatus", __name__)
 treestatus_blueprint.before_request(set_last_local_referrer)
 
 
+@dataclass(frozen=True)
+class TreesSnapshot:
+    """The trees from Treestatus, shared between requests.
+
+    `trees` maps tree names to trees, and `ordered` holds the trees in the
+    order they are displayed. Snapshots are cached and must not be modified.
+    """
+
+    trees: dict[str, dict]
+    ordered: tuple[dict, ...]
+
+    def updated(self, names: list[str], changes: dict) -> "TreesSnapshot":
+        """Return a new snapshot with `changes` applied to the named trees."""
+        trees = {
+            name: {**tree, **changes} if name in names else tree
+            for name, tree in self.trees.items()
+        }
+        return TreesSnapshot(
+            trees=trees,
+            ordered=tuple(sorted(trees.values(), key=TreeCategory.sort_trees)),
+        )
+
+
+def fetch_trees(api: TreestatusAPI) -> TreesSnapshot:
+    """Retrieve the trees from Treestatus."""
+    trees = api.request("GET", "trees")["result"]
+    return TreesSnapshot(
+        trees=trees,
+        ordered=tuple(sorted(trees.values(), key=TreeCategory.sort_trees)),
+    )
+
+
+# The session key listing the cached Treestatus data which the user's next
+# request should fetch again, because the user has changed it.
+STALE_AFTER_WRITE_SESSION_KEY = "treestatus_stale"
+
+
+def mark_stale_after_write():
+    """Make the user's next reads of the trees and recent changes skip the cache.
+
+    Each worker has its own cache, so invalidating it only affects the worker
+    which handled the write. Flagging the user's session means the user sees
+    their own changes whichever worker handles their next request.
+    """
+    session[STALE_AFTER_WRITE_SESSION_KEY] = ["trees", "stack"]
+
+
+def is_stale_after_write(name: str) -> bool:
+    """Return `True` once if the user has changed `name` since reading it."""
+    stale = session.get(STALE_AFTER_WRITE_SESSION_KEY)
+    if not stale or name not in stale:
+        return False
+
+    remaining = [other for other in stale if other != name]
+    if remaining:
+        session[STALE_AFTER_WRITE_SESSION_KEY] = remaining
+    else:
+        session.pop(STALE_AFTER_WRITE_SESSION_KEY)
+    return True
+
+
+def get_trees(api: TreestatusAPI) -> TreesSnapshot:
+    """Return the trees from Treestatus, through the per-worker cache."""
+    if is_stale_after_write("trees"):
+        treestatus_cache.invalidate((api.url, "trees"))
+
+    return treestatus_cache.get((api.url, "trees"), functools.partial(fetch_trees, api))
+
+
+def refresh_trees(api: TreestatusAPI) -> TreesSnapshot:
+    """Return the trees from Treestatus, bypassing any cached snapshot."""
+    treestatus_cache.invalidate((api.url, "trees"))
+    return get_trees(api)
+
+
+def invalidate_trees(api: TreestatusAPI):
+    """Discard the cached trees and recent changes, after a change through `api`."""
+    treestatus_cache.invalidate((api.url, "trees"))
+    treestatus_cache.invalidate((api.url, "stack"))
+    mark_stale_after_write()
+
+
+def fetch_recent_changes_stack(api: TreestatusAPI) -> list[dict]:
+    """Retrieve the recent changes stack from Treestatus."""
+    return api.request("GET", "stack")["result"]
+
+
 def get_recent_changes_stack(api: TreestatusAPI) -> list[dict]:
-    """Retrieve recent changes stack data with error handling."""
+    """Retrieve recent changes stack data with error handling.
+
+    The recent changes are shared through the per-worker cache, and must not
+    be modified.
+    """
+    if is_stale_after_write("stack"):
+        treestatus_cache.invalidate((api.url, "stack"))
+
     try:
-        response = api.request(
-            "GET",
-            "stack",
+        return treestatus_cache.get(
+            (api.url, "stack"),
+            functools.partial(fetch_recent_changes_stack, api),
         )
     except LandoAPIError as exc:
         if not exc.detail:
@@ -51,30 +154,98 @@ def get_recent_changes_stack(api: TreestatusAPI) -> list[dict]:
         flash(f"Could not retrieve recent changes stack: {exc.detail}.", "error")
         return []
 
-    return response["result"]
 
+@dataclass(frozen=True)
+class RecentChange:
+    """A recent status change, with the values for its update form."""
+
+    change: dict
+    reason: str
+    reason_category: str
 
-def build_recent_changes_stack(
-    recent_changes_data: list[dict],
-) -> list[tuple[TreeStatusRecentChangesForm, dict]]:
+
+def build_recent_changes_stack(recent_changes_data: list[dict]) -> list[RecentChange]:
     """Build the recent changes stack object."""
     return [
-        (
-            TreeStatusRecentChangesForm(
-                id=change["id"],
-                reason=change["reason"],
-                reason_category=(
-                    change["trees"][0]["last_state"]["current_tags"][0]
-                    if change["trees"][0]["last_state"]["current_tags"]
-                    else ReasonCategory.NO_CATEGORY.value
-                ),
+        RecentChange(
+            change=change,
+            reason=change["reason"],
+            reason_category=(
+                change["trees"][0]["last_state"]["current_tags"][0]
+                if change["trees"][0]["last_state"]["current_tags"]
+                else ReasonCategory.NO_CATEGORY.value
             ),
-            change,
         )
         for change in recent_changes_data
     ]
 
 
+def get_recent_changes_context(api: TreestatusAPI) -> dict:
+    """Return the template context for the recent changes section.
+
+    The section is only shown to Treestatus users, so nothing is fetched or
+    built for anyone else. A single form is shared by every change, as only
+    the values of its fields differ between them.
+    """
+    if not is_treestatus_user():
+        return {"recent_changes_stack": [], "recent_changes_form": None}
+
+    recent_changes_stack = build_recent_changes_stack(get_recent_changes_stack(api))
+    return {
+        "recent_changes_stack": recent_changes_stack,
+        "recent_changes_form": (
+            TreeStatusRecentChangesForm() if recent_changes_stack else None
+        ),
+    }
+
+
+# The fields of a tree which are set by a `PATCH trees` request.
+TREE_UPDATE_FIELDS = ("status", "reason", "message_of_the_day", "tags")
+
+
+@dataclass(frozen=True)
+class TreesUpdate:
+    """The trees selected for an update, split by whether it changes them."""
+
+    changes: dict
+    changed: list[str]
+    unchanged: list[str]
+
+    def to_request_json(self) -> dict:
+        """Return the `PATCH trees` body, for the changed trees only."""
+        return {**self.changes, "trees": self.changed}
+
+
+def plan_trees_update(snapshot: TreesSnapshot, submitted: dict) -> TreesUpdate:
+    """Compare a submitted update with the current state of each tree.
+
+    Trees which are already in the submitted state would only gain a redundant
+    log entry, so they are left out of the update. Trees missing from the
+    snapshot are always updated, leaving Treestatus to report any error.
+    """
+    changes = {field: submitted[field] for field in TREE_UPDATE_FIELDS}
+    changes["remember"] = submitted["remember"]
+    changed, unchanged = [], []
+    for name in submitted["trees"]:
+        tree = snapshot.trees.get(name)
+        if tree is not None and all(
+            tree.get(field) == changes[field] for field in TREE_UPDATE_FIELDS
+        ):
+            unchanged.append(name)
+        else:
+            changed.append(name)
+
+    return TreesUpdate(changes=changes, changed=changed, unchanged=unchanged)
+
+
+def wants_json() -> bool:
+    """Return `True` if the client prefers a JSON response to a page."""
+    return (
+        request.accept_mimetypes.best_match(["text/html", "application/json"])
+        == "application/json"
+    )
+
+
 @treestatus_blueprint.route("/treestatus/", methods=["GET", "POST"])
 def treestatus():
     """Display the status of all the current trees.
@@ -95,65 +266,141 @@ def treestatus():
         treestatus_update_trees_form.is_submitted()
         and not treestatus_update_trees_form.validate()
     ):
+        if wants_json():
+            return (
+                jsonify(
+                    errors=[
+                        error
+                        for errors in treestatus_update_trees_form.errors.values()
+                        for error in errors
+                    ]
+                ),
+                400,
+            )
+
         # Flash form submission errors.
         for errors in treestatus_update_trees_form.errors.values():
             for error in errors:
                 flash(error, "warning")
 
-    trees_response = api.request("GET", "trees")
-    trees = trees_response.get("result")
+    snapshot = get_trees(api)
 
     if not treestatus_update_trees_form.trees.entries:
-        ordered_tree_choices = sorted(trees.values(), key=TreeCategory.sort_trees)
-        for tree in ordered_tree_choices:
+        for tree in snapshot.ordered:
             treestatus_update_trees_form.trees.append_entry(tree["tree"])
 
-    recent_changes_data = get_recent_changes_stack(api)
-    recent_changes_stack = build_recent_changes_stack(recent_changes_data)
-
     return render_template(
         "treestatus/trees.html",
-        recent_changes_stack=recent_changes_stack,
-        trees=trees,
+        trees=snapshot.trees,
         treestatus_update_trees_form=treestatus_update_trees_form,
+        **get_recent_changes_context(api),
     )
 
 
 def update_treestatus(api: TreestatusAPI, update_trees_form: TreeStatusUpdateTreesForm):
     """Handler for the tree status updating form.
 
-    This function handles form submission for the status updating form. Validate
-    the form submission and submit a request to LandoAPI, redirecting to the main
-    Treestatus page on success. Display an error message and return to the form if
-    the status updating rules were broken or the API returned an error.
+    This function handles form submission for the status updating form. The
+    submission is compared against the cached state of the trees, and only the
+    trees it changes are sent to LandoAPI. Trees which appear unchanged are
+    confirmed against a fresh copy first, so writes made elsewhere are not
+    missed. If that fresh copy was fetched, the cached trees are updated in
+    place rather than reloaded; otherwise they are invalidated.
+
+    Clients which accept JSON receive the result for each tree, along with
+    its new state. Otherwise redirect to the main Treestatus page on success,
+    or display an error message and return to the form if the status updating
+    rules were broken or the API returned an error.
     """
     if not is_user_authenticated():
         flash("Authentication is required to update tree statuses.")
         return redirect(request.referrer, code=401)
 
-    logger.info(f"Requesting tree status update.")
-
-    try:
-        api.request(
-            "PATCH",
-            "trees",
-            require_auth0=True,
-            json=update_trees_form.to_submitted_json(),
+    submitted = update_trees_form.to_submitted_json()
+    snapshot = get_trees(api)
+    update = plan_trees_update(snapshot, submitted)
+    refreshed = False
+    if update.unchanged:
+        snapshot = refresh_trees(api)
+        update = plan_trees_update(snapshot, submitted)
+        refreshed = True
+
+    if update.changed:
+        logger.info(f"Requesting tree status update for {len(update.changed)} trees.")
+
+        try:
+            api.request(
+                "PATCH",
+                "trees",
+                require_auth0=True,
+                json=update.to_request_json(),
+            )
+        except LandoAPIError as exc:
+            logger.info("Request to update trees status failed.")
+            if not exc.detail:
+                raise exc
+
+            if wants_json():
+                return jsonify(errors=[exc.detail]), exc.status_code or 500
+
+            flash(
+                f"Could not update trees: {exc.detail}. Please try again later.",
+                "error",
+            )
+            return redirect(request.referrer), 303
+
+        snapshot = snapshot.updated(
+            update.changed,
+            {field: update.changes[field] for field in TREE_UPDATE_FIELDS},
+        )
+        invalidate_trees(api)
+        if refreshed:
+            # The snapshot was fetched during this request, so the updated
+            # copy is as fresh as fetching it again.
+            treestatus_cache.set((api.url, "trees"), snapshot)
+
+    if wants_json():
+        return jsonify(
+            result={
+                name: {
+                    "result": "updated" if name in update.changed else "unchanged",
+                    "tree": snapshot.trees.get(name),
+                }
+                for name in submitted["trees"]
+            }
         )
-    except LandoAPIError as exc:
-        logger.info("Request to update trees status failed.")
-        if not exc.detail:
-            raise exc
 
-        flash(f"Could not update trees: {exc.detail}. Please try again later.", "error")
-        return redirect(request.referrer), 303
+    if update.unchanged:
+        flash(f"Already up to date: {', '.join(update.unchanged)}.")
 
     # Redirect to the main Treestatus page.
-    logger.info("Tree statuses updated successfully.")
-    flash("Tree statuses updated successfully.")
+    if update.changed:
+        logger.info("Tree statuses updated successfully.")
+        flash("Tree statuses updated successfully.")
+
     return redirect(url_for("treestatus.treestatus"))
 
 
+@treestatus_blueprint.route("/treestatus/recent_changes/", methods=["GET"])
+def recent_changes():
+    """Render the recent changes section on its own.
+
+    This allows the section to be loaded separately from the page it is shown
+    on. The response is private to the user, as it contains a CSRF token, and
+    may be cached by their browser for as long as the data is cached here.
+    """
+    api = TreestatusAPI.from_environment()
+    response = make_response(
+        render_template(
+            "treestatus/recent_changes.html", **get_recent_changes_context(api)
+        )
+    )
+    response.cache_control.private = True
+    response.cache_control.max_age = int(current_app.config["TREESTATUS_CACHE_TTL"])
+    response.vary.add("Cookie")
+    return response
+
+
 @treestatus_blueprint.route("/treestatus/new_tree/", methods=["GET", "POST"])
 def new_tree():
     """View for the new tree form."""
@@ -163,13 +410,10 @@ def new_tree():
     if treestatus_new_tree_form.validate_on_submit():
         return new_tree_handler(api, treestatus_new_tree_form)
 
-    recent_changes_data = get_recent_changes_stack(api)
-    recent_changes_stack = build_recent_changes_stack(recent_changes_data)
-
     return render_template(
         "treestatus/new_tree.html",
         treestatus_new_tree_form=treestatus_new_tree_form,
-        recent_changes_stack=recent_changes_stack,
+        **get_recent_changes_context(api),
     )
 
 
@@ -190,6 +434,7 @@ def new_tree_handler(api: TreestatusAPI, form: TreeStatusNewTreeForm):
             "PUT",
             f"trees/{tree}",
             require_auth0=True,
+            url_template="trees/{tree}",
             json={
                 "tree": tree,
                 "category": tree_category,
@@ -210,18 +455,65 @@ def new_tree_handler(api: TreestatusAPI, form: TreeStatusNewTreeForm):
         )
         return redirect(request.referrer), 303
 
+    invalidate_trees(api)
+
     logger.info(f"New tree {tree} created successfully.")
     flash(f"New tree {tree} created successfully.")
     return redirect(url_for("treestatus.treestatus"))
 
 
+@dataclass
+class LogPage:
+    """A page of a tree's status log, newest entries first."""
+
+    logs: list[dict]
+    page: int
+    has_next: bool
+
+
+def get_log_page(logs: list[dict], page: int) -> LogPage:
+    """Return the given page of `logs`, numbered from 1."""
+    page_size = current_app.config["TREESTATUS_LOG_PAGE_SIZE"]
+    page = max(page, 1)
+    start = (page - 1) * page_size
+    return LogPage(
+        logs=logs[start : start + page_size],
+        page=page,
+        has_next=len(logs) > start + page_size,
+    )
+
+
+def build_log_forms(
+    logs: list[dict],
+) -> list[tuple[TreeStatusLogUpdateForm, dict]]:
+    """Build the update form for each of the given log entries."""
+    return [
+        (
+            TreeStatusLogUpdateForm(
+                reason=log["reason"],
+                reason_category=log["tags"][0]
+                if log["tags"]
+                else ReasonCategory.NO_CATEGORY.value,
+            ),
+            log,
+        )
+        for log in logs
+    ]
+
+
 @treestatus_blueprint.route("/treestatus/<tree>/", methods=["GET"])
 def treestatus_tree(tree: str):
-    """Display the log of statuses for an individual tree."""
+    """Display the log of statuses for an individual tree.
+
+    The log is paginated by the `page` query parameter, and update forms are
+    only built for the entries on the requested page.
+    """
     api = TreestatusAPI.from_environment()
 
     try:
-        logs_response = api.request("GET", f"trees/{tree}/logs")
+        logs_response = api.request(
+            "GET", f"trees/{tree}/logs", url_template="trees/{tree}/logs"
+        )
     except LandoAPIError as exc:
         if not exc.detail or not exc.status_code:
             raise
@@ -244,29 +536,48 @@ def treestatus_tree(tree: str):
         return redirect(request.referrer)
 
     current_log = logs[0]
-
-    logs = [
-        (
-            TreeStatusLogUpdateForm(
-                reason=log["reason"],
-                reason_category=log["tags"][0]
-                if log["tags"]
-                else ReasonCategory.NO_CATEGORY.value,
-            ),
-            log,
-        )
-        for log in logs
-    ]
-
-    recent_changes_data = get_recent_changes_stack(api)
-    recent_changes_stack = build_recent_changes_stack(recent_changes_data)
+    log_page = get_log_page(logs, request.args.get("page", 1, type=int))
 
     return render_template(
         "treestatus/log.html",
         current_log=current_log,
-        logs=logs,
-        recent_changes_stack=recent_changes_stack,
+        logs=build_log_forms(log_page.logs),
+        log_page=log_page,
         tree=tree,
+        **get_recent_changes_context(api),
+    )
+
+
+@treestatus_blueprint.route("/treestatus/<tree>/logs", methods=["GET"])
+def treestatus_tree_logs(tree: str):
+    """Return a page of the log of statuses for a tree as JSON.
+
+    This allows the log to be loaded incrementally as it is scrolled,
+    without rendering forms for any entries.
+    """
+    api = TreestatusAPI.from_environment()
+
+    try:
+        logs_response = api.request(
+            "GET", f"trees/{tree}/logs", url_template="trees/{tree}/logs"
+        )
+    except LandoAPIError as exc:
+        if not exc.detail or not exc.status_code:
+            raise
+
+        return jsonify(errors=[exc.detail]), exc.status_code
+
+    log_page = get_log_page(
+        logs_response.get("result") or [], request.args.get("page", 1, type=int)
+    )
+    return jsonify(
+        result=log_page.logs,
+        page=log_page.page,
+        next=url_for(
+            "treestatus.treestatus_tree_logs", tree=tree, page=log_page.page + 1
+        )
+        if log_page.has_next
+        else None,
     )
 
 
@@ -308,6 +619,8 @@ def update_change(id: int):
         )
         return redirect(request.referrer), 303
 
+    invalidate_trees(api)
+
     logger.info(f"Stack entry {id} updated.")
     flash(action.message)
     return redirect(request.referrer)
@@ -354,6 +667,8 @@ def update_log(id: int):
         )
         return redirect(request.referrer), 303
 
+    invalidate_trees(api)
+
     logger.info(f"Log entry {id} updated.")
     flash("Log entry updated.")
     return redirect(request.referrer)
@@ -9,7 +9,10 @@ import json
 import pytest
 import socket
 
+from unittest.mock import patch
+
 from landoui.app import create_app
+from landoui.heartbeat import heartbeat_checker
 
 
 @pytest.fixture
@@ -50,18 +53,21 @@ def treestatus_url():
 
 @pytest.fixture
 def app(versionfile, docker_env_vars, api_url, treestatus_url):
-    app = create_app(
-        version_path=versionfile.strpath,
-        secret_key=str(binascii.b2a_hex(os.urandom(15))),
-        session_cookie_name="lando-ui",
-        session_cookie_domain="lando-ui.test:7777",
-        session_cookie_secure=False,
-        use_https=False,
-        enable_asset_pipeline=False,
-        lando_api_url=api_url,
-        treestatus_url=treestatus_url,
-        debug=True,
-    )
+    # Heartbeat checks are run by the tests which need them, rather than
+    # from a background thread.
+    with patch.object(heartbeat_checker, "start"):
+        app = create_app(
+            version_path=versionfile.strpath,
+            secret_key=str(binascii.b2a_hex(os.urandom(15))),
+            session_cookie_name="lando-ui",
+            session_cookie_domain="lando-ui.test:7777",
+            session_cookie_secure=False,
+            use_https=False,
+            enable_asset_pipeline=False,
+            lando_api_url=api_url,
+            treestatus_url=treestatus_url,
+            debug=True,
+        )
 
     # Turn on the TESTING setting so that exceptions within the app bubble up
     # to the test runner.  Otherwise Flask will hide the exception behind a
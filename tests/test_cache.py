@@ -0,0 +1,107 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import threading
+import time
+
+from unittest.mock import Mock
+
+import pytest
+
+from landoui.cache import TTLCache
+
+
+def test_ttl_cache_returns_cached_value():
+    cache = TTLCache("test", ttl=60)
+    fetch = Mock(return_value="value")
+
+    assert cache.get("key", fetch) == "value"
+    assert cache.get("key", fetch) == "value"
+    assert fetch.call_count == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_cache_refetches_expired_value():
+    cache = TTLCache("test", ttl=0)
+    fetch = Mock(side_effect=["first", "second"])
+
+    assert cache.get("key", fetch) == "first"
+    assert cache.get("key", fetch) == "second"
+
+
+def test_ttl_cache_serves_stale_value_while_refreshing():
+    cache = TTLCache("test", ttl=0, stale_ttl=60)
+    refreshed = threading.Event()
+
+    def refresh():
+        refreshed.set()
+        return "second"
+
+    assert cache.get("key", lambda: "first") == "first"
+    assert cache.get("key", refresh) == "first", "Stale value should be returned."
+    assert refreshed.wait(timeout=5), "Stale value should be refreshed."
+
+
+def test_ttl_cache_does_not_cache_errors():
+    cache = TTLCache("test", ttl=60)
+    fetch = Mock(side_effect=[ValueError, "value"])
+
+    with pytest.raises(ValueError):
+        cache.get("key", fetch)
+
+    assert cache.get("key", fetch) == "value"
+
+
+def test_ttl_cache_deduplicates_concurrent_misses():
+    cache = TTLCache("test", ttl=60)
+    fetch = Mock(side_effect=lambda: time.sleep(0.1) or "value")
+    results = []
+
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get("key", fetch)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["value"] * 5
+    assert fetch.call_count == 1
+
+
+def test_ttl_cache_invalidate():
+    cache = TTLCache("test", ttl=60)
+    fetch = Mock(side_effect=["first", "second", "third"])
+
+    assert cache.get("key", fetch) == "first"
+    cache.invalidate("key")
+    assert cache.get("key", fetch) == "second"
+    cache.invalidate()
+    assert cache.get("key", fetch) == "third"
+
+
+def test_ttl_cache_set():
+    cache = TTLCache("test", ttl=60)
+    fetch = Mock(return_value="fetched")
+
+    cache.set("key", "stored")
+    assert cache.get("key", fetch) == "stored"
+    fetch.assert_not_called()
+
+
+def test_ttl_cache_stats():
+    cache = TTLCache("test", ttl=60)
+    assert cache.stats()["hit_rate"] == 0.0
+    assert cache.stats()["max_age"] == 0.0
+
+    cache.get("key", lambda: "value")
+    cache.get("key", lambda: "value")
+    cache.get("key", lambda: "value")
+    cache.get("other", lambda: "value")
+
+    stats = cache.stats()
+    assert stats["hit_rate"] == 0.5
+    assert stats["max_age"] >= 0.0
+    assert stats["size"] == 2
@@ -4,23 +4,37 @@
 
 import json
 
+from unittest.mock import patch
+
+import pytest
 import requests
 import requests_mock
 
+from landoui.heartbeat import heartbeat_checker
+
+
+@pytest.fixture
+def heartbeat_checks(app):
+    """Check heartbeat services when called, rather than in the background."""
+    with patch.object(heartbeat_checker, "start"):
+        yield heartbeat_checker.check_all
+
 
 def test_dockerflow_lb_endpoint_returns_200(client):
     assert client.get("/__lbheartbeat__").status_code == 200
 
 
-def test_heartbeat_returns_200_if_lando_api_up(client, api_url):
+def test_heartbeat_returns_200_if_lando_api_up(client, api_url, heartbeat_checks):
     with requests_mock.mock() as m:
         m.get(api_url + "/__lbheartbeat__", status_code=200)
+        heartbeat_checks()
         assert client.get("/__heartbeat__").status_code == 200
 
 
-def test_heartbeat_returns_502_if_lando_api_down(client, api_url):
+def test_heartbeat_returns_502_if_lando_api_down(client, api_url, heartbeat_checks):
     with requests_mock.mock() as m:
         m.get(api_url + "/__lbheartbeat__", exc=requests.ConnectionError)
+        heartbeat_checks()
         assert client.get("/__heartbeat__").status_code == 502
 
 
@@ -33,3 +47,65 @@ def test_dockerflow_version_endpoint_response(client):
 def test_dockerflow_version_matches_disk_contents(client, versionfile):
     response = client.get("/__version__")
     assert response.json == json.load(versionfile.open())
+
+
+def test_request_summary_includes_timing(app, client):
+    with patch(
+        "landoui.landoapi.TreestatusAPI.request", return_value={"result": {}}
+    ), patch("landoui.dockerflow.request_logger") as request_logger:
+        response = client.get("/treestatus/")
+
+    assert response.status_code == 200
+    assert "render;dur=" in response.headers["Server-Timing"]
+
+    summary = request_logger.info.call_args.kwargs["extra"]
+    assert summary["timing"]["render"]["count"] == 1
+
+
+def test_heartbeat_does_not_wait_for_first_check(client, heartbeat_checks):
+    with requests_mock.mock() as m:
+        response = client.get("/__heartbeat__")
+
+        assert m.call_count == 0, "Services should not be checked inline."
+
+    assert response.status_code == 200
+    assert response.json["services"] == {"lando_api": False, "treestatus": False}
+    for check in response.json["checks"].values():
+        assert check["pending"]
+
+
+def test_heartbeat_is_cached(client, api_url, treestatus_url, heartbeat_checks):
+    with requests_mock.mock() as m:
+        m.get(api_url + "/__lbheartbeat__", status_code=200)
+        m.get(treestatus_url + "/__lbheartbeat__", status_code=200)
+
+        heartbeat_checks()
+        first = client.get("/__heartbeat__")
+        second = client.get("/__heartbeat__")
+
+        assert m.call_count == 2, "Each service should be checked once."
+
+    assert first.json["services"] == {"lando_api": True, "treestatus": True}
+    for name, check in second.json["checks"].items():
+        assert check["latency_ms"] == first.json["checks"][name]["latency_ms"]
+    for check in first.json["checks"].values():
+        assert check["healthy"]
+        assert not check["pending"]
+        assert check["latency_ms"] >= 0
+        assert check["age_seconds"] >= 0
+
+
+def test_heartbeat_ignores_treestatus_failure(
+    client, api_url, treestatus_url, heartbeat_checks
+):
+    with requests_mock.mock() as m:
+        m.get(api_url + "/__lbheartbeat__", status_code=200)
+        m.get(treestatus_url + "/__lbheartbeat__", status_code=503)
+
+        heartbeat_checks()
+        response = client.get("/__heartbeat__")
+
+    assert response.status_code == 200
+    assert response.json["services"]["treestatus"] is False
+    assert not response.json["checks"]["treestatus"]["critical"]
+    assert "503" in response.json["checks"]["treestatus"]["error"]
@@ -3,6 +3,7 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 from landoui.errorhandlers import UIError, RevisionNotFound
+from landoui.landoapi import LandoAPICircuitOpenException
 
 
 def test_unknown_route_shows_default_404_page(client):
@@ -36,6 +37,16 @@ def test_ui_error_shows_uierror_page(app, client):
     assert b"This error must be in the test error page" in response.get_data()
 
 
+def test_open_circuit_shows_communication_error_page(app, client):
+    @app.route("/_tests/circuitopen")
+    def bad_route():
+        raise LandoAPICircuitOpenException("LandoAPI is unavailable")
+
+    response = client.get("/_tests/circuitopen")
+    assert response.status_code == 500
+    assert b"Could not Communicate with Lando API" in response.get_data()
+
+
 def test_unexpected_error_shows_default_500_page(app, client):
     # Disable the TESTING and DEBUG flags to allow exceptions to propagate
     # up to the flask error handlers.
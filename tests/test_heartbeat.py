@@ -0,0 +1,102 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import time
+
+from unittest.mock import patch
+
+import requests_mock
+
+from landoui.heartbeat import HeartbeatChecker, HeartbeatService
+
+
+def make_checker(**services: HeartbeatService) -> HeartbeatChecker:
+    checker = HeartbeatChecker()
+    checker.configure(services=services, interval=10, timeout=1)
+    return checker
+
+
+def test_heartbeat_reports_pending_until_checked():
+    checker = make_checker(
+        lando_api=HeartbeatService("http://lando-api.test/lb"),
+        treestatus=HeartbeatService("http://treestatus.test/lb", critical=False),
+    )
+
+    with requests_mock.mock() as m, patch.object(checker, "start") as start:
+        statuses = checker.statuses()
+
+        start.assert_called_once()
+        assert m.call_count == 0, "Services should not be checked inline."
+
+    assert all(status.pending for status in statuses.values())
+    assert checker.healthy(statuses), "Pending services should not fail."
+
+    # A first check which never completes eventually fails the heartbeat.
+    pending_since = statuses["lando_api"].checked_at
+    with patch.object(checker, "start"), patch(
+        "landoui.heartbeat.time.monotonic", return_value=pending_since + 60
+    ):
+        statuses = checker.statuses()
+
+    assert not statuses["lando_api"].pending
+    assert not checker.healthy(statuses)
+
+
+def test_heartbeat_ignores_failing_non_critical_services():
+    checker = make_checker(
+        lando_api=HeartbeatService("http://lando-api.test/lb"),
+        treestatus=HeartbeatService("http://treestatus.test/lb", critical=False),
+    )
+
+    with requests_mock.mock() as m, patch.object(checker, "start"):
+        m.get("http://lando-api.test/lb", status_code=200)
+        m.get("http://treestatus.test/lb", status_code=500)
+        checker.check_all()
+        statuses = checker.statuses()
+
+    assert statuses["lando_api"].healthy
+    assert not statuses["treestatus"].healthy
+    assert "500" in statuses["treestatus"].error
+    assert checker.healthy(statuses)
+
+
+def test_heartbeat_checks_in_background():
+    checker = make_checker(lando_api=HeartbeatService("http://lando-api.test/lb"))
+
+    try:
+        with requests_mock.mock() as m:
+            m.get("http://lando-api.test/lb", status_code=200)
+            checker.start()
+
+            deadline = time.monotonic() + 5
+            status = checker.statuses()["lando_api"]
+            while status.pending:
+                assert time.monotonic() < deadline, "The first check should complete."
+                time.sleep(0.01)
+                status = checker.statuses()["lando_api"]
+    finally:
+        checker.stop()
+
+    assert status.healthy
+
+
+def test_heartbeat_reports_out_of_date_checks_as_unhealthy():
+    checker = make_checker(lando_api=HeartbeatService("http://lando-api.test/lb"))
+
+    with requests_mock.mock() as m, patch.object(checker, "start"):
+        m.get("http://lando-api.test/lb", status_code=200)
+        checker.check_all()
+        statuses = checker.statuses()
+
+    assert statuses["lando_api"].healthy
+    assert checker.healthy(statuses)
+
+    checked_at = statuses["lando_api"].checked_at
+    with patch.object(checker, "start"), patch(
+        "landoui.heartbeat.time.monotonic", return_value=checked_at + 60
+    ):
+        statuses = checker.statuses()
+
+    assert not statuses["lando_api"].healthy
+    assert statuses["lando_api"].error == "Heartbeat check is out of date"
+    assert not checker.healthy(statuses)
@@ -1,15 +1,40 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import functools
+import threading
+import time
+
 import pytest
 import requests
 import requests_mock
 
+from flask import session
+
+from landoui.cache import (
+    ConditionalRequestCache,
+    RequestMemo,
+)
 from landoui.landoapi import (
     LandoAPI,
+    LandoAPICircuitOpenException,
     LandoAPIError,
     LandoAPICommunicationException,
+    RequestExecutor,
+    ResponseDecoder,
+    SessionPool,
+    TreestatusAPI,
+    session_pool,
 )
+from landoui.resilience import (
+    AdaptiveTimeout,
+    CircuitBreaker,
+    CircuitState,
+    RetryPolicy,
+    UpstreamPolicy,
+)
+from landoui.metrics import metrics
+from landoui.timing import RequestTimeline
 
 
 @pytest.mark.parametrize(
@@ -102,3 +127,457 @@ def test_phabricator_api_token_in_request_header(api_url):
             api.request("GET", "stacks/D1")
 
         assert m.called
+
+
+def test_session_pool_reuses_sessions_per_url(api_url, treestatus_url):
+    pool = SessionPool()
+
+    assert pool.get(api_url) is pool.get(api_url)
+    assert pool.get(api_url) is not pool.get(treestatus_url)
+
+
+def test_session_pool_does_not_persist_cookies(api_url):
+    pool = SessionPool()
+    api = LandoAPI(api_url, session=pool.get(api_url))
+    with requests_mock.mock() as m:
+        m.get(
+            api_url + "/stacks/D1",
+            json={},
+            headers={"Set-Cookie": "sessionid=secret; Path=/"},
+        )
+        api.request("GET", "stacks/D1")
+
+    assert not pool.get(api_url).cookies
+
+
+def test_session_pool_reaps_idle_connections(api_url, monkeypatch):
+    pool = SessionPool(idle_timeout=0)
+    session = pool.get(api_url)
+
+    closed = []
+    monkeypatch.setattr(session, "close", lambda: closed.append(True))
+
+    assert pool.get(api_url) is not session, "Idle sessions should be replaced."
+    assert closed == [True], "Idle sessions should be closed."
+
+    pool.get(api_url)
+    assert closed == [True], "Idle sessions should only be closed once."
+
+
+def test_session_pool_does_not_reap_sessions_in_use(api_url, monkeypatch):
+    pool = SessionPool(idle_timeout=10)
+    session = pool.get(api_url)
+
+    closed = []
+    monkeypatch.setattr(session, "close", lambda: closed.append(True))
+
+    now = time.monotonic()
+    with pool.in_use(session):
+        monkeypatch.setattr("time.monotonic", lambda: now + 60)
+        assert pool.get(api_url) is session, "Sessions in use should be kept."
+
+    assert pool.get(api_url) is session, "Idle time should start after use."
+    assert not closed
+
+
+def test_session_pool_sized_for_executor_and_request_threads(app):
+    assert (
+        app.config["HTTP_POOL_MAXSIZE"] == app.config["UPSTREAM_REQUEST_WORKERS"] + 10
+    )
+    assert session_pool.pool_maxsize == app.config["HTTP_POOL_MAXSIZE"]
+
+
+def test_from_environment_uses_pooled_session(app):
+    with app.test_request_context("/"):
+        assert LandoAPI.from_environment().session is (
+            LandoAPI.from_environment().session
+        )
+        assert TreestatusAPI.from_environment().session is not (
+            LandoAPI.from_environment().session
+        )
+
+
+def test_shared_client_has_no_request_state(app):
+    with app.test_request_context("/"):
+        session["access_token"] = "access-token"
+        api = LandoAPI.from_environment(token="phabricator-token")
+        shared = api.shared_client()
+
+    assert isinstance(shared, LandoAPI)
+    assert shared.url == api.url
+    assert shared.session is api.session
+    assert shared.policy is api.policy
+    assert shared.auth0_access_token is None
+    assert shared.phabricator_api_token is None
+    assert shared.deadline is None
+    assert shared.memo is None
+    assert shared.timeline is None
+
+
+def test_request_executor_runs_calls_concurrently():
+    executor = RequestExecutor(max_workers=3)
+    barrier = threading.Barrier(3, timeout=5)
+
+    def call(value):
+        # Each call blocks until all three are running at the same time.
+        barrier.wait()
+        return value
+
+    assert executor.gather(*(functools.partial(call, i) for i in range(3))) == [
+        0,
+        1,
+        2,
+    ]
+
+
+def test_request_executor_raises_earliest_exception(api_url):
+    executor = RequestExecutor(max_workers=3)
+    api = LandoAPI(api_url)
+    with requests_mock.mock() as m:
+        m.get(api_url + "/uplift", json={"repos": []})
+        m.get(api_url + "/stacks/D1", status_code=404, json={"detail": "missing"})
+        m.get(api_url + "/transplants", exc=requests.ConnectionError)
+
+        with pytest.raises(LandoAPIError) as exc_info:
+            executor.gather(
+                functools.partial(api.request, "GET", "uplift"),
+                functools.partial(api.request, "GET", "stacks/D1"),
+                functools.partial(api.request, "GET", "transplants"),
+            )
+
+        assert exc_info.value.status_code == 404
+
+        with pytest.raises(LandoAPICommunicationException):
+            executor.gather(
+                functools.partial(api.request, "GET", "uplift"),
+                functools.partial(api.request, "GET", "transplants"),
+            )
+
+
+def test_conditional_request_served_from_cache_on_not_modified(api_url):
+    cache = ConditionalRequestCache()
+    api = LandoAPI(api_url, conditional_cache=cache)
+    with requests_mock.mock() as m:
+        m.get(
+            api_url + "/stacks/D1",
+            [
+                {"json": {"revisions": []}, "headers": {"ETag": '"abc"'}},
+                {"status_code": 304},
+            ],
+        )
+
+        first = api.request("GET", "stacks/D1")
+        first["revisions"].append("modified by caller")
+        second = api.request("GET", "stacks/D1")
+
+        assert m.request_history[1].headers["If-None-Match"] == '"abc"'
+
+    assert second == {"revisions": []}, "Callers should get their own copy."
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_conditional_request_cache_keyed_by_identity(api_url):
+    cache = ConditionalRequestCache()
+    with requests_mock.mock() as m:
+        m.get(api_url + "/stacks/D1", json={}, headers={"ETag": '"abc"'})
+
+        LandoAPI(api_url, phabricator_api_token="a", conditional_cache=cache).request(
+            "GET", "stacks/D1"
+        )
+        LandoAPI(api_url, phabricator_api_token="b", conditional_cache=cache).request(
+            "GET", "stacks/D1"
+        )
+
+        assert "If-None-Match" not in m.request_history[1].headers
+
+
+def test_conditional_request_cache_evicts_least_recently_used():
+    cache = ConditionalRequestCache(max_bytes=10)
+    cache.store("a", b"12345", etag="a")
+    cache.store("b", b"12345", etag="b")
+    cache.get("a")
+    cache.store("c", b"12345", etag="c")
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    assert cache.stats()["bytes"] == 10
+
+
+def test_conditional_request_cache_counts_misses_on_lookup(api_url):
+    cache = ConditionalRequestCache()
+    api = LandoAPI(api_url, conditional_cache=cache)
+    with requests_mock.mock() as m:
+        m.get(api_url + "/stacks/D1", json={})
+        m.get(api_url + "/stacks/D2", json={}, headers={"ETag": '"abc"'})
+
+        api.request("GET", "stacks/D1")
+        api.request("GET", "stacks/D2")
+        api.request("GET", "stacks/D2")
+
+    assert cache.stats() == {"hits": 0, "misses": 3, "size": 1, "bytes": 2}
+
+
+def test_conditional_request_cache_requires_validators():
+    cache = ConditionalRequestCache()
+    cache.store("a", b"{}")
+
+    assert cache.get("a") is None
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson"])
+def test_response_decoder_backends(backend):
+    if backend == "orjson":
+        pytest.importorskip("orjson")
+
+    decoder = ResponseDecoder(backend=backend)
+
+    assert decoder.decode('{"title": "Bug 1 – ✓"}'.encode()) == {"title": "Bug 1 – ✓"}
+    with pytest.raises(ValueError):
+        decoder.decode(b"invalid } json {[[")
+
+
+def test_response_decoder_unknown_backend():
+    with pytest.raises(ValueError):
+        ResponseDecoder(backend="yaml")
+
+
+def test_circuit_breaker_fails_fast_when_open(api_url):
+    policy = UpstreamPolicy(
+        circuit_breaker=CircuitBreaker("LandoAPI", failure_threshold=2),
+        timeout=AdaptiveTimeout(),
+    )
+    api = LandoAPI(api_url, policy=policy)
+    with requests_mock.mock() as m:
+        m.get(api_url + "/stacks/D1", exc=requests.ConnectionError)
+
+        for _ in range(2):
+            with pytest.raises(LandoAPICommunicationException):
+                api.request("GET", "stacks/D1")
+
+        with pytest.raises(LandoAPICircuitOpenException):
+            api.request("GET", "stacks/D1")
+
+        assert m.call_count == 2, "No request should be sent while the circuit is open."
+
+
+def test_gateway_errors_count_as_failures(api_url):
+    policy = UpstreamPolicy(
+        circuit_breaker=CircuitBreaker("LandoAPI", failure_threshold=1),
+        timeout=AdaptiveTimeout(),
+    )
+    api = LandoAPI(api_url, policy=policy)
+    with requests_mock.mock() as m:
+        m.get(api_url + "/stacks/D1", status_code=504, text="{}")
+
+        with pytest.raises(LandoAPIError):
+            api.request("GET", "stacks/D1")
+
+    assert policy.circuit_breaker.state == CircuitState.OPEN
+
+
+def test_adaptive_timeout_sent_with_request(api_url):
+    policy = UpstreamPolicy(
+        circuit_breaker=CircuitBreaker("LandoAPI"),
+        timeout=AdaptiveTimeout(initial=7, connect=2),
+    )
+    api = LandoAPI(api_url, policy=policy)
+    with requests_mock.mock() as m:
+        m.get(api_url + "/stacks/D1", json={})
+        api.request("GET", "stacks/D1")
+
+        assert m.last_request.timeout == (2, 7)
+
+
+def test_adaptive_timeout_grows_after_read_timeouts(api_url):
+    policy = UpstreamPolicy(
+        circuit_breaker=CircuitBreaker("LandoAPI", failure_threshold=1000),
+        timeout=AdaptiveTimeout(minimum=2, maximum=30, connect=3, min_samples=5),
+    )
+    api = LandoAPI(api_url, policy=policy)
+    with requests_mock.mock() as m:
+        m.get(api_url + "/stacks/D1", json={})
+        for _ in range(20):
+            api.request("GET", "stacks/D1")
+
+        assert m.last_request.timeout == (3, 2)
+
+        m.get(api_url + "/stacks/D1", exc=requests.ReadTimeout)
+        for _ in range(20):
+            with pytest.raises(LandoAPICommunicationException):
+                api.request("GET", "stacks/D1")
+
+        assert m.last_request.timeout == (3, 30)
+
+
+def test_fast_reads_do_not_shorten_write_timeouts(api_url):
+    policy = UpstreamPolicy(
+        circuit_breaker=CircuitBreaker("LandoAPI"),
+        timeout=AdaptiveTimeout(initial=30, minimum=1, connect=2, min_samples=5),
+    )
+    api = LandoAPI(api_url, policy=policy)
+    with requests_mock.mock() as m:
+        m.get(api_url + "/stacks/D1", json={})
+        m.post(api_url + "/transplants", json={})
+        for _ in range(20):
+            api.request("GET", "stacks/D1")
+
+        assert m.last_request.timeout == (2, 1)
+
+        api.request("POST", "transplants")
+
+        assert m.last_request.timeout == (2, 30)
+
+
+def test_retries_connection_errors_for_reads(api_url, monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    policy = UpstreamPolicy(
+        circuit_breaker=CircuitBreaker("LandoAPI"),
+        timeout=AdaptiveTimeout(),
+        retry=RetryPolicy(attempts=3),
+    )
+    timeline = RequestTimeline()
+    api = LandoAPI(api_url, policy=policy, timeline=timeline)
+    with requests_mock.mock() as m:
+        m.get(
+            api_url + "/stacks/D1",
+            [{"exc": requests.ConnectionError}, {"json": {"revisions": []}}],
+        )
+        m.post(api_url + "/transplants", exc=requests.ConnectionError)
+
+        assert api.request("GET", "stacks/D1") == {"revisions": []}
+        assert policy.retry.retries == 1
+        assert timeline.totals()["retry"]["count"] == 1
+
+        with pytest.raises(LandoAPICommunicationException):
+            api.request("POST", "transplants")
+
+        assert m.call_count == 3, "POST requests should not be retried."
+
+
+def test_retries_stop_at_deadline(api_url):
+    policy = UpstreamPolicy(
+        circuit_breaker=CircuitBreaker("LandoAPI"),
+        timeout=AdaptiveTimeout(),
+        retry=RetryPolicy(attempts=3),
+    )
+    api = LandoAPI(api_url, policy=policy, deadline=time.monotonic())
+    with requests_mock.mock() as m:
+        m.get(api_url + "/stacks/D1", exc=requests.ConnectionError)
+
+        with pytest.raises(LandoAPICommunicationException):
+            api.request("GET", "stacks/D1")
+
+        assert m.call_count == 1
+
+
+def test_request_memo_serves_repeated_reads(api_url):
+    memo = RequestMemo()
+    api = LandoAPI(api_url, memo=memo)
+    with requests_mock.mock() as m:
+        m.get(api_url + "/stack", json={"result": []})
+        m.patch(api_url + "/trees", json={})
+
+        first = api.request("GET", "stack")
+        first["result"].append("modified by caller")
+
+        assert api.request("GET", "stack") == {"result": []}
+        assert m.call_count == 1
+
+        api.request("PATCH", "trees")
+        api.request("GET", "stack")
+        assert m.call_count == 3, "Writes should discard memoized reads."
+
+    assert memo.describe()["hits"] == 1
+
+
+def test_request_memo_keyed_by_params_and_identity(api_url):
+    memo = RequestMemo()
+    with requests_mock.mock() as m:
+        m.get(api_url + "/transplants", json={})
+
+        api = LandoAPI(api_url, memo=memo, phabricator_api_token="a")
+        api.request("GET", "transplants", params={"stack_revision_id": "D1"})
+        api.request("GET", "transplants", params={"stack_revision_id": "D2"})
+        LandoAPI(api_url, memo=memo, phabricator_api_token="b").request(
+            "GET", "transplants", params={"stack_revision_id": "D1"}
+        )
+
+        assert m.call_count == 3
+
+
+def test_request_memo_does_not_store_errors(api_url):
+    memo = RequestMemo()
+    api = LandoAPI(api_url, memo=memo)
+    with requests_mock.mock() as m:
+        m.get(api_url + "/stacks/D1", status_code=404, json={})
+
+        for _ in range(2):
+            with pytest.raises(LandoAPIError):
+                api.request("GET", "stacks/D1")
+
+        assert m.call_count == 2
+
+
+def test_from_environment_memo_is_request_scoped(app):
+    with app.app_context(), app.test_request_context("/"):
+        memo = LandoAPI.from_environment().memo
+        assert TreestatusAPI.from_environment().memo is memo
+
+    with app.app_context(), app.test_request_context("/"):
+        assert LandoAPI.from_environment().memo is not memo
+
+
+def test_request_records_spans_on_timeline(api_url):
+    timeline = RequestTimeline()
+    api = LandoAPI(api_url, memo=RequestMemo(), timeline=timeline)
+    with requests_mock.mock() as m:
+        m.get(api_url + "/stacks/D1", json={})
+
+        api.request("GET", "stacks/D1")
+        api.request("GET", "stacks/D1")
+
+    assert [(span["name"], span["description"]) for span in timeline.describe()] == [
+        ("landoapi", "GET stacks/D1"),
+        ("decode", ""),
+        ("decode", ""),
+    ]
+
+
+def test_request_records_upstream_metrics(api_url):
+    metrics.configure()
+    api = LandoAPI(api_url)
+    with requests_mock.mock() as m:
+        m.get(api_url + "/stacks/D1", json={})
+        m.get(api_url + "/stacks/D2", exc=requests.ConnectionError)
+
+        api.request("GET", "stacks/D1")
+        with pytest.raises(LandoAPICommunicationException):
+            api.request("GET", "stacks/D2")
+
+    text = metrics.render()
+    for status in ("200", "error"):
+        assert (
+            "lando_ui_upstream_request_duration_seconds_count"
+            '{method="GET",path="stacks/D{id}",service="LandoAPI",'
+            f'status="{status}"}} 1'
+        ) in text
+    assert 'lando_ui_upstream_requests_in_flight{service="LandoAPI"} 0' in text
+
+
+def test_request_metrics_labelled_by_url_template(treestatus_url):
+    metrics.configure()
+    api = TreestatusAPI(treestatus_url)
+    with requests_mock.mock() as m:
+        for tree in ("aaa", "bbb"):
+            m.get(f"{treestatus_url}/trees/{tree}/logs", json={})
+            api.request("GET", f"trees/{tree}/logs", url_template="trees/{tree}/logs")
+
+    text = metrics.render()
+    assert (
+        "lando_ui_upstream_request_duration_seconds_count"
+        '{method="GET",path="trees/{tree}/logs",service="Treestatus",'
+        'status="200"} 2'
+    ) in text
+    assert "aaa" not in text
@@ -0,0 +1,148 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import io
+import json
+import logging
+import sys
+import threading
+
+import pytest
+
+from landoui.logging import AsyncStreamHandler, MozLogFormatter, orjson
+
+
+def make_record(**extra) -> logging.LogRecord:
+    record = logging.LogRecord(
+        "request.summary", logging.INFO, __file__, 1, "request summary", None, None
+    )
+    record.__dict__.update(extra)
+    return record
+
+
+@pytest.mark.parametrize("sort_keys", [True, False])
+@pytest.mark.parametrize("encoder", ["json", "orjson"])
+def test_mozlog_formatter(encoder, sort_keys):
+    if encoder == "orjson":
+        pytest.importorskip("orjson")
+
+    formatter = MozLogFormatter(
+        mozlog_logger="lando-ui", sort_keys=sort_keys, encoder=encoder
+    )
+    record = make_record(path="/D1/", code=200, t=12)
+    formatted = json.loads(formatter.format(record))
+
+    assert formatted == {
+        "EnvVersion": "2.0",
+        "Hostname": formatter.hostname,
+        "Logger": "lando-ui",
+        "Type": "request.summary",
+        "Timestamp": int(record.created * 1e9),
+        "Severity": MozLogFormatter.SL_INFO,
+        "Pid": record.process,
+        "Fields": {"path": "/D1/", "code": 200, "t": 12, "msg": "request summary"},
+    }
+
+
+@pytest.mark.parametrize("encoder", ["json", "orjson"])
+def test_mozlog_formatter_non_str_keys(encoder):
+    if encoder == "orjson":
+        pytest.importorskip("orjson")
+
+    formatter = MozLogFormatter(sort_keys=False, encoder=encoder)
+    record = make_record(counts={1: "one", 2: "two"}, big=2 ** 70)
+    fields = json.loads(formatter.format(record))["Fields"]
+
+    assert fields["counts"] == {"1": "one", "2": "two"}
+    assert fields["big"] == 2 ** 70
+
+
+def test_mozlog_formatter_sort_keys():
+    record = make_record(zebra=1, apple=2)
+
+    formatted = MozLogFormatter(sort_keys=True).format(record)
+    assert formatted == json.dumps(json.loads(formatted), sort_keys=True)
+
+    fields = json.loads(MozLogFormatter(sort_keys=False).format(record))["Fields"]
+    assert list(fields) == ["zebra", "apple", "msg"]
+
+
+def test_mozlog_formatter_exception():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = make_record(exc_info=sys.exc_info())
+
+    fields = json.loads(MozLogFormatter().format(record))["Fields"]
+    assert fields["exc"]["error"] == "ValueError('boom')"
+    assert "raise ValueError" in fields["exc"]["traceback"]
+
+
+def test_mozlog_formatter_encoder():
+    with pytest.raises(ValueError):
+        MozLogFormatter(encoder="yaml")
+
+    expected = "json" if orjson is None else "orjson"
+    assert MozLogFormatter(encoder="auto").encoder == expected
+
+
+class SlowStream(io.StringIO):
+    """A stream whose writes block until they are released."""
+
+    def __init__(self):
+        super().__init__()
+        self.writing = threading.Event()
+        self.release = threading.Event()
+        self.writes = 0
+
+    def write(self, text):
+        self.writing.set()
+        self.release.wait(timeout=5)
+        self.writes += 1
+        return super().write(text)
+
+
+def async_handler(stream, **kwargs) -> AsyncStreamHandler:
+    handler = AsyncStreamHandler(stream, **kwargs)
+    handler.setFormatter(logging.Formatter("%(msg)s"))
+    return handler
+
+
+def test_async_stream_handler_writes_in_batches():
+    stream = SlowStream()
+    handler = async_handler(stream, batch_size=100)
+
+    # The first record holds up the writer until the rest are queued.
+    handler.handle(make_record(msg="0"))
+    assert stream.writing.wait(timeout=5)
+    for i in range(1, 10):
+        handler.handle(make_record(msg=str(i)))
+    stream.release.set()
+    handler.close()
+
+    assert stream.getvalue().split() == [str(i) for i in range(10)]
+    assert stream.writes == 2
+    assert handler.stats() == {"queued": 0, "dropped": 0}
+
+
+def test_async_stream_handler_drops_oldest_records():
+    stream = SlowStream()
+    handler = async_handler(stream, queue_size=3)
+
+    handler.handle(make_record(msg="0"))
+    assert stream.writing.wait(timeout=5)
+    for i in range(1, 6):
+        handler.handle(make_record(msg=str(i)))
+
+    assert handler.stats() == {"queued": 3, "dropped": 2}
+
+    stream.release.set()
+    handler.close()
+
+    assert stream.getvalue().splitlines() == [
+        "0",
+        "3",
+        "4",
+        "5",
+        "log records dropped",
+    ]
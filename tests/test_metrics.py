@@ -0,0 +1,124 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import json
+import os
+import subprocess
+import sys
+import time
+
+from landoui.metrics import (
+    MetricsRegistry,
+    labels,
+    metrics,
+    path_template,
+    render,
+)
+
+
+def test_path_template():
+    assert path_template("stacks/D1234") == "stacks/D{id}"
+    assert path_template("trees/autoland/logs") == "trees/autoland/logs"
+    assert path_template("log/12?x=1") == "log/{id}"
+
+
+def test_histogram_buckets():
+    registry = MetricsRegistry()
+    registry.configure(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        registry.observe("latency_seconds", labels(endpoint="page"), value)
+
+    text = registry.render()
+    assert 'latency_seconds_bucket{endpoint="page",le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{endpoint="page",le="1"} 3' in text
+    assert 'latency_seconds_bucket{endpoint="page",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{endpoint="page"} 4' in text
+    assert 'latency_seconds_sum{endpoint="page"} 5.65' in text
+
+
+def test_render_sums_workers_and_drops_stale_gauges():
+    def snapshot(pid, age, requests, in_flight):
+        return {
+            "pid": pid,
+            "time": time.time() - age,
+            "buckets": [1.0],
+            "counters": [["hits_total", [["cache", "trees"]], requests]],
+            "gauges": [["in_flight", [], in_flight]],
+            "histograms": [
+                [
+                    "latency_seconds",
+                    [],
+                    {"buckets": [requests, 0], "sum": 0.5, "count": requests},
+                ]
+            ],
+        }
+
+    text = render(
+        [snapshot(1, 0, 3, 2), snapshot(2, 1, 4, 1), snapshot(3, 60, 5, 7)],
+        stale_after=15,
+    )
+
+    assert 'hits_total{cache="trees"} 12' in text
+    assert "in_flight 3" in text
+    assert "latency_seconds_count 12" in text
+
+
+def test_registry_shares_snapshots_through_directory(tmp_path):
+    registry = MetricsRegistry()
+    registry.configure(directory=str(tmp_path))
+    registry.observe("latency_seconds", (), 0.2)
+
+    other = registry.snapshot()
+    other["pid"] = -1
+    (tmp_path / "metrics--1.json").write_text(json.dumps(other))
+
+    assert "latency_seconds_count 2" in registry.render()
+
+
+def test_registry_retires_snapshots_of_exited_workers(tmp_path):
+    registry = MetricsRegistry()
+    registry.configure(directory=str(tmp_path))
+    registry.observe("latency_seconds", (), 0.2)
+    registry.add("in_flight", (), 1)
+
+    worker = subprocess.Popen([sys.executable, "-c", "pass"])
+    worker.wait()
+    (tmp_path / f"metrics-{worker.pid}.json").write_text(
+        json.dumps(registry.snapshot())
+    )
+
+    for _ in range(2):
+        text = registry.render()
+        assert "latency_seconds_count 2" in text, "Totals should be kept."
+        assert "in_flight 1" in text, "Gauges of exited workers are left out."
+
+    assert sorted(os.listdir(tmp_path)) == ["metrics-retired.json", "retire.lock"]
+
+    # Retiring this worker as it exits adds its totals too.
+    registry.write_snapshot()
+    registry.retire()
+    assert sorted(os.listdir(tmp_path)) == ["metrics-retired.json", "retire.lock"]
+
+    registry.configure(directory=str(tmp_path))
+    assert "latency_seconds_count 2" in registry.render()
+
+
+def test_metrics_endpoint(app, client):
+    metrics.configure()
+    assert client.get("/__lbheartbeat__").status_code == 200
+
+    response = client.get("/__metrics__")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+
+    text = response.get_data(as_text=True)
+    assert (
+        "lando_ui_request_duration_seconds_count"
+        '{endpoint="dockerflow.lbheartbeat",method="GET",status="200"} 1'
+    ) in text
+    assert "lando_ui_requests_in_flight 1" in text
+    assert 'lando_ui_cache_hit_ratio{cache="treestatus"}' in text
+    assert (
+        'lando_ui_circuit_breaker_state{service="LandoAPI",state="closed"} 1'
+    ) in text
+    assert 'lando_ui_upstream_retries_total{service="LandoAPI"} 0' in text
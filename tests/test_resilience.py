@@ -0,0 +1,114 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import time
+
+from landoui.resilience import (
+    AdaptiveTimeout,
+    CircuitBreaker,
+    CircuitState,
+    RetryPolicy,
+)
+
+
+def test_adaptive_timeout_uses_initial_until_enough_samples():
+    timeout = AdaptiveTimeout(initial=10, connect=3, min_samples=5)
+    for _ in range(4):
+        timeout.observe(0.1)
+
+    assert timeout.current() == (3, 10)
+
+
+def test_adaptive_timeout_follows_latency_percentile():
+    timeout = AdaptiveTimeout(minimum=1, maximum=30, multiplier=2, min_samples=5)
+    for latency in (0.5, 1.0, 1.5, 2.0, 4.0):
+        timeout.observe(latency)
+
+    assert timeout.current()[1] == 8.0
+
+
+def test_adaptive_timeout_is_clamped():
+    timeout = AdaptiveTimeout(minimum=2, maximum=5, min_samples=1)
+    timeout.observe(0.01)
+    assert timeout.current()[1] == 2
+
+    timeout.observe(100)
+    assert timeout.current()[1] == 5
+
+
+def test_adaptive_timeout_tracks_keys_separately():
+    timeout = AdaptiveTimeout(minimum=1, maximum=30, min_samples=2)
+    for _ in range(5):
+        timeout.observe(4.0, ("POST", "transplants"))
+    for _ in range(100):
+        timeout.observe(0.05, ("GET", "stacks/D{id}"))
+
+    assert timeout.current(("GET", "stacks/D{id}"))[1] == 1
+    assert timeout.current(("POST", "transplants"))[1] == 8.0
+
+
+def test_adaptive_timeout_bounds_keys():
+    timeout = AdaptiveTimeout(minimum=1, min_samples=1, max_keys=2)
+    timeout.observe(4.0, "a")
+    timeout.observe(4.0, "b")
+    timeout.observe(4.0, "a")
+    timeout.observe(4.0, "c")
+
+    assert timeout.latency_percentile("a") == 4.0
+    assert timeout.latency_percentile("b") is None, "b was least recently used."
+    assert timeout.latency_percentile("c") == 4.0
+
+
+def test_circuit_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow_request(), "Successes should reset the failure count."
+
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow_request()
+
+
+def test_circuit_breaker_half_open_trial():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+
+    assert breaker.allow_request(), "A trial request should be allowed."
+    assert breaker.state == CircuitState.HALF_OPEN
+
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN, "A failed trial reopens the circuit."
+
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_retry_policy_only_retries_idempotent_requests():
+    policy = RetryPolicy(attempts=3)
+
+    assert policy.delay("GET", 1) is not None
+    assert policy.delay("POST", 1) is None
+    assert policy.delay("PUT", 1) is None
+    assert policy.delay("PUT", 1, idempotent=True) is not None
+
+
+def test_retry_policy_bounds_attempts_and_backoff():
+    policy = RetryPolicy(attempts=3, backoff=1, max_backoff=1.5)
+
+    assert 0 <= policy.delay("GET", 2) <= 1.5
+    assert policy.delay("GET", 3) is None
+    assert policy.retries == 1
+
+
+def test_retry_policy_respects_status_and_deadline():
+    policy = RetryPolicy(attempts=3)
+
+    assert policy.delay("GET", 1, status_code=502) is not None
+    assert policy.delay("GET", 1, status_code=500) is None
+    assert policy.delay("GET", 1, deadline=time.monotonic()) is None
@@ -0,0 +1,84 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+
+from landoui.sentry import TracesSampler, parse_sample_rates
+
+
+def sampling_context(path: str, method: str = "GET", **kwargs) -> dict:
+    return {
+        "parent_sampled": None,
+        "wsgi_environ": {"PATH_INFO": path, "REQUEST_METHOD": method},
+        **kwargs,
+    }
+
+
+def test_parse_sample_rates():
+    assert parse_sample_rates("") == {}
+    assert parse_sample_rates("treestatus=0.5, revisions.revision=1,static=0") == {
+        "treestatus": 0.5,
+        "revisions.revision": 1.0,
+        "static": 0.0,
+    }
+
+    for invalid in ("treestatus", "=0.5", "treestatus=high", "treestatus=2"):
+        with pytest.raises(ValueError):
+            parse_sample_rates(invalid)
+
+
+def test_traces_sampler_rates(app):
+    sampler = TracesSampler()
+    sampler.configure(
+        default_rate=0.25,
+        rates={"treestatus": 0.5, "treestatus.treestatus_tree": 1.0, "static": 0.0},
+        url_map=app.url_map,
+    )
+
+    assert sampler(sampling_context("/D1/")) == 0.25
+    assert sampler(sampling_context("/treestatus/")) == 0.5
+    assert sampler(sampling_context("/treestatus/autoland/")) == 1.0
+    assert sampler(sampling_context("/static/main.css")) == 0.0
+    assert sampler(sampling_context("/no-such-page")) == 0.25
+
+
+def test_traces_sampler_drops_health_checks(app):
+    sampler = TracesSampler()
+    sampler.configure(default_rate=1.0, url_map=app.url_map)
+
+    for path in (
+        "/__heartbeat__",
+        "/__lbheartbeat__",
+        "/__metrics__",
+        "/__version__",
+    ):
+        assert sampler(sampling_context(path)) == 0.0
+
+
+def test_traces_sampler_keeps_parent_decision(app):
+    sampler = TracesSampler()
+    sampler.configure(default_rate=0.0, url_map=app.url_map)
+
+    assert sampler(sampling_context("/D1/", parent_sampled=True)) == 1.0
+    assert sampler(sampling_context("/D1/", parent_sampled=False)) == 0.0
+
+
+def test_traces_sampler_adapts_to_volume():
+    now = [0.0]
+    sampler = TracesSampler(clock=lambda: now[0])
+    sampler.configure(default_rate=1.0, target_per_second=5.0, window=10.0)
+
+    # 100 requests per second for one window.
+    for _ in range(1100):
+        now[0] += 0.01
+        rate = sampler(sampling_context("/"))
+
+    assert sampler.requests_per_second == pytest.approx(100.0)
+    assert rate == pytest.approx(0.05)
+
+    # Traffic drops to 2 requests per second, below the target.
+    for _ in range(60):
+        now[0] += 0.5
+        rate = sampler(sampling_context("/"))
+
+    assert rate == 1.0
@@ -1,15 +1,69 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import random
+
 import pytest
 
 from landoui.stacks import (
     draw_stack_graph,
     Edge,
+    graph,
     sort_stack_topological,
 )
 
 
+def test_graph_adjacency():
+    nodes = ["PHID-DREV-0", "PHID-DREV-1", "PHID-DREV-2", "PHID-DREV-3"]
+    edges = [
+        ["PHID-DREV-1", "PHID-DREV-0"],
+        ["PHID-DREV-2", "PHID-DREV-0"],
+        ["PHID-DREV-2", "PHID-DREV-3"],
+        ["PHID-DREV-2", "PHID-DREV-3"],
+    ]
+
+    g = graph(nodes, edges)
+    assert len(g) == 4
+    assert g.ids == tuple(nodes)
+    assert g.index == {node: i for i, node in enumerate(nodes)}
+    assert [list(g.children(i)) for i in range(4)] == [[1, 2], [], [], [2]]
+    assert [list(g.parents(i)) for i in range(4)] == [[], [0], [0, 3], []]
+
+
+def test_graph_equality():
+    nodes = ["PHID-DREV-0", "PHID-DREV-1"]
+    edges = {Edge(child="PHID-DREV-1", parent="PHID-DREV-0")}
+
+    assert graph(nodes, edges) == graph(nodes, [["PHID-DREV-1", "PHID-DREV-0"]])
+    assert hash(graph(nodes, edges)) == hash(graph(nodes, edges))
+    assert graph(nodes, edges) != graph(nodes, set())
+
+
+def test_stack_graph_is_reused():
+    nodes = set("PHID-DREV-{}".format(i) for i in range(4))
+    edges = {
+        Edge(child="PHID-DREV-{}".format(i), parent="PHID-DREV-{}".format(i - 1))
+        for i in range(1, 4)
+    }
+    g = graph(nodes, edges)
+
+    order = sort_stack_topological(g)
+    assert order == sort_stack_topological(nodes, edges)
+    assert draw_stack_graph(g, order=order) == draw_stack_graph(nodes, edges, order)
+
+
+def test_draw_stack_graph_returns_copies_of_cached_layout():
+    nodes = {"PHID-DREV-0", "PHID-DREV-1"}
+    edges = {Edge(child="PHID-DREV-1", parent="PHID-DREV-0")}
+    order = sort_stack_topological(nodes, edges)
+
+    _, rows = draw_stack_graph(nodes, edges, order)
+    expected = [dict(row, above=list(row["above"])) for row in rows]
+    rows[0]["above"].append(99)
+
+    assert draw_stack_graph(nodes, edges, order)[1] == expected
+
+
 def test_sort_stack_topological_single_node():
     order = sort_stack_topological({"PHID-DREV-0"}, set())
     assert len(order) == 1
@@ -76,6 +130,78 @@ def test_sort_stack_topological_complex():
     ]
 
 
+def sort_stack_topological_reference(nodes, edges, *, key=lambda x: x):
+    """The original quadratic sort, used to check the current implementation."""
+    parents = {node: set() for node in nodes}
+    children = {node: set() for node in nodes}
+    for e in edges:
+        parents[e.child].add(e.parent)
+        children[e.parent].add(e.child)
+
+    sources = {node for node in nodes if not parents[node]}
+    order = []
+
+    while sources:
+        node = min(sources, key=key)
+        sources.remove(node)
+        order.append(node)
+
+        for child in children[node]:
+            parents[child].remove(node)
+            if not parents[child]:
+                sources.add(child)
+
+    if len(order) != len(nodes):
+        raise ValueError("Provided graph has a cycle.")
+
+    return order
+
+
+def test_sort_stack_topological_matches_reference_order():
+    rng = random.Random(4321)
+    for _ in range(200):
+        size = rng.randint(1, 40)
+        nodes, edges = random_stack(rng, size)
+
+        # Relabel the nodes so the edges don't always point to larger nodes.
+        labels = rng.sample(range(size * 10), size)
+        nodes = {labels[node] for node in nodes}
+        edges = {Edge(child=labels[e.child], parent=labels[e.parent]) for e in edges}
+
+        priority = {node: rng.random() for node in nodes}
+        for key in (lambda x: x, lambda x: -x, priority.__getitem__):
+            assert sort_stack_topological(
+                nodes, edges, key=key
+            ) == sort_stack_topological_reference(nodes, edges, key=key)
+
+
+def test_sort_stack_topological_evaluates_key_once_per_node():
+    nodes = set(range(100))
+    edges = {Edge(child=i, parent=0) for i in range(1, 100)}
+    calls = []
+
+    def key(node):
+        calls.append(node)
+        return node
+
+    sort_stack_topological(nodes, edges, key=key)
+    assert sorted(calls) == list(range(100))
+
+
+def test_sort_stack_topological_random_cycles():
+    rng = random.Random(2468)
+    for _ in range(50):
+        nodes, edges = random_stack(rng, rng.randint(2, 30))
+        # Reversing any edge in the stack creates a cycle.
+        e = rng.choice(sorted(edges))
+        edges.add(Edge(child=e.parent, parent=e.child))
+
+        with pytest.raises(ValueError):
+            sort_stack_topological_reference(nodes, edges)
+        with pytest.raises(ValueError):
+            sort_stack_topological(nodes, edges)
+
+
 def test_draw_stack_graph_complex():
     nodes = set("PHID-DREV-{}".format(i) for i in range(10))
     edges = {
@@ -106,3 +232,87 @@ def test_draw_stack_graph_complex():
         {"above": [0], "below": [0], "node": "PHID-DREV-9", "other": [], "pos": 0},
         {"above": [], "below": [0], "node": "PHID-DREV-8", "other": [], "pos": 0},
     ]
+
+
+def draw_stack_graph_reference(nodes, edges, order):
+    """The original quadratic layout, used to check the current implementation.
+
+    Children other than the closest are placed in order, rather than in set
+    iteration order, so that the layout is deterministic.
+    """
+    children = {node: set() for node in nodes}
+    for e in edges:
+        children[e.parent].add(e.child)
+
+    next_node = []
+    rows = []
+
+    def empty_column_or_new():
+        if None not in next_node:
+            next_node.append(None)
+            return len(next_node) - 1
+        return next_node.index(None)
+
+    for node in order:
+        col = next_node.index(node) if node in next_node else empty_column_or_new()
+
+        below = set()
+        for from_col, target in enumerate(next_node):
+            if target == node:
+                below.add(from_col)
+                next_node[from_col] = None
+
+        other = {i for i, target in enumerate(next_node) if target is not None}
+
+        above = set()
+        if children[node]:
+            ordered = sorted(children[node], key=order.index)
+            next_node[col] = ordered[0]
+            above.add(col)
+            for child in ordered[1:]:
+                position = empty_column_or_new()
+                next_node[position] = child
+                above.add(position)
+
+        rows.append(
+            {
+                "node": node,
+                "pos": col,
+                "above": sorted(above),
+                "below": sorted(below),
+                "other": sorted(other),
+            }
+        )
+
+    return len(next_node), rows
+
+
+def random_stack(rng, size, max_parents=3):
+    nodes = set(range(size))
+    edges = set()
+    for child in range(1, size):
+        for parent in rng.sample(range(child), min(child, rng.randint(1, max_parents))):
+            edges.add(Edge(child=child, parent=parent))
+    return nodes, edges
+
+
+def test_draw_stack_graph_matches_reference_layout():
+    rng = random.Random(1234)
+    for _ in range(200):
+        nodes, edges = random_stack(rng, rng.randint(1, 30))
+        order = sort_stack_topological(nodes, edges, key=lambda x: -x)
+
+        assert draw_stack_graph(nodes, edges, order) == draw_stack_graph_reference(
+            nodes, edges, order
+        )
+
+
+def test_draw_stack_graph_returns_copies_of_cached_rows():
+    nodes = {"PHID-DREV-0", "PHID-DREV-1"}
+    edges = {Edge(child="PHID-DREV-1", parent="PHID-DREV-0")}
+    order = ["PHID-DREV-0", "PHID-DREV-1"]
+
+    _, rows = draw_stack_graph(nodes, edges, order)
+    rows[0]["pos"] = 100
+
+    assert draw_stack_graph(nodes, edges, order)[1][0]["pos"] == 0
@@ -1,20 +1,35 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import datetime
+import random
+import re
 import urllib.parse
+import xml.etree.ElementTree as ET
 
 import pytest
 
+from flask import current_app, render_template
 from landoui.template_helpers import (
     avatar_url,
+    linkify,
     linkify_bug_numbers,
     linkify_revision_ids,
     linkify_revision_urls,
     linkify_faq,
     linkify_sec_bug_docs,
+    FAQ_URL,
+    SEC_BUG_DOCS,
     repo_path,
+    reviewer_to_action_text,
+    reviewer_to_status_badge_class,
+    revision_status_to_badge_class,
     calculate_duration,
+    calculate_durations,
+    graph_drawing,
     revision_url,
+    tostatusbadgeclass,
+    tostatusbadgename,
 )
 
 
@@ -225,6 +240,61 @@ def test_calculate_duration(app, start, end, duration):
     assert duration == calculate_duration(start, end)
 
 
+def test_calculate_duration_without_end(app):
+    start = (
+        datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=5)
+    ).isoformat()
+    assert calculate_duration(start)["minutes"] == 5
+
+
+def test_calculate_duration_utc_designator(app):
+    assert calculate_duration(
+        "2019-10-08T06:42:12.000000Z", "2019-10-08T06:43:14.000000+00:00"
+    ) == {"minutes": 1, "seconds": 2}
+
+
+@pytest.mark.parametrize(
+    "fraction", ["5", "55", "5555", "55555", "5555555"], ids=lambda f: len(f)
+)
+def test_calculate_duration_fractional_seconds(app, fraction):
+    assert calculate_duration(
+        f"2019-10-08T06:42:12.{fraction}+00:00", "2019-10-08T06:43:14Z"
+    ) == {"minutes": 1, "seconds": 1}
+
+
+def test_calculate_durations(app):
+    transplants = [
+        {
+            "created_at": "2019-10-08T06:42:12.000000+00:00",
+            "updated_at": "2019-10-08T06:58:32.000000+00:00",
+        },
+        {
+            "created_at": "2019-10-10T12:42:34.012340+00:00",
+            "updated_at": "2019-10-10T12:42:41.045670+00:00",
+        },
+    ]
+    assert calculate_durations(transplants) == [
+        {"minutes": 16, "seconds": 20},
+        {"minutes": 0, "seconds": 7},
+    ]
+
+
+def test_timeline_shows_transplant_durations(app):
+    transplant = {
+        "id": 1,
+        "status": "LANDED",
+        "created_at": "2019-10-08T06:42:12.000000+00:00",
+        "updated_at": "2019-10-08T06:58:32.000000+00:00",
+        "requester_email": "user@example.com",
+        "landing_path": [],
+        "details": "",
+        "tree": "mozilla-central",
+        "repository_url": "https://hg.mozilla.org/mozilla-central",
+    }
+    html = render_template("stack/partials/timeline.html", transplants=[transplant])
+    assert "<strong>Duration:</strong> 16m 20s" in html
+
+
 def test_revision_url__integer(app):
     revision_id = 1234
     expected_result = "http://phabricator.test/D1234"
@@ -252,3 +322,146 @@ def test_revision_url__general_case_with_diff(app):
     expected_result = "http://phabricator.test/D123?id=456"
     actual_result = revision_url(revision_id, diff_id)
     assert expected_result == actual_result
+
+
+GRAPH_DRAWING_TEMPLATE = """
+<svg class="GraphDrawing"
+  width="{{ drawing_width|graph_width }}"
+  height="{{graph_height()}}"
+  version="1.1"
+  xmlns="http://www.w3.org/2000/svg"
+>
+  {% for target in drawing['above'] %}
+    <path d="{{drawing['pos']|graph_above_path(target)}}" fill="none" stroke="{{target|graph_color}}" stroke-width="1"/>
+  {% endfor %}
+  {% for target in drawing['below'] %}
+      <path d="{{drawing['pos']|graph_below_path(target)}}" fill="none" stroke="{{target|graph_color}}" stroke-width="1"/>
+  {% endfor %}
+  {% for target in drawing['other'] %}
+    <line x1="{{target|graph_x_pos}}" x2="{{target|graph_x_pos}}" y1="0" y2="{{graph_height()}}" stroke="{{target|graph_color}}" stroke-width="1"/>
+  {% endfor %}
+  <circle
+    cx="{{drawing['pos']|graph_x_pos}}"
+    stroke="{{drawing['pos']|graph_color}}"
+    fill="{{drawing['pos']|graph_color}}"
+    cy="{{graph_height() / 2}}"
+    r="3"
+  />
+</svg>
+"""  # noqa: E501
+
+
+def svg_elements(svg):
+    return [(element.tag, element.attrib) for element in ET.fromstring(svg).iter()]
+
+
+@pytest.mark.parametrize(
+    "drawing",
+    [
+        {"above": [0, 1], "below": [], "node": "PHID-DREV-0", "other": [], "pos": 0},
+        {"above": [2], "below": [], "node": "PHID-DREV-3", "other": [0, 1], "pos": 2},
+        {"above": [1], "below": [1, 2], "node": "PHID-DREV-2", "other": [0], "pos": 1},
+        {"above": [], "below": [0], "node": "PHID-DREV-8", "other": [], "pos": 0},
+    ],
+)
+def test_graph_drawing_matches_template(app, drawing):
+    template = app.jinja_env.from_string(GRAPH_DRAWING_TEMPLATE)
+    expected = template.render(drawing_width=3, drawing=drawing)
+
+    assert svg_elements(graph_drawing(3, drawing)) == svg_elements(expected)
+
+
+@pytest.mark.parametrize(
+    "status,for_other_diff,badge_class,action_text",
+    [
+        ("accepted", False, "Badge Badge--positive", "accepted"),
+        ("accepted", True, "Badge Badge--neutral", "accepted a prior diff"),
+        ("rejected", False, "Badge Badge--negative", "requested changes"),
+        (
+            "rejected",
+            True,
+            "Badge Badge--warning",
+            "requested changes to a prior diff",
+        ),
+        ("blocking", False, "Badge", "must review"),
+        ("unknown", False, "Badge Badge--warning", "UNKNOWN STATE"),
+    ],
+)
+def test_reviewer_filters(status, for_other_diff, badge_class, action_text):
+    reviewer = {"status": status, "for_other_diff": for_other_diff}
+    assert reviewer_to_status_badge_class(reviewer) == badge_class
+    assert reviewer_to_action_text(reviewer) == action_text
+
+
+@pytest.mark.parametrize(
+    "status,badge_class,badge_name",
+    [
+        ("LANDED", "Badge Badge--positive", "Successfully landed"),
+        ("submitted", "Badge Badge--warning", "Landing queued"),
+        ("unknown", "Badge Badge--negative", "Unknown"),
+    ],
+)
+def test_transplant_status_filters(status, badge_class, badge_name):
+    assert tostatusbadgeclass({"status": status}) == badge_class
+    assert tostatusbadgename({"status": status}) == badge_name
+
+
+def test_revision_status_to_badge_class():
+    assert revision_status_to_badge_class("accepted") == "Badge Badge--positive"
+    assert revision_status_to_badge_class("unknown") == "Badge Badge--warning"
+
+
+def linkify_reference(text):
+    """The original chain of linkify filters, used to check `linkify`."""
+    bmo_url = current_app.config["BUGZILLA_URL"]
+    phab_url = current_app.config["PHABRICATOR_URL"]
+    substitutions = [
+        (
+            r"(?=\b)(Bug (\d+))(?=\b)",
+            r'<a href="{}/show_bug.cgi?id=\g<2>">\g<1></a>'.format(bmo_url),
+        ),
+        (
+            r"(?=\b)(" + re.escape(phab_url) + r"/D\d+)(?=\b)",
+            r'<a href="\g<1>">\g<1></a>',
+        ),
+        (r"\b(FAQ)\b", r'<a href="{}">\g<1></a>'.format(FAQ_URL)),
+        (
+            r"\b(Security Bug Approval Process)\b",
+            r'<a href="{}">\g<1></a>'.format(SEC_BUG_DOCS),
+        ),
+    ]
+    for search, replace in substitutions:
+        text = re.sub(search, replace, text, flags=re.IGNORECASE)
+    return text
+
+
+def test_linkify_matches_chained_filters(app):
+    rng = random.Random(1357)
+    tokens = [
+        "Bug 123",
+        "bug 4567",
+        "Bug",
+        "Bug x",
+        "D12",
+        "FAQ",
+        "faqs",
+        "Security Bug Approval Process",
+        "{}/D1234".format(app.config["PHABRICATOR_URL"]),
+        "{}/D".format(app.config["PHABRICATOR_URL"]),
+        "the",
+        "-",
+        ".",
+        " ",
+        "\n",
+        "&lt;",
+    ]
+    for _ in range(500):
+        text = "".join(rng.choice(tokens) for _ in range(rng.randint(0, 20)))
+        assert linkify(text) == linkify_reference(text)
+
+
+def test_linkify_kinds(app):
+    text = "Bug 1 and {}/D2, see the FAQ".format(app.config["PHABRICATOR_URL"])
+    assert linkify(text, "bug", "revision_url") == linkify_revision_urls(
+        linkify_bug_numbers(text)
+    )
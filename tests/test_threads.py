@@ -0,0 +1,31 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import threading
+
+from landoui.threads import BackgroundThread
+
+
+def test_background_thread_runs_until_stopped():
+    iterations = []
+    running = threading.Event()
+
+    def run():
+        running.set()
+        while thread.sleep(60):
+            iterations.append(True)
+
+    thread = BackgroundThread(run, "test")
+    assert thread.current() is None
+
+    assert thread.ensure_started()
+    assert not thread.ensure_started(), "Only one thread runs per process."
+    assert running.wait(5)
+
+    started = thread.current()
+    thread.stop()
+    started.join(timeout=5)
+
+    assert not started.is_alive(), "Stopping should wake the thread."
+    assert iterations == []
+    assert thread.current() is None
@@ -0,0 +1,37 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from landoui.timing import RequestTimeline
+
+
+def test_request_timeline_totals():
+    now = [0.0]
+    timeline = RequestTimeline(clock=lambda: now[0])
+
+    with timeline.span("landoapi", "GET stacks/D1"):
+        now[0] += 0.1
+    with timeline.span("landoapi", "GET transplants"):
+        now[0] += 0.05
+    with timeline.span("render", "stack/stack.html"):
+        now[0] += 0.02
+
+    assert timeline.totals() == {
+        "landoapi": {"count": 2, "ms": 150.0},
+        "render": {"count": 1, "ms": 20.0},
+    }
+    assert timeline.server_timing() == (
+        'landoapi;dur=150.0;desc="2", render;dur=20.0;desc="1"'
+    )
+    assert [span["start_ms"] for span in timeline.describe()] == [0.0, 100.0, 150.0]
+
+
+def test_request_timeline_records_failed_spans():
+    timeline = RequestTimeline()
+
+    try:
+        with timeline.span("treestatus"):
+            raise ValueError
+    except ValueError:
+        pass
+
+    assert timeline.totals()["treestatus"]["count"] == 1
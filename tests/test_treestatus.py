@@ -2,16 +2,27 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+from unittest.mock import Mock, patch
+
 import pytest
 
 from wtforms.validators import ValidationError
 from landoui.forms import (
+    TreeStatusLogUpdateForm,
     TreeStatusRecentChangesForm,
     TreeStatusUpdateTreesForm,
 )
+from landoui.cache import treestatus_cache
+from landoui.landoapi import TreestatusAPI
 from landoui.treestatus import (
     build_recent_changes_stack,
     build_update_json_body,
+    TreesSnapshot,
+    get_log_page,
+    get_recent_changes_stack,
+    get_trees,
+    invalidate_trees,
+    plan_trees_update,
 )
 
 
@@ -42,17 +53,17 @@ def test_build_recent_changes_stack(app):
 
     recent_changes_stack = build_recent_changes_stack(recent_changes_data)
 
-    for form, data in recent_changes_stack:
-        assert form.id.data == data["id"]
-        assert form.reason.data == data["reason"]
+    for recent_change, data in zip(recent_changes_stack, recent_changes_data):
+        assert recent_change.change is data
+        assert recent_change.reason == data["reason"]
 
-        if form.id.data == 3:
+        if data["id"] == 3:
             assert (
-                form.reason_category.data == ""
+                recent_change.reason_category == ""
             ), "Empty tags should set field to an empty string."
         else:
             assert (
-                form.reason_category.data
+                recent_change.reason_category
                 == data["trees"][0]["last_state"]["current_tags"][0]
             )
 
@@ -231,3 +242,326 @@ def test_recent_changes_action(app):
         "params" in action.request_args
     ), "Discards should send content in query string."
     assert action.message == "Status change discarded."
+
+
+def test_get_trees_is_cached_until_invalidated(app):
+    trees = {
+        "try": {"tree": "try", "category": "other"},
+        "mozilla-central": {"tree": "mozilla-central", "category": "development"},
+    }
+    api = Mock(url="http://treestatus.test/")
+    api.request.return_value = {"result": trees}
+    treestatus_cache.invalidate()
+
+    snapshot = get_trees(api)
+    assert snapshot.trees == trees
+    assert [tree["tree"] for tree in snapshot.ordered] == ["mozilla-central", "try"]
+
+    assert get_trees(api) is snapshot
+    assert api.request.call_count == 1
+
+    invalidate_trees(api)
+    assert get_trees(api) is not snapshot
+    assert api.request.call_count == 2
+
+
+def test_get_trees_skips_cache_after_write(app):
+    trees = {"try": {"tree": "try", "category": "other"}}
+    api = Mock(url="http://treestatus.test/")
+    api.request.return_value = {"result": trees}
+    treestatus_cache.invalidate()
+
+    invalidate_trees(api)
+
+    # Another worker's cache still holds a snapshot from before the write.
+    treestatus_cache.set(
+        (api.url, "trees"),
+        TreesSnapshot(trees={}, ordered=()),
+    )
+    treestatus_cache.set((api.url, "stack"), [])
+
+    assert get_trees(api).trees == trees
+    assert get_trees(api).trees == trees
+    assert api.request.call_count == 1, "Only the first read skips the cache."
+
+    api.request.return_value = {"result": [{"id": 1}]}
+    assert get_recent_changes_stack(api) == [{"id": 1}]
+    assert api.request.call_count == 2
+
+
+def tree_logs(count):
+    return [
+        {
+            "id": count - i,
+            "tree": "autoland",
+            "when": "2023-01-01T00:00:00",
+            "who": "sheriff",
+            "status": "closed" if i % 2 else "open",
+            "reason": f"reason {i}",
+            "tags": [],
+        }
+        for i in range(count)
+    ]
+
+
+def treestatus_api_double(logs):
+    def request(api, method, operation, *args, **kwargs):
+        if operation == "trees/autoland/logs":
+            return {"result": logs}
+        elif operation == "stack":
+            return {"result": []}
+        raise RuntimeError(f"No canned response for {operation}")
+
+    return request
+
+
+def test_get_log_page(app):
+    app.config["TREESTATUS_LOG_PAGE_SIZE"] = 10
+    logs = tree_logs(25)
+
+    first = get_log_page(logs, 1)
+    assert first.logs == logs[:10]
+    assert first.has_next
+
+    last = get_log_page(logs, 3)
+    assert last.logs == logs[20:]
+    assert not last.has_next
+
+    assert get_log_page(logs, 0).page == 1
+
+
+def test_treestatus_tree_only_builds_forms_for_page(app, client):
+    app.config["TREESTATUS_LOG_PAGE_SIZE"] = 10
+    logs = tree_logs(25)
+
+    with patch(
+        "landoui.landoapi.TreestatusAPI.request", new=treestatus_api_double(logs)
+    ), patch(
+        "landoui.treestatus.TreeStatusLogUpdateForm", wraps=TreeStatusLogUpdateForm
+    ) as form:
+        response = client.get("/treestatus/autoland/?page=2")
+
+    assert response.status_code == 200
+    assert form.call_count == 10
+    assert b"reason 10" in response.data
+    assert b"reason 9<" not in response.data
+    assert b"page=1" in response.data
+    assert b"page=3" in response.data
+
+
+def test_treestatus_tree_logs_json(app, client):
+    app.config["TREESTATUS_LOG_PAGE_SIZE"] = 10
+    logs = tree_logs(25)
+
+    with patch(
+        "landoui.landoapi.TreestatusAPI.request", new=treestatus_api_double(logs)
+    ):
+        first = client.get("/treestatus/autoland/logs").json
+        last = client.get("/treestatus/autoland/logs?page=3").json
+
+    assert first["result"] == logs[:10]
+    assert first["next"] == "/treestatus/autoland/logs?page=2"
+    assert last["result"] == logs[20:]
+    assert last["next"] is None
+
+
+RECENT_CHANGES = [
+    {
+        "id": i,
+        "reason": f"reason {i}",
+        "trees": [
+            {
+                "tree": "autoland",
+                "last_state": {
+                    "status": "open",
+                    "current_status": "closed",
+                    "current_tags": ["checkin_test"],
+                },
+            }
+        ],
+        "who": "sheriff",
+        "when": "2023-01-01T00:00:00",
+    }
+    for i in range(3)
+]
+
+
+def test_recent_changes_not_fetched_for_other_users(app, client):
+    with patch("landoui.landoapi.TreestatusAPI.request") as request, patch(
+        "landoui.treestatus.is_treestatus_user", return_value=False
+    ):
+        response = client.get("/treestatus/recent_changes/")
+
+    assert response.status_code == 200
+    assert b"Recent changes" not in response.data
+    request.assert_not_called()
+
+
+def test_recent_changes_share_a_single_form(app, client):
+    with patch(
+        "landoui.landoapi.TreestatusAPI.request",
+        return_value={"result": RECENT_CHANGES},
+    ), patch("landoui.treestatus.is_treestatus_user", return_value=True), patch(
+        "landoui.treestatus.TreeStatusRecentChangesForm",
+        wraps=TreeStatusRecentChangesForm,
+    ) as form:
+        response = client.get("/treestatus/recent_changes/")
+
+    assert response.status_code == 200
+    assert form.call_count == 1
+    assert "private" in response.headers["Cache-Control"]
+    for change in RECENT_CHANGES:
+        assert f'value="{change["reason"]}"'.encode() in response.data
+    assert response.data.count(b'selected value="checkin_test"') == 3
+
+
+def trees_data():
+    return {
+        name: {
+            "tree": name,
+            "category": "development",
+            "status": status,
+            "reason": reason,
+            "message_of_the_day": "",
+            "tags": tags,
+        }
+        for name, status, reason, tags in (
+            ("autoland", "closed", "bustage", ["checkin_test"]),
+            ("mozilla-central", "open", "", []),
+            ("try", "open", "", []),
+        )
+    }
+
+
+def test_plan_trees_update(app):
+    snapshot = get_trees(
+        Mock(
+            url="http://plan.test/",
+            **{"request.return_value": {"result": trees_data()}},
+        )
+    )
+    update = plan_trees_update(
+        snapshot,
+        {
+            "trees": ["autoland", "mozilla-central", "unknown"],
+            "status": "open",
+            "reason": "",
+            "message_of_the_day": "",
+            "tags": [],
+            "remember": True,
+        },
+    )
+
+    assert update.changed == ["autoland", "unknown"]
+    assert update.unchanged == ["mozilla-central"]
+    assert update.to_request_json() == {
+        "trees": ["autoland", "unknown"],
+        "status": "open",
+        "reason": "",
+        "message_of_the_day": "",
+        "tags": [],
+        "remember": True,
+    }
+
+
+def treestatus_trees_double(trees, patches):
+    def request(api, method, operation, *args, **kwargs):
+        if method == "GET" and operation == "trees":
+            return {"result": trees}
+        elif method == "PATCH" and operation == "trees":
+            patches.append(kwargs["json"])
+            return {"result": None}
+        raise RuntimeError(f"No canned response for {method} {operation}")
+
+    return request
+
+
+UPDATE_TREES_FORM = {
+    "trees-0": "autoland",
+    "trees-1": "mozilla-central",
+    "trees-2": "try",
+    "status": "closed",
+    "reason": "bustage",
+    "reason_category": "checkin_test",
+    "message_of_the_day": "",
+    "remember": "y",
+}
+
+
+def test_update_trees_only_sends_changed_trees(app, client):
+    app.config["WTF_CSRF_ENABLED"] = False
+    treestatus_cache.invalidate()
+    patches = []
+
+    with patch(
+        "landoui.landoapi.TreestatusAPI.request",
+        new=treestatus_trees_double(trees_data(), patches),
+    ), patch("landoui.treestatus.is_user_authenticated", return_value=True):
+        response = client.post(
+            "/treestatus/",
+            data=UPDATE_TREES_FORM,
+            headers={"Accept": "application/json"},
+        )
+
+    assert response.status_code == 200
+    assert [body["trees"] for body in patches] == [["mozilla-central", "try"]]
+
+    result = response.json["result"]
+    assert result["autoland"]["result"] == "unchanged"
+    assert result["mozilla-central"]["result"] == "updated"
+    assert result["try"]["tree"]["status"] == "closed"
+    assert result["try"]["tree"]["tags"] == ["checkin_test"]
+
+    # This worker's cached trees are updated without fetching them again.
+    fetch = Mock()
+    snapshot = treestatus_cache.get(
+        (TreestatusAPI.from_environment().url, "trees"), fetch
+    )
+    fetch.assert_not_called()
+    assert snapshot.trees["mozilla-central"]["status"] == "closed"
+
+
+def test_update_trees_invalidates_cached_trees_not_refreshed(app, client):
+    app.config["WTF_CSRF_ENABLED"] = False
+    treestatus_cache.invalidate()
+    trees = trees_data()
+    trees["autoland"].update(status="open", reason="", tags=[])
+    patches = []
+
+    with patch(
+        "landoui.landoapi.TreestatusAPI.request",
+        new=treestatus_trees_double(trees, patches),
+    ), patch("landoui.treestatus.is_user_authenticated", return_value=True):
+        response = client.post(
+            "/treestatus/",
+            data=UPDATE_TREES_FORM,
+            headers={"Accept": "application/json"},
+        )
+
+    assert response.status_code == 200
+    assert [body["trees"] for body in patches] == [
+        ["autoland", "mozilla-central", "try"]
+    ]
+
+    # The possibly old snapshot is not given a new lease of life.
+    fetch = Mock(return_value="fetched")
+    key = (TreestatusAPI.from_environment().url, "trees")
+    assert treestatus_cache.get(key, fetch) == "fetched"
+
+
+def test_update_trees_skips_request_when_nothing_changes(app, client):
+    app.config["WTF_CSRF_ENABLED"] = False
+    treestatus_cache.invalidate()
+    trees = trees_data()
+    for tree in trees.values():
+        tree.update(status="closed", reason="bustage", tags=["checkin_test"])
+    patches = []
+
+    with patch(
+        "landoui.landoapi.TreestatusAPI.request",
+        new=treestatus_trees_double(trees, patches),
+    ), patch("landoui.treestatus.is_user_authenticated", return_value=True):
+        response = client.post("/treestatus/", data=UPDATE_TREES_FORM)
+
+    assert response.status_code == 302
+    assert patches == []